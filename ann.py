@@ -0,0 +1,170 @@
+'''
+Approximate nearest neighbours of films among books.
+
+The index is an inverted file over TF-IDF vectors: books are clustered by
+spherical k-means, every centroid keeps its terms words with the largest
+weights and every cluster keeps the list of its books. A film is compared
+exactly with the books of the probes clusters whose centroids are the most
+similar to it only, so the work per film is about probes / clusters of the
+catalogue. More probes give a better recall for a longer search.
+'''
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from recommandation_engine_2023 import computations
+from recommandation_engine_2023 import normalization
+
+TERMS = 256
+ITERATIONS = 10
+PROBES = 8
+CHUNK_SIZE = 4096
+
+def truncate_rows(matrix, terms):
+    '''
+    Returns a CSR matrix keeping the terms largest values of every row,
+with rows L2-normalized.
+
+    >>> import numpy as np
+    >>> truncate_rows(np.array([[3.0, 1.0, 4.0]]), 2).toarray()
+    array([[0.6, 0. , 0.8]])
+    '''
+    matrix = sparse.csr_matrix(matrix, dtype = np.float64)
+    keep = np.ones(matrix.nnz, dtype = bool)
+    for row in range(matrix.shape[0]):
+        start, stop = matrix.indptr[row], matrix.indptr[row + 1]
+        if stop - start > terms:
+            smallest = np.argpartition(-matrix.data[start:stop], terms - 1)[terms:]
+            keep[start + smallest] = False
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    truncated = sparse.csr_matrix((matrix.data[keep], (rows[keep], matrix.indices[keep])),
+                                  shape = matrix.shape)
+    return normalization.normalize_rows(truncated)[0]
+
+def _similarities(vectors, centroids):
+    '''
+    Yields (start, dense block) of similarities between chunks of rows
+and the centroids.
+    '''
+    transposed = centroids.T.tocsc()
+    for start in range(0, vectors.shape[0], CHUNK_SIZE):
+        yield start, (vectors[start:start + CHUNK_SIZE] @ transposed).toarray()
+
+def build_index(matrix, clusters = None, terms = TERMS, iterations = ITERATIONS, seed = 0):
+    '''
+    Returns an index of the rows (books) of a TF-IDF matrix with about
+sqrt(books) clusters by default.
+
+    >>> import numpy as np
+    >>> index = build_index(np.eye(4), clusters = 2)
+    >>> index['offsets'][-1], index['centroids'].shape
+    (4, (2, 4))
+    '''
+    vectors, empty = normalization.normalize_rows(matrix)
+    books = np.flatnonzero(~empty)
+    clusters = max(1, min(clusters or int(np.sqrt(len(books))), len(books)))
+    generator = np.random.default_rng(seed)
+    centroids = vectors[generator.choice(books, clusters, replace = False)] if len(books) \
+                    else sparse.csr_matrix((1, vectors.shape[1]))
+
+    labels = np.zeros(len(books), dtype = np.int64)
+    for _ in range(iterations):
+        labels = np.concatenate([block.argmax(axis = 1) for _, block
+                                 in _similarities(vectors[books], centroids)] or [labels])
+        sums = sparse.csr_matrix((np.ones(len(books)), (labels, books)),
+                                 shape = (centroids.shape[0], vectors.shape[0])) @ vectors
+        #Empty clusters keep their centroid.
+        lonely = np.bincount(labels, minlength = centroids.shape[0]) == 0
+        centroids = truncate_rows(sums + sparse.diags(lonely.astype(np.float64)) @ centroids,
+                                  terms)
+
+    order = np.argsort(labels, kind = 'stable')
+    return {'centroids':centroids, 'books':books[order], 'vectors':vectors,
+            'offsets':np.searchsorted(labels[order], np.arange(centroids.shape[0] + 1))}
+
+def search(index, matrix, k = computations.TOP_K, probes = PROBES):
+    '''
+    Returns k x films arrays of the best scores and books of every row
+(film) of a TF-IDF matrix, -inf for missing places. Equal scores keep
+the lower book like the exact search. Films are searched cluster by
+cluster, so every block of books is compared with all films probing it.
+
+    >>> import numpy as np
+    >>> index = build_index(np.array([[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]]), clusters = 1)
+    >>> search(index, np.array([[1.0, 0.1]]), k = 2)[1]
+    array([[0],
+           [2]])
+    '''
+    vectors, empty = normalization.normalize_rows(matrix)
+    books_vectors = index['vectors']
+    width = max(vectors.shape[1], books_vectors.shape[1])
+    vectors.resize((vectors.shape[0], width))
+    books_vectors = books_vectors.copy()
+    books_vectors.resize((books_vectors.shape[0], width))
+    centroids = index['centroids'].copy()
+    centroids.resize((centroids.shape[0], width))
+
+    probes = min(probes, centroids.shape[0])
+    nearest = np.zeros((vectors.shape[0], probes), dtype = np.int64)
+    for start, block in _similarities(vectors, centroids):
+        nearest[start:start + len(block)] = np.argpartition(-block, probes - 1,
+                                                            axis = 1)[:, :probes]
+    nearest[empty] = -1
+
+    scores = np.full((k, vectors.shape[0]), -np.inf)
+    books = np.zeros((k, vectors.shape[0]), dtype = np.int64)
+    transposed = vectors.T.tocsc()
+    offsets = index['offsets']
+    for cluster in range(centroids.shape[0]):
+        films = np.flatnonzero((nearest == cluster).any(axis = 1))
+        members = index['books'][offsets[cluster]:offsets[cluster + 1]]
+        if not len(films) or not len(members):
+            continue
+        block = (books_vectors[members] @ transposed[:, films]).toarray()
+        block_scores = np.vstack((scores[:, films], block))
+        block_books = np.vstack((books[:, films],
+                                 np.repeat(members[:, None], len(films), axis = 1)))
+        order = np.lexsort((block_books, -block_scores), axis = 0)[:k]
+        scores[:, films] = np.take_along_axis(block_scores, order, axis = 0)
+        books[:, films] = np.take_along_axis(block_books, order, axis = 0)
+    return scores, books
+
+def top_k_neighbours(matrix1, matrix2, titles, films, k = computations.TOP_K,
+                     probes = PROBES, index = None):
+    '''
+    Returns a neighbour index like parallel.top_k_neighbours with books
+found by an index of matrix1. A repeated film title keeps its last row.
+
+    >>> import numpy as np
+    >>> import pandas as pd
+    >>> top_k_neighbours(np.array([[1.0, 0.0], [1.0, 1.0]]), np.array([[0.0, 1.0]]),\
+                         pd.Series(['Sand', 'Sea']), ['Jaws'], k = 1)
+       film  book title     score
+    0  Jaws     1   Sea  0.707107
+    '''
+    index = build_index(matrix1) if index is None else index
+    columns = {title:position for position, title in enumerate(films)}
+    positions = np.array(list(columns.values()), dtype = np.int64)
+    if not len(positions):
+        return pd.DataFrame(columns = ['film', 'book', 'title', 'score'])
+    scores, books = search(index, sparse.csr_matrix(matrix2)[positions], k, probes)
+    return computations.neighbours_frame(scores, books, list(columns), titles)
+
+def recall(exact, approximate):
+    '''
+    Returns the share of the exact best books with a positive score
+that were found approximately. Both are (scores, books) k x films arrays.
+
+    >>> import numpy as np
+    >>> exact = (np.array([[0.9, 0.8], [0.7, 0.0]]), np.array([[0, 1], [2, 3]]))
+    >>> approximate = (np.array([[0.9, 0.8], [-np.inf, 0.0]]), np.array([[0, 1], [0, 3]]))
+    >>> recall(exact, approximate)
+    0.6666666666666666
+    '''
+    found = 0
+    total = 0
+    for film in range(exact[1].shape[1]):
+        wanted = set(exact[1][exact[0][:, film] > 0, film])
+        found += len(wanted & set(approximate[1][np.isfinite(approximate[0][:, film]), film]))
+        total += len(wanted)
+    return found / total if total else 1.0
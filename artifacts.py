@@ -0,0 +1,249 @@
+'''
+On-disk store for preprocessed matrices and neighbour indexes.
+
+A store is a directory with one .npy file per array and a manifest.json
+that records the schema version, the score dtype, the shapes of sparse
+matrices and small metadata. Vocabularies and titles are saved as string
+arrays, so they are memory-mapped like everything else.
+
+With the int8 dtype floating point arrays are saved as codes of the
+precision module with a .scales file beside them: matrix data have one
+scale per matrix column, the scores of a neighbour index one per film and
+other arrays a single one. Quantised arrays stay memory-mapped as codes
+when a store is opened; values and matrix apply their scales where the
+values are used, as float32.
+'''
+
+import os
+import json
+import numpy as np
+from scipy import sparse
+from recommandation_engine_2023 import precision
+
+SCHEMA_VERSION = 1
+MANIFEST = 'manifest.json'
+DIRECTORY = 'artifacts'
+DTYPES = precision.PRECISIONS
+
+def save_artifacts(directory, arrays = None, matrices = None, metadata = None,
+                   dtype = 'float64'):
+    '''
+    Writes arrays, CSR matrices and metadata into a store directory.
+Floating point arrays are saved with the given dtype.
+
+    >>> import tempfile
+    >>> import numpy as np
+    >>> from scipy import sparse
+    >>> directory = tempfile.mkdtemp()
+    >>> save_artifacts(directory, arrays = {'score':np.array([0.5, 0.25])},\
+                       matrices = {'tfidf':sparse.csr_matrix(np.eye(2))},\
+                       metadata = {'films':['Jaws']}, dtype = 'float32')
+    >>> store = load_artifacts(directory)
+    >>> store['arrays']['score'].dtype, store['matrices']['tfidf'].shape
+    (dtype('float32'), (2, 2))
+    >>> store['metadata']
+    {'films': ['Jaws']}
+    >>> save_artifacts(directory, arrays = {'td.film':np.array([0, 0, 1]),\
+                                            'td.score':np.array([0.5, 0.25, 0.1])},\
+                       matrices = {'tfidf':sparse.csr_matrix(np.eye(2))}, dtype = 'int8')
+    >>> store = load_artifacts(directory)
+    >>> store['arrays']['td.score'], store['matrices']['tfidf'].dtype
+    (memmap([127,  64, 127], dtype=int8), dtype('int8'))
+    >>> values(store, 'td.score').round(3), matrix(store, 'tfidf').dtype
+    (array([0.5  , 0.252, 0.1  ], dtype=float32), dtype('float32'))
+    '''
+    if dtype not in DTYPES:
+        raise ValueError(f'Unsupported dtype: {dtype}.')
+    os.makedirs(directory, exist_ok = True)
+    manifest = {'schema_version':SCHEMA_VERSION, 'dtype':dtype,
+                'arrays':[], 'matrices':{}, 'metadata':{}}
+    _write(directory, manifest, arrays, matrices, metadata)
+
+def update_artifacts(directory, arrays = None, matrices = None, metadata = None):
+    '''
+    Replaces or adds arrays, CSR matrices and metadata keys of an existing
+store. Files are replaced atomically, so stores opened before stay valid.
+
+    >>> import tempfile
+    >>> import numpy as np
+    >>> directory = tempfile.mkdtemp()
+    >>> save_artifacts(directory, arrays = {'score':np.array([0.5])},\
+                       metadata = {'top_k':5})
+    >>> update_artifacts(directory, arrays = {'book':np.array([3])},\
+                         metadata = {'films':1})
+    >>> store = load_artifacts(directory)
+    >>> sorted(store['arrays']), store['metadata']
+    (['book', 'score'], {'top_k': 5, 'films': 1})
+    '''
+    with open(os.path.join(directory, MANIFEST), 'r', encoding = 'utf-8') as file:
+        manifest = json.load(file)
+    _write(directory, manifest, arrays, matrices, metadata)
+
+def _write(directory, manifest, arrays, matrices, metadata):
+    '''
+    Writes arrays and matrices into a store and updates its manifest.
+    '''
+    arrays = dict(arrays or {})
+    #Column ids (by the name of their array) and widths of int8 quantisation.
+    columns = {}
+    for name, matrix in (matrices or {}).items():
+        matrix = sparse.csr_matrix(matrix)
+        arrays[name + '.data'] = matrix.data
+        arrays[name + '.indices'] = matrix.indices
+        arrays[name + '.indptr'] = matrix.indptr
+        manifest['matrices'][name] = list(matrix.shape)
+        columns[name + '.data'] = (name + '.indices', matrix.shape[1])
+    for name in arrays:
+        if name.endswith('.score') and name[:-len('score')] + 'film' in arrays:
+            columns[name] = (name[:-len('score')] + 'film', None)
+
+    quantized = manifest.setdefault('quantized', {})
+    for name, array in arrays.items():
+        array = np.asarray(array)
+        quantized.pop(name, None)
+        if np.issubdtype(array.dtype, np.floating) and manifest['dtype'] == 'int8':
+            column, width = columns.get(name, (None, None))
+            array, scales = precision.quantize(array, None if column is None
+                                                      else arrays[column], width)
+            _replace(os.path.join(directory, name + '.scales.npy'),
+                     lambda file, scales = scales: np.save(file, scales))
+            quantized[name] = column
+        elif np.issubdtype(array.dtype, np.floating):
+            array = array.astype(manifest['dtype'])
+        _replace(os.path.join(directory, name + '.npy'),
+                 lambda file, array = array: np.save(file, array))
+
+    manifest['arrays'] = sorted(set(manifest['arrays']) | set(arrays))
+    manifest['metadata'].update(metadata or {})
+    _replace(os.path.join(directory, MANIFEST),
+             lambda file: file.write(json.dumps(manifest, ensure_ascii = False)
+                                     .encode('utf-8')))
+
+def _replace(path, write):
+    '''
+    Writes a file next to path and moves it into place.
+    '''
+    with open(path + '.tmp', 'wb') as file:
+        write(file)
+    os.replace(path + '.tmp', path)
+
+def version(directory):
+    '''
+    Returns the version of a store: the modification time and inode of
+its manifest, which every save and update replaces.
+    '''
+    status = os.stat(os.path.join(directory, MANIFEST))
+    return status.st_mtime_ns, status.st_ino
+
+def load_artifacts(directory, names = None):
+    '''
+    Returns a store opened from a directory. Arrays are memory-mapped,
+quantised ones as their codes, so opening does not depend on their size.
+The scales of quantised arrays are kept by name with the name of their
+column array. With names, only the arrays and matrices of that list are
+opened.
+
+    >>> import tempfile
+    >>> import numpy as np
+    >>> directory = tempfile.mkdtemp()
+    >>> save_artifacts(directory, arrays = {'score':np.array([0.5]), 'book':np.array([3])},\
+                       matrices = {'tfidf':np.eye(2)})
+    >>> store = load_artifacts(directory, ['book', 'tfidf'])
+    >>> sorted(store['arrays']), list(store['matrices'])
+    (['book', 'tfidf.data', 'tfidf.indices', 'tfidf.indptr'], ['tfidf'])
+    '''
+    with open(os.path.join(directory, MANIFEST), 'r', encoding = 'utf-8') as file:
+        manifest = json.load(file)
+    if manifest.get('schema_version') != SCHEMA_VERSION:
+        raise ValueError(f'Unsupported artifacts schema: {manifest.get("schema_version")}.')
+
+    wanted = None if names is None else set(names)
+    matrices = {name:shape for name, shape in manifest['matrices'].items()
+                if wanted is None or name in wanted}
+    arrays = {name:np.load(os.path.join(directory, name + '.npy'), mmap_mode = 'r')
+              for name in manifest['arrays']
+              if wanted is None or name in wanted or name.rsplit('.', 1)[0] in matrices}
+    scales = {name:(np.load(os.path.join(directory, name + '.scales.npy'), mmap_mode = 'r'),
+                    column)
+              for name, column in manifest.get('quantized', {}).items() if name in arrays}
+    for column in {column for _, column in scales.values() if column is not None}:
+        if column not in arrays:
+            arrays[column] = np.load(os.path.join(directory, column + '.npy'), mmap_mode = 'r')
+    matrices = {name:sparse.csr_matrix((arrays[name + '.data'],
+                                        arrays[name + '.indices'],
+                                        arrays[name + '.indptr']), shape = tuple(shape))
+                for name, shape in matrices.items()}
+    return {'dtype':manifest['dtype'], 'arrays':arrays, 'matrices':matrices,
+            'scales':scales, 'metadata':manifest['metadata']}
+
+def values(store, name, rows = None):
+    '''
+    Returns the values of an array of a store, or of its rows, with the
+scales of a quantised array applied.
+
+    >>> import tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> save_artifacts(directory, {'td.film':np.array([0, 1, 1]),\
+                                   'td.score':np.array([0.5, 0.4, 0.2])}, dtype = 'int8')
+    >>> values(load_artifacts(directory), 'td.score', np.array([1, 2])).round(3)
+    array([0.4  , 0.198], dtype=float32)
+    '''
+    array = store['arrays'][name]
+    array = array if rows is None else array[rows]
+    if name not in store.get('scales', {}):
+        return array
+    scales, column = store['scales'][name]
+    columns = None if column is None else store['arrays'][column]
+    columns = columns if columns is None or rows is None else columns[rows]
+    return precision.dequantize(array, scales, columns)
+
+def matrix(store, name):
+    '''
+    Returns a CSR matrix of a store with the scales of quantised data applied.
+    '''
+    result = store['matrices'][name]
+    if name + '.data' not in store.get('scales', {}):
+        return result
+    return sparse.csr_matrix((values(store, name + '.data'), result.indices, result.indptr),
+                             shape = result.shape)
+
+def neighbours_to_arrays(neighbours, films, name):
+    '''
+    Returns a neighbour index as arrays of film ids, book ids and scores.
+
+    >>> import pandas as pd
+    >>> neighbours = pd.DataFrame({'film':['Dune', 'Jaws'], 'book':[3, 1],\
+                                   'title':['Sand', 'Sea'], 'score':[0.7, 0.9]})
+    >>> arrays = neighbours_to_arrays(neighbours, ['Jaws', 'Dune'], 'td')
+    >>> arrays['td.film'], arrays['td.book']
+    (array([1, 0], dtype=int32), array([3, 1], dtype=int32))
+    '''
+    film_ids = {film:position for position, film in enumerate(films)}
+    return {name + '.film':neighbours['film'].map(film_ids).to_numpy(dtype = np.int32),
+            name + '.book':neighbours['book'].to_numpy(dtype = np.int32),
+            name + '.score':neighbours['score'].to_numpy()}
+
+def load_neighbours(store, name):
+    '''
+    Returns a neighbour index of a store as a frame with film, book,
+title and score columns. Titles come from the 'films' and 'books' arrays.
+
+    >>> import tempfile
+    >>> import pandas as pd
+    >>> neighbours = pd.DataFrame({'film':['Jaws'], 'book':[1],\
+                                   'title':['Sea'], 'score':[0.9]})
+    >>> directory = tempfile.mkdtemp()
+    >>> arrays = neighbours_to_arrays(neighbours, ['Jaws'], 'td')
+    >>> arrays.update(films = ['Jaws'], books = ['Sand', 'Sea'])
+    >>> save_artifacts(directory, arrays)
+    >>> load_neighbours(load_artifacts(directory), 'td')
+       film  book title  score
+    0  Jaws     1   Sea    0.9
+    '''
+    #Imported here, so that opening a store does not import pandas.
+    import pandas as pd
+    arrays = store['arrays']
+    return pd.DataFrame({'film':arrays['films'][arrays[name + '.film']].astype(object),
+                         'book':arrays[name + '.book'],
+                         'title':arrays['books'][arrays[name + '.book']].astype(object),
+                         'score':values(store, name + '.score')})
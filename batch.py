@@ -0,0 +1,195 @@
+'''
+Batch recommendations for many user histories.
+
+Histories are read from a JSONL file ({"user": ..., "history": [...]} per
+line) or a CSV file with user and film columns. Every chunk of users
+becomes a sparse user x film indicator matrix that is multiplied by the
+film x book scores of the store, which sum the neighbour scores of all
+criteria like computations.history_best_matches. The best books of every
+user are appended to the output file chunk by chunk.
+'''
+
+import csv
+import json
+import argparse
+import numpy as np
+from scipy import sparse
+from recommandation_engine_2023 import artifacts
+
+CHUNK_SIZE = 10000
+
+def film_book_scores(store, criteria = None):
+    '''
+    Returns a CSR film x book matrix with neighbour scores summed over
+the criteria of a store.
+
+    >>> import tempfile
+    >>> import numpy as np
+    >>> directory = tempfile.mkdtemp()
+    >>> artifacts.save_artifacts(directory, {'films':['Jaws'], 'books':['Sea', 'Sand'],\
+                                             'td.film':np.array([0, 0]),\
+                                             'td.book':np.array([0, 1]),\
+                                             'td.score':np.array([0.5, 0.25]),\
+                                             'ttl.film':np.array([0]),\
+                                             'ttl.book':np.array([1]),\
+                                             'ttl.score':np.array([0.5])},\
+                                 metadata = {'criteria':{'td':[], 'ttl':[]}})
+    >>> film_book_scores(artifacts.load_artifacts(directory)).toarray()
+    array([[0.5 , 0.75]])
+    '''
+    return sum(criterion_scores(store, criterion)
+               for criterion in criteria or store['metadata']['criteria']).tocsr()
+
+def criterion_scores(store, criterion):
+    '''
+    Returns a CSR film x book matrix with the neighbour scores of a criterion.
+    '''
+    arrays = store['arrays']
+    shape = (len(arrays['films']), len(arrays['books']))
+    return sparse.csr_matrix((np.asarray(artifacts.values(store, criterion + '.score'),
+                                         dtype = np.float64),
+                              (arrays[criterion + '.film'], arrays[criterion + '.book'])),
+                             shape = shape)
+
+def film_ids(films):
+    '''
+    Returns a dictionary film title -> film id. A repeated title
+keeps its last row like the neighbour indexes.
+
+    >>> film_ids(['Jaws', 'Dune', 'Jaws'])
+    {'Jaws': 2, 'Dune': 1}
+    '''
+    return {title:position for position, title in enumerate(films)}
+
+def histories_matrix(histories, ids, films):
+    '''
+    Returns a CSR user x film indicator matrix of histories.
+Films missing from ids are left out.
+
+    >>> histories_matrix([['Jaws', 'Up'], ['Dune', 'Dune']], {'Jaws':0, 'Dune':1}, 2).toarray()
+    array([[1., 0.],
+           [0., 1.]])
+    '''
+    rows = []
+    columns = []
+    for row, history in enumerate(histories):
+        known = {ids[film] for film in history if film in ids}
+        rows.extend([row] * len(known))
+        columns.extend(known)
+    return sparse.csr_matrix((np.ones(len(rows)), (rows, columns)),
+                             shape = (len(histories), films))
+
+def top_books(scores, top = 5):
+    '''
+    Returns the best book ids and scores of every row of a CSR matrix.
+Equal scores are ordered by book id like nlargest.
+
+    >>> from scipy import sparse
+    >>> top_books(sparse.csr_matrix([[0.5, 0.0, 0.5, 0.9], [0.0, 0.0, 0.0, 0.0]]), top = 2)
+    [(array([3, 0], dtype=int32), array([0.9, 0.5])), \
+(array([], dtype=int32), array([], dtype=float64))]
+    '''
+    scores.sort_indices()
+    results = []
+    for row in range(scores.shape[0]):
+        start, stop = scores.indptr[row], scores.indptr[row + 1]
+        data = scores.data[start:stop]
+        order = np.lexsort((scores.indices[start:stop], -data))[:top]
+        results.append((scores.indices[start:stop][order], data[order]))
+    return results
+
+def read_histories(file_name, chunk_size = CHUNK_SIZE):
+    '''
+    Yields lists of (user, history) pairs with at most chunk_size users.
+CSV rows of a user must be consecutive.
+    '''
+    if file_name.endswith('.jsonl'):
+        chunk = []
+        with open(file_name, 'r', encoding = 'utf-8') as file:
+            for line in file:
+                if line.strip():
+                    user = json.loads(line)
+                    chunk.append((user['user'], user['history']))
+                    if len(chunk) == chunk_size:
+                        yield chunk
+                        chunk = []
+        if chunk:
+            yield chunk
+        return
+
+    #Imported here, so that JSONL histories and fusion do not import pandas.
+    import pandas as pd
+    rest = pd.DataFrame(columns = ['user', 'film'])
+    for frame in pd.read_csv(file_name, usecols = ['user', 'film'], dtype = str,
+                             chunksize = chunk_size):
+        frame = pd.concat((rest, frame))
+        #The last user may go on in the next chunk.
+        last = frame['user'].iloc[-1]
+        rest = frame[frame['user'] == last]
+        frame = frame[frame['user'] != last]
+        if len(frame):
+            yield list(frame.groupby('user', sort = False)['film'].agg(list).items())
+    if len(rest):
+        yield list(rest.groupby('user', sort = False)['film'].agg(list).items())
+
+def recommend_batch(store, histories, top = 5, scores = None, ids = None):
+    '''
+    Yields (user, book titles, scores) of every (user, history) pair
+of a chunk.
+    '''
+    scores = film_book_scores(store) if scores is None else scores
+    ids = film_ids(store['arrays']['films']) if ids is None else ids
+    users = [user for user, _ in histories]
+    indicator = histories_matrix([history for _, history in histories], ids,
+                                 scores.shape[0])
+    titles = store['arrays']['books']
+    for user, (books, values) in zip(users, top_books((indicator @ scores).tocsr(), top)):
+        yield user, [str(title) for title in titles[books]], values.tolist()
+
+def write_recommendations(file_name, store, chunks, top = 5):
+    '''
+    Writes recommendations of chunks of histories to a JSONL file
+({"user": ..., "books": [...], "scores": [...]} per line) or to a CSV
+file with user, rank, title and score columns. Returns the number of users.
+    '''
+    scores = film_book_scores(store)
+    ids = film_ids(store['arrays']['films'])
+    users = 0
+    with open(file_name, 'w', encoding = 'utf-8', newline = '') as file:
+        jsonl = file_name.endswith('.jsonl')
+        writer = None if jsonl else csv.writer(file)
+        if writer:
+            writer.writerow(['user', 'rank', 'title', 'score'])
+        for chunk in chunks:
+            for user, titles, values in recommend_batch(store, chunk, top, scores, ids):
+                if jsonl:
+                    file.write(json.dumps({'user':user, 'books':titles, 'scores':values},
+                                          ensure_ascii = False) + '\n')
+                else:
+                    writer.writerows([user, rank, title, value] for rank, (title, value)
+                                     in enumerate(zip(titles, values), start = 1))
+            users += len(chunk)
+            file.flush()
+    return users
+
+def main():
+    '''
+    Writes the best books for every user of a histories file.
+    '''
+    parser = argparse.ArgumentParser(description = 'Recommend books for many users.')
+    parser.add_argument('histories', help = 'JSONL or CSV (user, film) file of histories')
+    parser.add_argument('output', help = 'JSONL or CSV file for the recommendations')
+    parser.add_argument('--artifacts', default = artifacts.DIRECTORY)
+    parser.add_argument('--top', type = int, default = 5)
+    parser.add_argument('--chunk-size', type = int, default = CHUNK_SIZE,
+                        help = 'users per matrix multiply')
+    arguments = parser.parse_args()
+
+    store = artifacts.load_artifacts(arguments.artifacts)
+    users = write_recommendations(arguments.output, store,
+                                  read_histories(arguments.histories, arguments.chunk_size),
+                                  arguments.top)
+    print(f'Recommendations for {users} users written to {arguments.output}.')
+
+if __name__ == '__main__':
+    main()
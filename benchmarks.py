@@ -0,0 +1,578 @@
+'''
+Benchmarks of the recommendation engine.
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+from recommandation_engine_2023 import ann
+from recommandation_engine_2023 import artifacts
+from recommandation_engine_2023 import cleaning
+from recommandation_engine_2023 import computations
+from recommandation_engine_2023 import corpus
+from recommandation_engine_2023 import fusion
+from recommandation_engine_2023 import parallel
+from recommandation_engine_2023 import precision
+from recommandation_engine_2023 import preprocessing
+try:
+    import resource
+except ImportError:
+    resource = None
+
+GENRES = ['Fantasy', 'Horror', 'Romance', 'History', 'Science', 'Poetry', 'Mystery',
+          'Drama', 'Comedy', 'Biography']
+
+def load_books(rows):
+    '''
+    Returns cleaned books from book_data.csv together with their genres.
+    '''
+    path = os.path.dirname(__file__)
+    books_frame = pd.read_csv(path + '/data/book_data.csv', nrows = rows,
+                              usecols = ['book_title', 'book_authors',
+                                         'book_desc', 'genres'])
+    books_frame = books_frame.rename(columns = {'book_title':'title',
+                                                'book_authors':'authors',
+                                                'book_desc':'desc', 'genres':'genre'})
+    books_frame = books_frame.dropna().reset_index(drop = True)
+    genres = books_frame['genre'].apply(lambda genre: set(genre.split('|')))
+
+    #Genres are the quality labels, so they are kept out of the text.
+    books_frame['text'] = books_frame['title'] + ' ' + books_frame['authors'] \
+                                + ' ' + books_frame['desc']
+    books_frame = books_frame.drop(columns = ['genre', 'authors'])
+    books_frame = cleaning.clean_up(books_frame, columns = ['title', 'desc', 'text'])
+    return books_frame, genres
+
+def genre_precision(similarities, catalogue_genres, query_genres, top = 5):
+    '''
+    Returns the share of top books that have a genre in common
+with the query they were recommended for.
+
+    >>> import pandas as pd
+    >>> similarities = pd.DataFrame({'0':[0.9, 0.1, 0.5], '1':[0.2, 0.8, 0.1]})
+    >>> genre_precision(similarities, [{'a'}, {'b'}, {'c'}], [{'a'}, {'c'}], top = 2)
+    0.25
+    '''
+    hits = 0
+    total = 0
+    for position, column in enumerate(similarities):
+        for index in similarities[column].nlargest(top).index:
+            hits += bool(catalogue_genres[index] & query_genres[position])
+            total += 1
+    return hits / total if total else 0.0
+
+def compare_vector_spaces(catalogue, queries, catalogue_genres, query_genres, top = 5):
+    '''
+    Returns a frame with the time spent and the genre precision reached
+by legacy positional vectors and by the shared term space.
+    '''
+    catalogue = catalogue.reset_index(drop = True)
+    queries = queries.reset_index(drop = True)
+    queries['title_pure'] = [str(index) for index in range(len(queries))]
+    rows = []
+    for legacy in (True, False):
+        start = time.perf_counter()
+        if legacy:
+            catalogue_vectors = computations.dataframe_to_tfidf(catalogue.copy())
+            query_vectors = computations.dataframe_to_tfidf(queries.copy())
+        else:
+            catalogue_vectors, query_vectors = catalogue, queries
+        vectorising = time.perf_counter() - start
+
+        for criterion, (key1, key2) in computations.CRITERIA.items():
+            start = time.perf_counter()
+            similarities = computations.similarity_between_frames(catalogue_vectors,
+                                                                  query_vectors,
+                                                                  key1, key2,
+                                                                  legacy = legacy)
+            seconds = vectorising + time.perf_counter() - start
+            rows.append({'space':'legacy' if legacy else 'shared',
+                         'criterion':criterion, 'seconds':seconds,
+                         f'precision@{top}':genre_precision(similarities,
+                                                            list(catalogue_genres),
+                                                            list(query_genres), top)})
+    return pd.DataFrame(rows)
+
+def legacy_clean_up(dataframe, columns):
+    '''
+    Cleans columns step by step like clean_up did before tokenize.
+    '''
+    def if_empty(string):
+        if len(string) == 0:
+            return ['None']
+        return string.split()
+
+    for column in columns:
+        dataframe[column] = dataframe[column].apply(func = cleaning.to_lower_case)
+        dataframe[column] = dataframe[column].apply(func = cleaning.remove_non_lettersdigits)
+        dataframe[column] = dataframe[column].apply(func = cleaning.remove_non_lettersdigits)
+        dataframe[column] = dataframe[column].apply(if_empty)
+        if column != 'title':
+            dataframe[column] = dataframe[column].apply(func = cleaning.remove_stop_words)
+    return dataframe
+
+def list_bytes(documents):
+    '''
+    Returns the bytes of documents kept as lists of strings.
+    '''
+    return sum(sys.getsizeof(document) + sum(sys.getsizeof(word) for word in document)
+               for document in documents)
+
+def corpora_bytes(corpora):
+    '''
+    Returns the bytes of corpora sharing one vocabulary, with the vocabulary.
+    '''
+    words = next(iter(corpora.values()))['words'] if corpora else {}
+    return sum(corpus.nbytes(tokens) for tokens in corpora.values()) \
+               + sys.getsizeof(words) + sum(sys.getsizeof(word) for word in words)
+
+def compare_cleaning(rows):
+    '''
+    Returns a frame with rows per second cleaned by the step by step
+and the one pass cleaning of book_data.csv and by the cleaning into
+interned corpora, with the memory of the tokens, checking that all give
+the same words.
+    '''
+    path = os.path.dirname(__file__)
+    books_frame = pd.read_csv(path + '/data/book_data.csv', nrows = rows,
+                              usecols = ['book_title', 'book_desc'])
+    books_frame = books_frame.rename(columns = {'book_title':'title', 'book_desc':'desc'})
+    books_frame = books_frame.fillna('None')
+    report = []
+    results = []
+    for name, function in (('step by step', legacy_clean_up),
+                           ('one pass', cleaning.clean_up)):
+        start = time.perf_counter()
+        results.append(function(books_frame.copy(), columns = ['title', 'desc']))
+        seconds = time.perf_counter() - start
+        report.append({'cleaning':name, 'seconds':seconds,
+                       'rows/sec':len(books_frame) / seconds,
+                       'tokens MB':sum(list_bytes(results[-1][column])
+                                       for column in ('title', 'desc')) / 2 ** 20})
+    if not results[0].equals(results[1]):
+        raise AssertionError('One pass cleaning gives different words.')
+
+    start = time.perf_counter()
+    corpora = parallel.intern_columns(books_frame, ['title', 'desc'])
+    seconds = time.perf_counter() - start
+    report.append({'cleaning':'interned corpus', 'seconds':seconds,
+                   'rows/sec':len(books_frame) / seconds,
+                   'tokens MB':corpora_bytes(corpora) / 2 ** 20})
+    if any(corpus.to_lists(corpora[column]) != results[1][column].to_list()
+           for column in corpora):
+        raise AssertionError('Interned corpora give different words.')
+    return pd.DataFrame(report)
+
+def compare_neighbours(catalogue, queries, k = computations.TOP_K,
+                       probes = (1, 2, 4, 8, 16, 32)):
+    '''
+    Returns a frame with the time spent finding the k best books of every
+query by the exact search and by the approximate index with different
+numbers of probes, and the recall@k of the approximate search.
+    '''
+    rows = []
+    for criterion, (key1, key2) in computations.CRITERIA.items():
+        books_matrix, films_matrix, _, _ = computations.frames_to_matrices(catalogue, queries,
+                                                                           key1, key2,
+                                                                           legacy = False)
+        films = [str(index) for index in range(films_matrix.shape[0])]
+        start = time.perf_counter()
+        exact = parallel.top_k_arrays(books_matrix, films_matrix, films, k)[:2]
+        rows.append({'criterion':criterion, 'search':'exact', 'probes':None,
+                     'seconds':time.perf_counter() - start, f'recall@{k}':1.0})
+
+        start = time.perf_counter()
+        index = ann.build_index(books_matrix)
+        building = time.perf_counter() - start
+        for count in probes:
+            start = time.perf_counter()
+            approximate = ann.search(index, films_matrix, k, count)
+            rows.append({'criterion':criterion, 'search':'approximate', 'probes':count,
+                         'seconds':time.perf_counter() - start, 'index seconds':building,
+                         f'recall@{k}':ann.recall(exact, approximate)})
+    return pd.DataFrame(rows)
+
+def directory_bytes(directory):
+    '''
+    Returns the bytes of the files of a directory.
+    '''
+    return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+def heap_bytes(store):
+    '''
+    Returns the bytes of the arrays of an opened store that are held in
+memory rather than memory-mapped from its files.
+    '''
+    arrays = list(store['arrays'].values()) \
+                 + [scales for scales, _ in store.get('scales', {}).values()] \
+                 + [part for matrix in store['matrices'].values()
+                    for part in (matrix.data, matrix.indices, matrix.indptr)]
+    total = 0
+    for array in {id(array):array for array in arrays}.values():
+        base = array
+        while isinstance(base, np.ndarray) and not isinstance(base, np.memmap):
+            base = base.base
+        if not isinstance(base, np.memmap):
+            total += array.nbytes
+    return total
+
+def compare_precisions(catalogue, queries, top = 5, chunk_size = 1000):
+    '''
+    Returns a frame with the memory of the similarities of every criterion
+kept with every dtype of precision.PRECISIONS and the memory saved against
+float64, the bytes of a store of their TF-IDF matrices and neighbours and
+the memory taken by opening it, the largest score error and the share of
+the top books of find_best_matches that are the float64 ones.
+    '''
+    queries = queries.reset_index(drop = True)
+    queries['title_pure'] = [str(index) for index in range(len(queries))]
+    catalogue = catalogue.reset_index(drop = True)
+    titles = pd.Series([str(index) for index in range(len(catalogue))])
+    rows = []
+    for criterion, (key1, key2) in computations.CRITERIA.items():
+        books_matrix, films_matrix, _, _ = computations.frames_to_matrices(catalogue, queries,
+                                                                           key1, key2,
+                                                                           legacy = False)
+        for dtype in precision.PRECISIONS:
+            similarities = computations.similarity_between_frames(catalogue, queries,
+                                                                  key1, key2, legacy = False,
+                                                                  dtype = dtype,
+                                                                  chunk_size = chunk_size)
+            memory = similarities.memory_usage(index = False).sum()
+            scores = computations.frame_scores(similarities)
+            neighbours = computations.top_k_neighbours([similarities], titles, top)
+            best = {film:computations.find_best_matches(neighbours, film, top)
+                    for film in queries['title_pure']}
+            if dtype == 'float64':
+                reference_memory, reference_scores, reference_best = memory, scores, best
+            shared = [len(set(best[film]) & set(books)) / len(books)
+                      for film, books in reference_best.items() if books]
+
+            directory = tempfile.mkdtemp()
+            try:
+                arrays = artifacts.neighbours_to_arrays(neighbours, list(queries['title_pure']),
+                                                        criterion)
+                artifacts.save_artifacts(directory, arrays,
+                                         {criterion + '.books_tfidf':books_matrix,
+                                          criterion + '.films_tfidf':films_matrix},
+                                         dtype = dtype)
+                store = directory_bytes(directory)
+                loaded = heap_bytes(artifacts.load_artifacts(directory))
+            finally:
+                shutil.rmtree(directory)
+            rows.append({'criterion':criterion, 'dtype':dtype,
+                         'similarity MB':memory / 2 ** 20,
+                         'memory saved %':100 * (1 - memory / reference_memory),
+                         'store MB':store / 2 ** 20,
+                         'loaded MB':loaded / 2 ** 20,
+                         'max error':np.nanmax(np.abs(scores - reference_scores),
+                                               initial = 0.0),
+                         f'top-{top} overlap':np.mean(shared) if shared else 1.0})
+    return pd.DataFrame(rows)
+
+def synthetic_corpus(documents, vocabulary = 20000, length = 100, seed = 0):
+    '''
+    Returns a frame of books or films with title, authors, desc and genre
+columns made of words w0, w1, ... of a vocabulary, drawn with Zipf's law
+like natural text. Descriptions have about length words.
+
+    >>> corpus = synthetic_corpus(2, vocabulary = 50, length = 5)
+    >>> list(corpus.columns), len(corpus)
+    (['title', 'authors', 'desc', 'genre'], 2)
+    '''
+    generator = np.random.default_rng(seed)
+    def words(count):
+        ranks = generator.zipf(1.1, size = count)
+        return ' '.join(f'w{rank - 1}' for rank in ranks[ranks <= vocabulary])
+
+    return pd.DataFrame({'title':[words(generator.integers(2, 7))
+                                  for _ in range(documents)],
+                         'authors':[f'Author {generator.integers(documents)}'
+                                    for _ in range(documents)],
+                         'desc':[words(max(1, generator.poisson(length)))
+                                 for _ in range(documents)],
+                         'genre':['|'.join(generator.choice(GENRES, 2, replace = False))
+                                  for _ in range(documents)]})
+
+def real_corpus(rows = None):
+    '''
+    Returns raw books of data/book_data.csv and data/topics.csv with title,
+authors, desc and genre columns, like the preprocessing reads them.
+    '''
+    path = os.path.dirname(__file__)
+    books = preprocessing.read_chunks(path + '/data/book_data.csv',
+                                      preprocessing.BOOKS_COLUMNS, 10 ** 9, rows)
+    topics = preprocessing.read_chunks(path + '/data/topics.csv',
+                                       preprocessing.TOPICS_COLUMNS, 10 ** 9, rows)
+    return pd.concat([chunk.dropna(how = 'all') for chunk in books]
+                     + [chunk.dropna() for chunk in preprocessing.unique_titles(topics)],
+                     ignore_index = True)
+
+def peak_rss():
+    '''
+    Returns the peak resident set size of the process in megabytes,
+None where the resource module is missing.
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+def timed(records, stage, rows, function, *arguments):
+    '''
+    Returns function(*arguments) and appends its wall time, rows per second
+and the peak RSS after it to records.
+    '''
+    start = time.perf_counter()
+    result = function(*arguments)
+    seconds = time.perf_counter() - start
+    records.append({'stage':stage, 'seconds':seconds, 'rows':rows,
+                    'rows/sec':rows / seconds if seconds else None,
+                    'peak RSS MB':peak_rss()})
+    return result
+
+def run_stages(books, films, histories = 100, top_k = computations.TOP_K,
+               legacy = False, seed = 0):
+    '''
+    Returns records of every stage of the engine run on raw books and films:
+cleaning, TF-IDF, similarity, saving, loading and answering histories of
+three random films like main.main.
+    '''
+    records = []
+    columns = ['title', 'authors', 'desc', 'genre', 'criteria']
+    books, films = books.reindex(columns = columns), films.reindex(columns = columns)
+    books = timed(records, 'cleaning books', len(books),
+                  lambda: pd.concat(preprocessing.clean_chunks([books]), ignore_index = True))
+    films = timed(records, 'cleaning films', len(films),
+                  lambda: pd.concat(preprocessing.clean_chunks([films]), ignore_index = True))
+    if legacy:
+        books = timed(records, 'legacy tfidf books', len(books),
+                      computations.dataframe_to_tfidf, books.copy())
+        films = timed(records, 'legacy tfidf films', len(films),
+                      computations.dataframe_to_tfidf, films.copy())
+
+    arrays = {'books':books['title_pure'].to_numpy(dtype = str),
+              'films':films['title_pure'].to_numpy(dtype = str)}
+    matrices = {}
+    for criterion, (key1, key2) in computations.CRITERIA.items():
+        books_matrix, films_matrix, _, _ = timed(records, f'tfidf {criterion}',
+                                                 len(books) + len(films),
+                                                 computations.frames_to_matrices,
+                                                 books, films, key1, key2, legacy)
+        neighbours = timed(records, f'similarity {criterion}', len(books) * len(films),
+                           parallel.top_k_neighbours, books_matrix, films_matrix,
+                           books['title_pure'], films['title_pure'], top_k,
+                           preprocessing.CHUNK_SIZE)
+        arrays.update(artifacts.neighbours_to_arrays(neighbours,
+                                                     list(films['title_pure']), criterion))
+        matrices[criterion + '.books_tfidf'] = books_matrix
+        matrices[criterion + '.films_tfidf'] = films_matrix
+
+    directory = tempfile.mkdtemp()
+    try:
+        timed(records, 'saving', len(books) + len(films), artifacts.save_artifacts,
+              directory, arrays, matrices,
+              {'top_k':top_k, 'criteria':computations.CRITERIA})
+        def load():
+            store = artifacts.load_artifacts(directory)
+            return fusion.load_fusion(store), {criterion:artifacts.load_neighbours(store,
+                                                                                   criterion)
+                                               for criterion in computations.CRITERIA}
+        model, neighbours = timed(records, 'loading', len(books) + len(films), load)
+
+        generator = np.random.default_rng(seed)
+        titles = list(films['title_pure'])
+        queries = [list(generator.choice(titles, min(3, len(titles)), replace = False))
+                   for _ in range(histories)]
+        def answer():
+            for history in queries:
+                fusion.fused_top(model, history)
+                computations.films_best_matches(neighbours, history)
+        timed(records, 'queries', histories, answer)
+    finally:
+        shutil.rmtree(directory)
+    return records
+
+def import_times(module):
+    '''
+    Returns the cumulative import microseconds of every module imported
+by a fresh interpreter importing a module, from python -X importtime.
+    '''
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output = True, text = True, check = True,
+                            env = package_environment())
+    times = {}
+    for line in result.stderr.splitlines():
+        fields = line[len('import time:'):].split('|')
+        if line.startswith('import time:') and len(fields) == 3 \
+                and fields[1].strip().isdigit():
+            times[fields[2].strip()] = int(fields[1])
+    return times
+
+def package_environment():
+    '''
+    Returns the environment of a subprocess that can import the package.
+    '''
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return dict(os.environ, PYTHONPATH = os.pathsep.join(filter(None, (root,
+                                                         os.environ.get('PYTHONPATH')))))
+
+def run_startup(history, directory, repeats = 5):
+    '''
+    Returns records of the cold start of the entry points: the import time
+of their modules with the share of pandas and NLTK, and the wall time of
+a fresh process answering a history with the one-shot query and with the
+prompts of main.main. Every time is the median of repeats runs.
+    '''
+    package = __package__ or 'recommandation_engine_2023'
+    history, directory = os.path.abspath(history), os.path.abspath(directory)
+    records = []
+    for module in ('query', 'main', 'computations'):
+        runs = [import_times(f'{package}.{module}') for _ in range(repeats)]
+        records.append({'stage':f'import {module}',
+                        'seconds':np.median([run[f'{package}.{module}'] for run in runs]) / 1e6,
+                        **{f'{heavy} seconds':np.median([run.get(heavy, 0) for run in runs]) / 1e6
+                           for heavy in ('pandas', 'nltk', 'tabulate')}})
+
+    commands = {'one-shot query':([sys.executable, '-m', f'{package}.query', history,
+                                   '--artifacts', directory], None),
+                'main with prompts':([sys.executable, '-m', f'{package}.main',
+                                      '--artifacts', directory],
+                                     f'{history}\nEXIT\nSKIP\n')}
+    working_directory = tempfile.mkdtemp()
+    try:
+        for stage, (command, answers) in commands.items():
+            seconds = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                subprocess.run(command, input = answers, text = True, check = True,
+                               stdout = subprocess.DEVNULL, cwd = working_directory,
+                               env = package_environment())
+                seconds.append(time.perf_counter() - start)
+            records.append({'stage':stage, 'seconds':np.median(seconds)})
+    finally:
+        shutil.rmtree(working_directory)
+    return records
+
+def stages_corpus(arguments):
+    '''
+    Returns the books and films of the stages benchmark.
+    '''
+    if arguments.corpus == 'synthetic':
+        books = synthetic_corpus(arguments.documents, arguments.vocabulary,
+                                 arguments.length, seed = 0)
+        films = synthetic_corpus(arguments.films, arguments.vocabulary,
+                                 arguments.length, seed = 1)
+    else:
+        books = real_corpus(arguments.rows)
+        films, books = books[:arguments.films], books[arguments.films:]
+    return books.reset_index(drop = True), films.reset_index(drop = True)
+
+def compare_results(report, baseline):
+    '''
+    Returns a stages report with the seconds of a baseline results file
+and the ratio of both for every stage found in it.
+    '''
+    with open(baseline, 'r', encoding = 'utf-8') as file:
+        earlier = pd.DataFrame(json.load(file)['stages'])
+    earlier = earlier.set_index('stage')['seconds'].rename('baseline seconds')
+    report = report.join(earlier, on = 'stage')
+    report['ratio'] = report['seconds'] / report['baseline seconds']
+    return report
+
+def commit():
+    '''
+    Returns the git commit of the package, None outside a git checkout.
+    '''
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd = os.path.dirname(__file__),
+                              capture_output = True, text = True,
+                              check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    '''
+    Runs a benchmark. 'spaces' compares legacy and shared vector spaces
+on book_data.csv: half of the books play the films, the other half is
+the catalogue. 'cleaning' compares the speed of cleaning. 'neighbours'
+compares exact and approximate searches of the best books. 'precision'
+compares the memory and the best books of similarities kept with every
+dtype against float64. 'stages' times
+every stage of the engine on the real data or on a synthetic corpus and
+writes the results with the environment to a JSON file. 'startup' times
+the imports and the cold start of the entry points in fresh processes.
+    '''
+    parser = argparse.ArgumentParser(description = 'Benchmark the engine.')
+    parser.add_argument('benchmark', choices = ['spaces', 'cleaning', 'neighbours',
+                                                 'precision', 'stages', 'startup'])
+    parser.add_argument('--rows', type = int, default = 1000)
+    parser.add_argument('--top', type = int, default = 5)
+    parser.add_argument('--top-k', type = int, default = computations.TOP_K)
+    parser.add_argument('--corpus', choices = ['real', 'synthetic'], default = 'real',
+                        help = 'books of the stages benchmark')
+    parser.add_argument('--documents', type = int, default = 5000,
+                        help = 'synthetic books')
+    parser.add_argument('--films', type = int, default = 500,
+                        help = 'synthetic films, or real books playing films')
+    parser.add_argument('--vocabulary', type = int, default = 20000)
+    parser.add_argument('--length', type = int, default = 100,
+                        help = 'mean number of words of synthetic descriptions')
+    parser.add_argument('--histories', type = int, default = 100)
+    parser.add_argument('--legacy-scores', action = 'store_true')
+    parser.add_argument('--output', default = 'benchmark_results.json')
+    parser.add_argument('--baseline', default = None,
+                        help = 'results of an earlier stages or startup run to compare with')
+    parser.add_argument('--history', default = os.path.join(os.path.dirname(__file__),
+                                                            'history.txt'),
+                        help = 'history answered by the startup benchmark')
+    parser.add_argument('--artifacts', default = artifacts.DIRECTORY,
+                        help = 'artifacts store of the startup benchmark')
+    parser.add_argument('--repeats', type = int, default = 5)
+    arguments = parser.parse_args()
+
+    if arguments.benchmark == 'cleaning':
+        report = compare_cleaning(arguments.rows)
+    elif arguments.benchmark in ('stages', 'startup'):
+        if arguments.benchmark == 'startup':
+            records = run_startup(arguments.history, arguments.artifacts, arguments.repeats)
+        else:
+            books, films = stages_corpus(arguments)
+            records = run_stages(books, films, arguments.histories, arguments.top_k,
+                                 arguments.legacy_scores)
+        with open(arguments.output, 'w', encoding = 'utf-8') as file:
+            json.dump({'benchmark':arguments.benchmark, 'commit':commit(), 'time':time.time(),
+                       'python':platform.python_version(), 'numpy':np.__version__,
+                       'pandas':pd.__version__, 'parameters':vars(arguments),
+                       'stages':records}, file, indent = 2)
+        report = pd.DataFrame(records)
+        if arguments.baseline:
+            report = compare_results(report, arguments.baseline)
+    elif arguments.benchmark == 'neighbours':
+        books_frame, _ = load_books(arguments.rows)
+        middle = len(books_frame) // 2
+        report = compare_neighbours(books_frame[middle:].reset_index(drop = True),
+                                    books_frame[:middle].reset_index(drop = True),
+                                    arguments.top_k)
+    elif arguments.benchmark == 'precision':
+        books_frame, _ = load_books(arguments.rows)
+        middle = len(books_frame) // 2
+        report = compare_precisions(books_frame[middle:], books_frame[:middle], arguments.top)
+    else:
+        books_frame, genres = load_books(arguments.rows)
+        middle = len(books_frame) // 2
+        report = compare_vector_spaces(books_frame[:middle], books_frame[middle:],
+                                       genres[:middle], genres[middle:], arguments.top)
+    print(tabulate(report, headers = 'keys', tablefmt = 'grid', showindex = False))
+
+if __name__ == '__main__':
+    main()
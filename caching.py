@@ -0,0 +1,74 @@
+'''
+Bounded LRU cache with optional time to live.
+
+A cache is a dictionary with its entries in least recently used order,
+its limits and hit, miss, eviction, expiration and invalidation counters.
+Every lookup may give the version of the data the values are computed
+from; a new version clears the cache.
+'''
+
+import time
+import threading
+from collections import OrderedDict
+
+SIZE = 4096
+
+def new_cache(size = SIZE, ttl = None):
+    '''
+    Returns an empty cache of at most size entries living at most
+ttl seconds (forever for None).
+    '''
+    return {'entries':OrderedDict(), 'size':size, 'ttl':ttl, 'version':None,
+            'lock':threading.Lock(), 'hits':0, 'misses':0, 'evictions':0,
+            'expirations':0, 'invalidations':0}
+
+def lookup(cache, key, compute, version = None):
+    '''
+    Returns the cached value of a key, computing and caching it
+with compute() when it is missing or expired.
+
+    >>> cache = new_cache(size = 2)
+    >>> [lookup(cache, key, lambda: key * 2) for key in (1, 2, 1, 3, 2)]
+    [2, 4, 2, 6, 4]
+    >>> statistics(cache)
+    {'entries': 2, 'hits': 1, 'misses': 4, 'evictions': 2, 'expirations': 0, \
+'invalidations': 0}
+    >>> lookup(cache, 1, lambda: 0, version = 'new'), statistics(cache)['invalidations']
+    (0, 1)
+    '''
+    with cache['lock']:
+        if version != cache['version']:
+            if cache['entries']:
+                cache['invalidations'] += 1
+            cache['entries'].clear()
+            cache['version'] = version
+        entry = cache['entries'].get(key)
+        if entry is not None:
+            value, created = entry
+            if cache['ttl'] is None or time.monotonic() - created < cache['ttl']:
+                cache['entries'].move_to_end(key)
+                cache['hits'] += 1
+                return value
+            del cache['entries'][key]
+            cache['expirations'] += 1
+        cache['misses'] += 1
+
+    value = compute()
+    with cache['lock']:
+        if version == cache['version']:
+            cache['entries'][key] = (value, time.monotonic())
+            cache['entries'].move_to_end(key)
+            while len(cache['entries']) > cache['size']:
+                cache['entries'].popitem(last = False)
+                cache['evictions'] += 1
+    return value
+
+def statistics(cache):
+    '''
+    Returns the number of entries and the counters of a cache.
+    '''
+    with cache['lock']:
+        return {'entries':len(cache['entries']), 'hits':cache['hits'],
+                'misses':cache['misses'], 'evictions':cache['evictions'],
+                'expirations':cache['expirations'],
+                'invalidations':cache['invalidations']}
@@ -0,0 +1,115 @@
+'''
+Content-hashed checkpoints of the preprocessing stages.
+
+Every stage has a key: the SHA-256 hash of its name, its parameters and
+the keys or file hashes of its inputs. Its output is pickled into the cache
+directory under that key once the stage completes, so a later run with the
+same inputs loads it instead of computing it again, and a run that crashed
+resumes after its last completed stage. A stage can be forced to run again,
+which forces the stages after it as well.
+'''
+
+import os
+import glob
+import json
+import pickle
+import hashlib
+
+CACHE_DIRECTORY = '.preprocessing_cache'
+VERSION = 1
+STAGES = ('books', 'films', 'tfidf', 'similarity')
+BLOCK_SIZE = 2 ** 20
+
+def file_hash(file_name):
+    '''
+    Returns the SHA-256 hash of the content of a file.
+    '''
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as file:
+        for block in iter(lambda: file.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def stage_key(stage, *inputs):
+    '''
+    Returns the key of a stage for JSON-serialisable inputs and parameters.
+
+    >>> stage_key('films', 'abc', 5) == stage_key('films', 'abc', 5)
+    True
+    >>> stage_key('films', 'abc', 5) == stage_key('films', 'abc', 6)
+    False
+    '''
+    text = json.dumps([VERSION, stage, inputs], sort_keys = True, default = str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def is_forced(stage, forced = ()):
+    '''
+    Returns whether a stage runs again for the forced stages:
+for one of them or for a stage after one of them.
+
+    >>> is_forced('tfidf', ['books']), is_forced('films', ['tfidf'])
+    (True, False)
+    '''
+    name = stage.split(' ')[0]
+    return any(STAGES.index(name) >= STAGES.index(other) for other in forced)
+
+def cache_path(directory, stage, key):
+    '''
+    Returns the path of the output of a stage for a key.
+    '''
+    return os.path.join(directory, f'{stage.replace(" ", "_")}-{key}.pickle')
+
+def remove_others(directory, stage, key):
+    '''
+    Removes the outputs of a stage saved for keys other than key.
+    '''
+    pattern = cache_path(glob.escape(directory), stage, '*')
+    for path in glob.glob(pattern):
+        if path != cache_path(directory, stage, key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def cached(directory, stage, key, compute, forced = (), record = None):
+    '''
+    Returns the output of a stage for a key: loaded from the cache
+directory unless the stage is forced, otherwise made by compute and saved
+there, replacing the outputs of the stage for other keys. Nothing is cached
+without a directory. record['cached'] of a profiling record tells whether
+the output was loaded.
+
+    >>> import tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> cached(directory, 'films', 'k', lambda: print('computing') or 1)
+    computing
+    1
+    >>> cached(directory, 'films', 'k', lambda: print('computing') or 2)
+    1
+    >>> cached(directory, 'films', 'k', lambda: print('computing') or 2, forced = ['books'])
+    computing
+    2
+    >>> cached(directory, 'films', 'k2', lambda: 3), sorted(os.listdir(directory))
+    (3, ['films-k2.pickle'])
+    '''
+    path = cache_path(directory, stage, key) if directory else None
+    if path and not is_forced(stage, forced):
+        try:
+            with open(path, 'rb') as file:
+                output = pickle.load(file)
+            if record is not None:
+                record['cached'] = True
+            return output
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass
+
+    output = compute()
+    if path:
+        os.makedirs(directory, exist_ok = True)
+        with open(path + '.tmp', 'wb') as file:
+            pickle.dump(output, file, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+        remove_others(directory, stage, key)
+    if record is not None:
+        record['cached'] = False
+    return output
@@ -2,7 +2,10 @@
 Cleaning functions.
 '''
 
-from nltk.corpus import stopwords
+import re
+from functools import lru_cache
+
+NON_LETTERSDIGITS = re.compile('[^a-z0-9: ]')
 
 def to_lower_case(sentence):
     '''
@@ -48,14 +51,15 @@ def remove_stop_words(sentence):
 'technically', 'schizophrenia', \
 'boring', 'doctests']
     '''
-    stopwords_words = stopwords.words('english')
+    stopwords_words = english_stop_words()
     filtered_sentence = [word for word in sentence
                          if not word in stopwords_words]
     return filtered_sentence
 
-def clean_up(dataframe, columns):
+def clean_up(dataframe, columns, stop_words = None):
     '''
-    Retuns a dataframe with only digits and alphabet letters.
+    Retuns a dataframe with only digits and alphabet letters. Stop words
+are english_stop_words() unless given.
 
     >>> import pandas as pd
     >>> frame = pd.DataFrame({'col':['SHARK caG%$£mel shark \
@@ -66,32 +70,59 @@ propper effect on economics in Belgia.']})
     ['shark', 'cag', 'mel', 'shark', 'camel', 'eat', \
 'shark', 'kamel', 'disapoint', 'steve', 'propper', \
 'effect', 'economics', 'belgia']
+    >>> clean_up(pd.DataFrame({'col':['The shark and me']}), ['col'], frozenset())['col'][0]
+    ['the', 'shark', 'and', 'me']
     '''
-    def if_empty(string: str):
-        '''
-        Returns a splitted string if it is not empty
-and a list with 'None' otherwise.
-
-        >>> if_empty([1,2,3])
-        [1,2,3]
-        >>> if_empty([])
-        []
-        '''
-        if len(string) == 0:
-            return ['None']
-        array = string.split()
-        return array
-
+    if stop_words is None:
+        stop_words = english_stop_words()
     for column in columns:
-        dataframe[column] = dataframe[column].apply(func = to_lower_case)
-        dataframe[column] = dataframe[column].apply(func = remove_non_lettersdigits)
-        dataframe[column] = dataframe[column].apply(func = remove_non_lettersdigits)
-        dataframe[column] = dataframe[column].apply(if_empty)
-        if column != 'title':
-            dataframe[column] = dataframe[column].apply(func = remove_stop_words)
+        words = stop_words if column != 'title' else frozenset()
+        dataframe[column] = dataframe[column].map(lambda cell, words = words:
+                                                  tokenize(cell, words))
 
     return dataframe
 
+@lru_cache(maxsize = None)
+def english_stop_words():
+    '''
+    Returns a frozen set of english stop words loaded once. NLTK is
+imported on the first call only.
+
+    >>> 'and' in english_stop_words()
+    True
+    '''
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words('english'))
+
+def store_stop_words(store):
+    '''
+    Returns the stop words snapshotted into a store by the preprocessing,
+english_stop_words() for stores saved without them.
+
+    >>> sorted(store_stop_words({'arrays':{'stop_words':['the', 'a']}}))
+    ['a', 'the']
+    '''
+    if 'stop_words' in store['arrays']:
+        return frozenset(str(word) for word in store['arrays']['stop_words'])
+    return english_stop_words()
+
+def tokenize(sentence, stop_words = frozenset()):
+    '''
+    Returns a list of lower case words made only of digits and
+alphabet letters without stop words, or ['None'] for an empty string.
+Gives the same words as to_lower_case, remove_non_lettersdigits,
+str.split and remove_stop_words applied in turn.
+
+    >>> tokenize('SHARK caG%$£mel, and camel', frozenset(['and']))
+    ['shark', 'cag', 'mel', 'camel']
+    >>> tokenize('')
+    ['None']
+    '''
+    sentence = NON_LETTERSDIGITS.sub(' ', sentence.lower())
+    if not sentence:
+        return ['None']
+    return [word for word in sentence.split() if word not in stop_words]
+
 def clean_empty(charlie_frame):
     '''
     Returns a given dataframe with rows with null values
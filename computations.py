@@ -1,8 +1,17 @@
 '''
 Contains functions for computing Word Mover's Distance.
 '''
+from collections import Counter
 import numpy as np
 import pandas as pd
+from scipy import sparse
+from recommandation_engine_2023 import caching
+from recommandation_engine_2023 import inverted
+from recommandation_engine_2023 import precision
+from recommandation_engine_2023 import normalization
+
+TOP_K = 50
+CRITERIA = {'td':('desc', 'title'), 'txtx':('text', 'text'), 'ttl':('title', 'title')}
 
 def term_frequence(word, documents):
     '''
@@ -76,18 +85,157 @@ def document_to_tf_idf(document, documents):
            [0.69314718]])
     '''
 
-    document_vector = np.array([])
-    setdocuments = documents.apply(set)
-    index = setdocuments == set(document)
-    index = documents[index]
-    index = index.index[0]
-    for word in document:
-        frequences = term_frequence(word, documents)
-        frequence = frequences[index]
-        tf_idf_value = word_to_tf_idf(word, frequence, frequences)
-        document_vector = np.append(document_vector, tf_idf_value)
-    document_vector = document_vector.reshape((document_vector.shape[0],1))
-    return document_vector
+    vocabulary, document_frequences = build_vocabulary(documents)
+    idf = inverse_document_frequences(document_frequences, len(documents))
+    return positional_vector(document, vocabulary, idf)
+
+def build_vocabulary(documents):
+    '''
+    Returns a vocabulary (word -> column index) and an array
+of document frequences built in one pass over the documents.
+Columns follow the order in which words first appear.
+
+    >>> vocabulary, frequences = build_vocabulary([['shark', 'shark'],\
+                                                   ['shark', 'camel'], ['None']])
+    >>> vocabulary
+    {'shark': 0, 'camel': 1}
+    >>> frequences
+    array([2, 1])
+    '''
+
+    vocabulary = {}
+    document_frequences = []
+    for document in documents:
+        for word in dict.fromkeys(document):
+            if word == 'None':
+                continue
+            column = vocabulary.get(word)
+            if column is None:
+                vocabulary[word] = len(document_frequences)
+                document_frequences.append(1)
+            else:
+                document_frequences[column] += 1
+    return vocabulary, np.array(document_frequences, dtype = np.int64)
+
+def merge_vocabularies(parts):
+    '''
+    Returns one vocabulary and array of document frequences made of
+(vocabulary, document frequences) pairs of consecutive document shards.
+The result is the same as build_vocabulary over all the documents.
+
+    >>> merge_vocabularies([build_vocabulary([['shark'], ['camel']]),\
+                            build_vocabulary([['kamel', 'shark']])])
+    ({'shark': 0, 'camel': 1, 'kamel': 2}, array([2, 1, 1]))
+    '''
+
+    vocabulary = {}
+    document_frequences = []
+    for part_vocabulary, part_frequences in parts:
+        for word, part_column in part_vocabulary.items():
+            column = vocabulary.get(word)
+            if column is None:
+                vocabulary[word] = len(document_frequences)
+                document_frequences.append(int(part_frequences[part_column]))
+            else:
+                document_frequences[column] += int(part_frequences[part_column])
+    return vocabulary, np.array(document_frequences, dtype = np.int64)
+
+def inverse_document_frequences(document_frequences, number_of_documents):
+    '''
+    Returns an array of inverse document frequences for every word
+of a vocabulary.
+
+    >>> import numpy as np
+    >>> inverse_document_frequences(np.array([3, 1]), 3)
+    array([0.        , 1.09861229])
+    '''
+
+    return np.log(number_of_documents / document_frequences)
+
+def documents_to_tfidf_matrix(documents, vocabulary, idf):
+    '''
+    Returns a CSR matrix (documents x vocabulary) of TF-IDF weights.
+Words missing from the vocabulary are skipped.
+
+    >>> vocabulary, frequences = build_vocabulary([['shark', 'shark'],\
+                                                   ['camel']])
+    >>> idf = inverse_document_frequences(frequences, 2)
+    >>> documents_to_tfidf_matrix([['shark', 'shark'], ['camel']],\
+                                  vocabulary, idf).toarray()
+    array([[1.38629436, 0.        ],
+           [0.        , 0.69314718]])
+    '''
+
+    data = []
+    indices = []
+    indptr = [0]
+    for document in documents:
+        for word, frequence in Counter(document).items():
+            column = vocabulary.get(word)
+            if column is not None:
+                indices.append(column)
+                data.append(frequence * idf[column])
+        indptr.append(len(indices))
+    return sparse.csr_matrix((np.array(data, dtype = np.float64),
+                              np.array(indices, dtype = np.int64),
+                              np.array(indptr, dtype = np.int64)),
+                             shape = (len(indptr) - 1, len(vocabulary)))
+
+def positional_vector(document, vocabulary, idf):
+    '''
+    Returns a document as a legacy TF-IDF column vector in which the i-th
+entry is the weight of the document's i-th word.
+
+    >>> import numpy as np
+    >>> positional_vector(['camel', 'shark', 'None'], {'shark': 0, 'camel': 1},\
+                          np.array([0.5, 2.0]))
+    array([[2. ],
+           [0.5],
+           [0. ]])
+    '''
+
+    frequences = Counter(document)
+    document_vector = np.array([frequences[word] * idf[vocabulary[word]]
+                                if word in vocabulary else 0.0
+                                for word in document], dtype = np.float64)
+    return document_vector.reshape((document_vector.shape[0], 1))
+
+def column_to_tfidf(documents):
+    '''
+    Returns a CSR TF-IDF matrix for a column of documents together with
+its vocabulary and inverse document frequences.
+
+    >>> matrix, vocabulary, idf = column_to_tfidf([['shark'], ['camel'],\
+                                                    ['shark', 'camel']])
+    >>> matrix.shape
+    (3, 2)
+    >>> round(matrix[2, vocabulary['camel']], 4)
+    0.4055
+    '''
+
+    vocabulary, document_frequences = build_vocabulary(documents)
+    idf = inverse_document_frequences(document_frequences, len(documents))
+    matrix = documents_to_tfidf_matrix(documents, vocabulary, idf)
+    return matrix, vocabulary, idf
+
+def dataframe_to_tfidf_matrices(charlie_frame, columns = ('title', 'desc', 'text')):
+    '''
+    Returns a dictionary column -> (CSR TF-IDF matrix, vocabulary, idf)
+for the given columns of a dataframe.
+
+    >>> import pandas as pd
+    >>> frame = pd.DataFrame({'title':[['shark'], ['camel']],\
+                              'desc':[['shark'], ['shark']],\
+                              'text':[['shark', 'camel'], ['camel']]})
+    >>> matrices = dataframe_to_tfidf_matrices(frame)
+    >>> sorted(matrices)
+    ['desc', 'text', 'title']
+    >>> matrices['desc'][0].nnz
+    2
+    '''
+
+    return {column: column_to_tfidf(charlie_frame[column].to_list())
+            for column in columns}
 
 def cosine_similarity(sentence1, sentence2) -> float:
     '''
@@ -156,17 +304,23 @@ def dataframe_to_tfidf(charlie_frame):
            [0.84729786]])
     '''
 
-    charlie_frame['title'] = charlie_frame['title'].apply(lambda cell:document_to_tf_idf
-                                                (cell, charlie_frame['title']))
-    charlie_frame['desc'] = charlie_frame['desc'].apply(lambda cell:document_to_tf_idf
-                                                (cell, charlie_frame['desc']))
-    charlie_frame['text'] = charlie_frame['text'].apply(lambda cell:document_to_tf_idf
-                                                (cell, charlie_frame['text']))
+    for column in ('title', 'desc', 'text'):
+        vocabulary, document_frequences = build_vocabulary(charlie_frame[column])
+        idf = inverse_document_frequences(document_frequences, len(charlie_frame))
+        charlie_frame[column] = charlie_frame[column].apply(lambda cell, vocabulary = vocabulary,
+                                                idf = idf:positional_vector
+                                                (cell, vocabulary, idf))
     return charlie_frame
 
-def similarity_between_frames(frame1, frame2, key1, key2):
+def similarity_between_frames(frame1, frame2, key1, key2, legacy = True, reference = None,
+                              dtype = 'float64', chunk_size = None):
     '''
     Returns how similar content in two frames is.
+With legacy set the cells are positional TF-IDF vectors made by
+dataframe_to_tfidf, otherwise they are cleaned token lists projected
+into one shared term space (see shared_matrices). Similarities are kept
+with the dtype of precision.PRECISIONS, int8 ones by quantize_frame; blocks
+of chunk_size rows of frame1 are converted as soon as they are computed.
 
     >>> import pandas as pd
     >>> frame = pd.DataFrame({'title':['shark','camel',\
@@ -195,31 +349,435 @@ def similarity_between_frames(frame1, frame2, key1, key2):
     4  1.000000  0.672885  0.682348  0.601019
     5  0.682348  0.930731  1.000000  0.782295
     6  0.601019  0.953498  0.782295  1.000000
+    >>> frame = pd.DataFrame({'title':[['shark'], ['camel']],\
+                              'title_pure':['Jaws', 'Dune']})
+    >>> similarity_between_frames(frame, frame, 'title', 'title', legacy = False)
+       Jaws  Dune
+    0   1.0   0.0
+    1   0.0   1.0
+    >>> similarity_between_frames(frame, frame, 'title', 'title', legacy = False,\
+                                  dtype = 'float16').dtypes.to_list()
+    [dtype('float16'), dtype('float16')]
+    '''
+
+    if dtype not in precision.PRECISIONS:
+        raise ValueError(f'Unsupported dtype: {dtype}.')
+    chunks = [chunk.astype('float32' if dtype == 'int8' else dtype)
+              for chunk in similarity_chunks_between_frames(frame1, frame2, key1, key2,
+                                                            chunk_size, legacy, reference)]
+    if not chunks:
+        return pd.DataFrame(columns = list(dict.fromkeys(frame2['title_pure'])))
+    frame = pd.concat(chunks)
+    return quantize_frame(frame) if dtype == 'int8' else frame
+
+def quantize_frame(frame):
+    '''
+    Returns a frame of the int8 codes of the similarities of a frame
+with the scale of every column in attrs['scales'] (see the precision
+module). Books are ranked by the codes of a column like by its similarities.
+
+    >>> frame = quantize_frame(pd.DataFrame({'Jaws':[0.5, 1.0], 'Dune':[np.nan, 0.2]}))
+    >>> frame
+       Jaws  Dune
+    0    64  -128
+    1   127   127
+    >>> frame_scores(frame).round(3)
+    array([[0.504,   nan],
+           [1.   , 0.2  ]])
+    '''
+
+    columns = {column:precision.quantize(frame[column].to_numpy()) for column in frame}
+    quantized = pd.DataFrame({column:codes for column, (codes, _) in columns.items()},
+                             index = frame.index)
+    quantized.attrs['scales'] = {column:float(scales[0])
+                                 for column, (_, scales) in columns.items()}
+    return quantized
+
+def frame_scores(frame):
+    '''
+    Returns the similarities of a frame as a float64 array, dequantising
+the frames of quantize_frame.
     '''
 
-    films = pd.DataFrame()
-    for index in range(len(frame2)):
-        films[frame2.iloc[index]['title_pure']] = frame1[key1].apply(
-                                                    func = lambda cell:cosine_similarity
-                                                    (cell, frame2.iloc[index][key2]))
-    return films
+    scales = frame.attrs.get('scales')
+    if scales is None:
+        return frame.to_numpy(dtype = np.float64)
+    return precision.dequantize(frame.to_numpy(), [scales[column] for column in frame],
+                                dtype = np.float64)
 
-def find_best_matches(similarities, title):
+def similarity_chunks_between_frames(frame1, frame2, key1, key2, chunk_size = None,
+                                     legacy = True, reference = None):
+    '''
+    Yields the frame returned by similarity_between_frames in blocks
+of at most chunk_size rows of frame1.
+
+    >>> import numpy as np
+    >>> import pandas as pd
+    >>> books = pd.DataFrame({'desc':[np.array([[1.0], [1.0]]), np.array([[0.0]]),\
+                                      np.array([[2.0]])]})
+    >>> films = pd.DataFrame({'title':[np.array([[1.0]])], 'title_pure':['Jaws']})
+    >>> for chunk in similarity_chunks_between_frames(books, films, 'desc',\
+                                                      'title', chunk_size = 2):
+    ...     print(chunk)
+           Jaws
+    0  0.707107
+    1       NaN
+       Jaws
+    2   1.0
+    '''
+
+    matrix1, matrix2, _, _ = frames_to_matrices(frame1, frame2, key1, key2,
+                                                legacy, reference)
+    return similarity_chunks_between_matrices(matrix1, matrix2, frame1.index,
+                                              frame2['title_pure'], chunk_size)
+
+def frames_to_matrices(frame1, frame2, key1, key2, legacy = True, reference = None):
+    '''
+    Returns the matrices compared by similarity_between_frames together
+with the vocabulary and inverse document frequences of the shared
+term space (both None for legacy positional vectors).
+
+    >>> import pandas as pd
+    >>> frame = pd.DataFrame({'title':[['shark'], ['camel']]})
+    >>> matrix1, matrix2, vocabulary, idf = frames_to_matrices(frame, frame, 'title',\
+                                                               'title', legacy = False)
+    >>> matrix1.shape, vocabulary
+    ((2, 2), {'shark': 0, 'camel': 1})
+    '''
+
+    if legacy:
+        return (positional_matrix(frame1[key1]), positional_matrix(frame2[key2]),
+                None, None)
+    return shared_matrices(frame1[key1], frame2[key2], reference)
+
+def similarity_chunks_between_matrices(matrix1, matrix2, index, titles, chunk_size = None):
+    '''
+    Yields frames of similarities between the rows of two matrices
+with the given row index and one column per title of the second matrix.
+A repeated title keeps its first position and its last row.
+
+    >>> import numpy as np
+    >>> chunks = similarity_chunks_between_matrices(np.eye(2), np.eye(2), [7, 8],\
+                                                    ['Jaws', 'Jaws'])
+    >>> next(chunks)
+       Jaws
+    7   0.0
+    8   1.0
+    '''
+
+    columns = {}
+    for position, title in enumerate(titles):
+        columns[title] = position
+    positions = list(columns.values())
+    for start, block in similarity_chunks(matrix1, matrix2, chunk_size):
+        yield pd.DataFrame(block[:, positions], columns = list(columns),
+                           index = index[start:start + block.shape[0]])
+
+def positional_matrix(vectors):
+    '''
+    Returns a CSR matrix whose i-th row is the i-th legacy TF-IDF column
+vector, zero-padded to the length of the longest one.
+
+    >>> import numpy as np
+    >>> positional_matrix([np.array([[1.0], [2.0]]), np.array([[3.0]])]).toarray()
+    array([[1., 2.],
+           [3., 0.]])
+    '''
+
+    vectors = [np.ravel(vector) for vector in vectors]
+    lengths = np.array([vector.shape[0] for vector in vectors], dtype = np.int64)
+    indptr = np.concatenate(([0], np.cumsum(lengths)))
+    data = np.concatenate(vectors) if vectors else np.array([])
+    indices = np.arange(indptr[-1], dtype = np.int64) - np.repeat(indptr[:-1], lengths)
+    width = int(lengths.max()) if len(lengths) else 0
+    matrix = sparse.csr_matrix((data.astype(np.float64), indices, indptr),
+                               shape = (len(vectors), width))
+    matrix.eliminate_zeros()
+    return matrix
+
+def fit_vector_space(*corpora):
+    '''
+    Returns a vocabulary and inverse document frequences fitted
+on all documents of the given corpora together.
+
+    >>> vocabulary, idf = fit_vector_space([['shark'], ['camel']], [['shark']])
+    >>> vocabulary
+    {'shark': 0, 'camel': 1}
+    >>> idf.round(4)
+    array([0.4055, 1.0986])
+    '''
+
+    documents = [document for corpus in corpora for document in corpus]
+    vocabulary, document_frequences = build_vocabulary(documents)
+    return vocabulary, inverse_document_frequences(document_frequences, len(documents))
+
+def shared_matrices(documents1, documents2, reference = None):
+    '''
+    Returns TF-IDF matrices of two corpora projected into one term space,
+fitted on the reference corpus or, by default, on both corpora,
+together with the vocabulary and inverse document frequences of that space.
+
+    >>> matrix1, matrix2, _, _ = shared_matrices([['shark', 'camel']],\
+                                                 [['camel'], ['kamel']])
+    >>> matrix1.shape, matrix2.shape
+    ((1, 3), (2, 3))
+    >>> matrix1, matrix2, _, _ = shared_matrices([['shark', 'camel']], [['kamel']],\
+                                                 reference = [['shark'], ['camel']])
+    >>> matrix2.nnz
+    0
+    '''
+
+    if reference is None:
+        vocabulary, idf = fit_vector_space(documents1, documents2)
+    else:
+        vocabulary, idf = fit_vector_space(reference)
+    return (documents_to_tfidf_matrix(documents1, vocabulary, idf),
+            documents_to_tfidf_matrix(documents2, vocabulary, idf),
+            vocabulary, idf)
+
+def similarity_chunks(matrix1, matrix2, chunk_size = None):
+    '''
+    Yields (first row, dense block) pairs of cosine similarities between
+the rows of matrix1 and the rows of matrix2, at most chunk_size rows of
+matrix1 per block. Pairs involving a zero row are NaN.
+
+    >>> import numpy as np
+    >>> matrix1 = np.array([[1.0, 0.0], [1.0, 1.0], [0.0, 0.0]])
+    >>> matrix2 = np.array([[1.0, 0.0], [0.0, 2.0]])
+    >>> for start, block in similarity_chunks(matrix1, matrix2, chunk_size = 2):
+    ...     print(start, block.round(4).tolist())
+    0 [[1.0, 0.0], [0.7071, 0.7071]]
+    2 [[nan, nan]]
+    '''
+
+    normalized1, empty1 = normalization.normalize_rows(matrix1)
+    normalized2, empty2 = normalization.normalize_rows(matrix2)
+    width = max(normalized1.shape[1], normalized2.shape[1])
+    normalized1.resize((normalized1.shape[0], width))
+    normalized2.resize((normalized2.shape[0], width))
+    transposed = normalized2.T.tocsc()
+    rows = normalized1.shape[0]
+    chunk_size = chunk_size or max(rows, 1)
+    for start in range(0, rows, chunk_size):
+        stop = min(start + chunk_size, rows)
+        block = (normalized1[start:stop] @ transposed).toarray()
+        block[empty1[start:stop], :] = np.nan
+        block[:, empty2] = np.nan
+        yield start, block
+
+def similarity_matrix(matrix1, matrix2, chunk_size = None):
+    '''
+    Returns a dense array of cosine similarities between the rows
+of matrix1 and the rows of matrix2.
+
+    >>> import numpy as np
+    >>> similarity_matrix(np.array([[1.0, 1.0]]), np.array([[1.0, 1.0], [0.0, 1.0]])).round(4)
+    array([[1.    , 0.7071]])
+    '''
+
+    blocks = [block for _, block in similarity_chunks(matrix1, matrix2, chunk_size)]
+    if not blocks:
+        return np.zeros((0, sparse.csr_matrix(matrix2).shape[0]))
+    return np.vstack(blocks)
+
+def top_k_neighbours(chunks, titles, k = TOP_K):
+    '''
+    Returns a neighbour index with the k best books for every film,
+built from similarity chunks without keeping them all in memory.
+Chunks may be quantised by quantize_frame.
+Rows are ordered by film and then by descending score.
+
+    >>> import pandas as pd
+    >>> chunks = [pd.DataFrame({'Jaws':[0.2, 0.9], 'Dune':[0.5, 0.1]}),\
+                  pd.DataFrame({'Jaws':[0.4], 'Dune':[0.7]}, index = [2])]
+    >>> top_k_neighbours(chunks, pd.Series(['Big fish', 'Sea', 'Sand']), k = 2)
+       film  book     title  score
+    0  Jaws     1       Sea    0.9
+    1  Jaws     2      Sand    0.4
+    2  Dune     2      Sand    0.7
+    3  Dune     0  Big fish    0.5
+    '''
+
+    films = None
+    best_scores = None
+    best_books = None
+    for chunk in chunks:
+        scores = np.nan_to_num(frame_scores(chunk), nan = -np.inf)
+        books = np.repeat(chunk.index.to_numpy()[:, None], scores.shape[1], axis = 1)
+        if films is None:
+            films = list(chunk.columns)
+        best_scores, best_books = merge_top_k(best_scores, best_books, scores, books, k)
+
+    if films is None:
+        return pd.DataFrame(columns = ['film', 'book', 'title', 'score'])
+    return neighbours_frame(best_scores, best_books, films, titles)
+
+def merge_top_k(best_scores, best_books, scores, books, k):
+    '''
+    Returns scores and books of the k best rows in every column of
+the best rows so far followed by new rows. Missing scores are -inf.
+Ties keep the earlier row, so rows must come in order of books.
+
+    >>> import numpy as np
+    >>> merge_top_k(np.array([[0.5]]), np.array([[0]]),\
+                    np.array([[0.5], [0.9]]), np.array([[1], [2]]), 2)
+    (array([[0.9],
+           [0.5]]), array([[2],
+           [0]]))
+    '''
+
+    if best_scores is not None:
+        scores = np.vstack((best_scores, scores))
+        books = np.vstack((best_books, books))
+    order = np.argsort(-scores, axis = 0, kind = 'stable')[:k]
+    return np.take_along_axis(scores, order, axis = 0), np.take_along_axis(books, order, axis = 0)
+
+def neighbours_frame(best_scores, best_books, films, titles):
+    '''
+    Returns a neighbour index frame of k x films arrays of the best scores
+and books, skipping missing (-inf) scores and books sharing no term with
+their film (zero scores), which the inverted index never finds either.
+
+    >>> import numpy as np
+    >>> import pandas as pd
+    >>> neighbours_frame(np.array([[0.9, 0.0], [-np.inf, 0.0]]), np.array([[1, 0], [0, 1]]),\
+                         ['Jaws', 'Dune'], pd.Series(['Sand', 'Sea']))
+       film  book title  score
+    0  Jaws     1   Sea    0.9
+    '''
+
+    found = best_scores.T > 0
+    books = best_books.T[found]
+    return pd.DataFrame({'film':np.repeat(films, found.sum(axis = 1)),
+                         'book':books,
+                         'title':titles.loc[books].to_numpy(),
+                         'score':best_scores.T[found]})
+
+def find_best_matches(neighbours, title, top = 5, index = None):
     '''
     Returns a list of books that best match
-the films from the user's history.
+the films from the user's history. With an inverted index of books
+(inverted.load_indexes), films missing from the neighbour index are
+matched by the words of their title.
 
     >>> import pandas as pd
     >>> data = pd.DataFrame(data = {'title':['The prince','C for dummies',\
                             'Python as a way up in the social hierarchy',\
                             'Big bad computer science'],\
                             'No way around the corner':[0.5, 0.9, 0.567, 0.3456]})
-    >>> find_best_matches(data, 'No way around the corner')[0]
+    >>> neighbours = top_k_neighbours([data[['No way around the corner']]], data['title'])
+    >>> find_best_matches(neighbours, 'No way around the corner')[0]
     'C for dummies'
     '''
 
-    results = similarities[title]
-    results = [similarities.iloc[name]['title']
-               for name in results.nlargest(5).index.to_list()]
+    results = neighbours[neighbours['film'] == title]
+    if index is not None and results.empty:
+        return inverted.title_best_matches(index, title, top)
+    return results['title'][:top].to_list()
+
+def history_best_matches(neighbours, history, top = 5):
+    '''
+    Returns a list of books with the highest similarity summed over
+all films of the history and all given neighbour indexes.
+
+    >>> import pandas as pd
+    >>> neighbours = pd.DataFrame({'film':['Jaws', 'Jaws', 'Dune'],\
+                                   'book':[0, 1, 1],\
+                                   'title':['Sea', 'Sand', 'Sand'],\
+                                   'score':[0.9, 0.5, 0.7]})
+    >>> history_best_matches([neighbours], ['Jaws', 'Dune'])
+    ['Sand', 'Sea']
+    '''
+
+    neighbours = pd.concat(neighbours)
+    neighbours = neighbours[neighbours['film'].isin(history)]
+    scores = neighbours.groupby('book')['score'].sum().nlargest(top)
+    titles = neighbours.drop_duplicates('book').set_index('book')['title']
+    return titles.loc[scores.index].to_list()
+
+def films_best_matches(neighbours, history, top = 5, cache = None, version = None,
+                       indexes = None):
+    '''
+    Returns the best books for every film of a history by every criterion
+of the given dictionary criterion -> neighbour index. With a cache of
+the caching module, results are kept by (criterion, film, top) for the
+given version of the neighbour indexes. indexes are inverted indexes
+by criterion for films missing from the neighbour indexes.
+
+    >>> import pandas as pd
+    >>> neighbours = pd.DataFrame({'film':['Jaws', 'Jaws', 'Dune'],\
+                                   'book':[0, 1, 1],\
+                                   'title':['Sea', 'Sand', 'Sand'],\
+                                   'score':[0.9, 0.5, 0.7]})
+    >>> films_best_matches({'td':neighbours}, ['Jaws', 'Dune'], top = 1)
+    {'td': {'Jaws': ['Sea'], 'Dune': ['Sand']}}
+    '''
+
+    indexes = indexes or {}
+    if cache is None:
+        return {criterion:{film:find_best_matches(frame, film, top, indexes.get(criterion))
+                           for film in history}
+                for criterion, frame in neighbours.items()}
+    return {criterion:{film:list(caching.lookup(cache, (criterion, film, top),
+                                                lambda frame = frame, film = film,
+                                                       criterion = criterion:
+                                                find_best_matches(frame, film, top,
+                                                                  indexes.get(criterion)),
+                                                version))
+                       for film in history}
+            for criterion, frame in neighbours.items()}
+
+def film_matches(neighbours, criterion, history, top = 5, cache = None, indexes = None):
+    '''
+    Yields (film, best books) pairs for the distinct films of a history
+by one criterion of the given dictionary criterion -> neighbour index,
+finding the books of a film only when its pair is asked for. With a cache,
+books are kept by (criterion, film, top) like films_best_matches does.
+indexes is a function returning inverted indexes by criterion, called only
+for films missing from the neighbour index.
+
+    >>> import pandas as pd
+    >>> neighbours = pd.DataFrame({'film':['Jaws', 'Jaws', 'Dune'],\
+                                   'book':[0, 1, 1],\
+                                   'title':['Sea', 'Sand', 'Sand'],\
+                                   'score':[0.9, 0.5, 0.7]})
+    >>> matches = film_matches({'td':neighbours}, 'td', ['Jaws', 'Dune', 'Jaws'], top = 1)
+    >>> next(matches)
+    ('Jaws', ['Sea'])
+    >>> list(matches)
+    [('Dune', ['Sand'])]
+    '''
+
+    frame = neighbours[criterion]
+    def compute(film):
+        books = find_best_matches(frame, film, top)
+        if not books and indexes is not None:
+            books = find_best_matches(frame, film, top, indexes().get(criterion))
+        return books
+
+    for film in dict.fromkeys(history):
+        if cache is None:
+            yield film, compute(film)
+        else:
+            yield film, list(caching.lookup(cache, (criterion, film, top),
+                                            lambda film = film: compute(film)))
+
+def recommend(neighbours, history, top = 5):
+    '''
+    Returns the books recommended for a history: the best books for
+the whole history and the best books for every film by every criterion
+of the given dictionary criterion -> neighbour index.
+
+    >>> import pandas as pd
+    >>> neighbours = pd.DataFrame({'film':['Jaws', 'Jaws', 'Dune'],\
+                                   'book':[0, 1, 1],\
+                                   'title':['Sea', 'Sand', 'Sand'],\
+                                   'score':[0.9, 0.5, 0.7]})
+    >>> recommend({'td':neighbours}, ['Jaws', 'Dune'], top = 1)
+    {'history': ['Jaws', 'Dune'], 'general': ['Sand'], \
+'criteria': {'td': {'Jaws': ['Sea'], 'Dune': ['Sand']}}}
+    '''
 
-    return results
+    return {'history':list(history),
+            'general':history_best_matches(list(neighbours.values()), history, top),
+            'criteria':films_best_matches(neighbours, history, top)}
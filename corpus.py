@@ -0,0 +1,202 @@
+'''
+Compact storage of tokenized document columns.
+
+A corpus is a dictionary of an interned vocabulary, words (word -> id in
+order of first appearance, usually shared by several corpora), the int32
+ids of all tokens one document after another and the int64 offsets of the
+documents in the tokens, like the indptr of a CSR matrix: document i is
+tokens[offsets[i]:offsets[i + 1]]. Counting words is a bincount over the
+ids, and vocabularies and TF-IDF matrices are the ones computations builds
+from lists of words.
+'''
+
+import numpy as np
+from scipy import sparse
+from recommandation_engine_2023 import cleaning
+
+def _corpus(words, ids, lengths):
+    '''
+    Returns a corpus of token ids and document lengths.
+    '''
+    return {'words':words, 'tokens':np.array(ids, dtype = np.int32),
+            'offsets':np.concatenate(([0], np.cumsum(lengths, dtype = np.int64)))}
+
+def from_documents(documents, words = None):
+    '''
+    Returns a corpus of documents given as lists of words, interning
+new words into words.
+
+    >>> corpus = from_documents([['shark', 'camel', 'shark'], [], ['camel']])
+    >>> corpus['words'], corpus['tokens'], corpus['offsets']
+    ({'shark': 0, 'camel': 1}, array([0, 1, 0, 1], dtype=int32), array([0, 3, 3, 4]))
+    '''
+    words = {} if words is None else words
+    ids = []
+    lengths = []
+    for document in documents:
+        ids.extend(words.setdefault(word, len(words)) for word in document)
+        lengths.append(len(document))
+    return _corpus(words, ids, lengths)
+
+def from_cells(cells, stop_words = frozenset(), words = None):
+    '''
+    Returns a corpus of raw text cells tokenized like cleaning.tokenize,
+without keeping lists of words.
+
+    >>> to_lists(from_cells(['SHARK and camel', ''], frozenset(['and'])))
+    [['shark', 'camel'], ['None']]
+    '''
+    words = {} if words is None else words
+    ids = []
+    lengths = []
+    for cell in cells:
+        document = cleaning.tokenize(cell, stop_words)
+        ids.extend(words.setdefault(word, len(words)) for word in document)
+        lengths.append(len(document))
+    return _corpus(words, ids, lengths)
+
+def to_lists(corpus, start = 0, stop = None):
+    '''
+    Returns the documents start to stop of a corpus as lists of words.
+
+    >>> to_lists(from_documents([['shark'], ['camel', 'shark']]), 1)
+    [['camel', 'shark']]
+    '''
+    names = np.array(list(corpus['words']), dtype = object)
+    offsets = corpus['offsets'][start:None if stop is None else stop + 1]
+    return [names[corpus['tokens'][offsets[position]:offsets[position + 1]]].tolist()
+            for position in range(len(offsets) - 1)]
+
+def lengths(corpus):
+    '''
+    Returns the number of words of every document.
+    '''
+    return np.diff(corpus['offsets'])
+
+def select(corpus, mask):
+    '''
+    Returns a corpus of the documents of a boolean mask.
+
+    >>> to_lists(select(from_documents([['shark'], ['camel'], ['kamel']]),\
+                        np.array([True, False, True])))
+    [['shark'], ['kamel']]
+    '''
+    mask = np.asarray(mask, dtype = bool)
+    return _corpus(corpus['words'], corpus['tokens'][np.repeat(mask, lengths(corpus))],
+                   lengths(corpus)[mask])
+
+def concatenate(corpora, words = None):
+    '''
+    Returns one corpus of the documents of several corpora, mapping
+their ids into words. Corpora of other vocabularies are remapped.
+
+    >>> first = from_documents([['shark']])
+    >>> joined = concatenate([first, from_documents([['camel', 'shark']])], first['words'])
+    >>> joined['tokens'], to_lists(joined)
+    (array([0, 1, 0], dtype=int32), [['shark'], ['camel', 'shark']])
+    '''
+    words = {} if words is None else words
+    tokens = []
+    document_lengths = []
+    for corpus in corpora:
+        if corpus['words'] is words:
+            tokens.append(corpus['tokens'])
+        else:
+            mapping = np.array([words.setdefault(word, len(words))
+                                for word in corpus['words']], dtype = np.int32)
+            tokens.append(mapping[corpus['tokens']])
+        document_lengths.append(lengths(corpus))
+    return _corpus(words, np.concatenate(tokens or [np.zeros(0, dtype = np.int32)]),
+                   np.concatenate(document_lengths or [np.zeros(0, dtype = np.int64)]))
+
+def nbytes(corpus):
+    '''
+    Returns the bytes of the token ids and offsets of a corpus.
+    '''
+    return corpus['tokens'].nbytes + corpus['offsets'].nbytes
+
+def term_frequences(corpus):
+    '''
+    Returns the number of occurrences of every word id in a corpus.
+
+    >>> term_frequences(from_documents([['shark', 'camel', 'shark']]))
+    array([2, 1])
+    '''
+    return np.bincount(corpus['tokens'], minlength = len(corpus['words']))
+
+def term_frequence(corpus, word):
+    '''
+    Returns an array of the frequences of a word in every document
+like computations.term_frequence.
+
+    >>> term_frequence(from_documents([['shark', 'shark'], ['camel']]), 'shark')
+    array([2., 0.])
+    '''
+    rows = np.repeat(np.arange(len(corpus['offsets']) - 1), lengths(corpus))
+    return np.bincount(rows[corpus['tokens'] == corpus['words'].get(word, -1)],
+                       minlength = len(corpus['offsets']) - 1).astype(np.float64)
+
+def _pairs(tokens, rows, width):
+    '''
+    Returns the distinct (row, column) pairs of tokens as keys, in order
+of first appearance, with the number of times they appear.
+    '''
+    keys = rows.astype(np.int64) * width + tokens
+    keys, first, counts = np.unique(keys, return_index = True, return_counts = True)
+    order = np.argsort(first, kind = 'stable')
+    return keys[order], counts[order]
+
+def build_vocabulary(*corpora):
+    '''
+    Returns the vocabulary (word -> column), the document frequences and
+the column of every word id (-1 for none) of corpora sharing their words,
+like computations.build_vocabulary of all their documents in turn.
+
+    >>> first = from_documents([['shark', 'shark'], ['None']])
+    >>> vocabulary, frequences, columns = build_vocabulary(first,\
+                                                           from_documents([['camel', 'shark']],\
+                                                                          first['words']))
+    >>> vocabulary, frequences, columns
+    ({'shark': 0, 'camel': 1}, array([2, 1]), array([ 0, -1,  1]))
+    '''
+    words = corpora[0]['words']
+    tokens = np.concatenate([corpus['tokens'] for corpus in corpora])
+    rows = np.repeat(np.arange(sum(len(corpus['offsets']) - 1 for corpus in corpora)),
+                     np.concatenate([lengths(corpus) for corpus in corpora]))
+    ids, first = np.unique(tokens, return_index = True)
+    ids = ids[np.argsort(first, kind = 'stable')]
+    ids = ids[ids != words.get('None', -1)]
+
+    frequences = np.zeros(len(words), dtype = np.int64)
+    if len(tokens):
+        keys, _ = _pairs(tokens, rows, len(words))
+        frequences = np.bincount(keys % len(words), minlength = len(words))
+    columns = np.full(len(words), -1, dtype = np.int64)
+    columns[ids] = np.arange(len(ids))
+    names = list(words)
+    return ({names[word]:column for column, word in enumerate(ids)},
+            frequences[ids].astype(np.int64), columns)
+
+def tfidf_matrix(corpus, columns, idf):
+    '''
+    Returns a CSR matrix (documents x vocabulary) of TF-IDF weights like
+computations.documents_to_tfidf_matrix, given the column of every word id.
+
+    >>> corpus = from_documents([['shark', 'shark'], ['camel']])
+    >>> vocabulary, frequences, columns = build_vocabulary(corpus)
+    >>> tfidf_matrix(corpus, columns, np.array([0.5, 2.0])).toarray()
+    array([[1., 0.],
+           [0., 2.]])
+    '''
+    documents = len(corpus['offsets']) - 1
+    width = len(idf)
+    rows = np.repeat(np.arange(documents), lengths(corpus))
+    tokens = columns[corpus['tokens']]
+    known = tokens >= 0
+    keys, counts = _pairs(tokens[known], rows[known], max(width, 1))
+    indices = keys % max(width, 1)
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(keys // max(width, 1),
+                                                         minlength = documents))))
+    return sparse.csr_matrix((counts * np.asarray(idf, dtype = np.float64)[indices],
+                              indices.astype(np.int64), indptr.astype(np.int64)),
+                             shape = (documents, width))
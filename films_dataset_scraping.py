@@ -1,80 +1,378 @@
 '''
 The module scrapes top 250 films on imdb.
+
+Pages are fetched concurrently by a pool of threads sharing one pooled
+requests session, with at most rate requests per second to a host and
+retries with exponential backoff. Responses are cached on disk by URL
+together with their ETag and Last-Modified headers: cached pages younger
+than max_age are not requested again, older ones are revalidated and only
+pages that changed are downloaded and parsed again.
 '''
 
+import os
+import re
+import json
+import html
+import time
+import asyncio
+import hashlib
+import argparse
+import threading
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urljoin, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, SoupStrainer
 import pandas as pd
+PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+
+CHART = 'https://www.imdb.com/chart/top/?ref_=nv_mv_250'
+CACHE_DIRECTORY = '.scraping_cache'
+CONCURRENCY = 8
+RATE = 4.0
+RETRIES = 3
+BACKOFF = 0.5
+MAX_AGE = 24 * 60 * 60
+COLUMNS = ['Title', 'People', 'Desc', 'Genre', 'Date']
+FIELDS = SoupStrainer('div', class_ = ['originalTitle', 'summary_text',
+                                       'credit_summary_item', 'subtext'])
+TITLE = re.compile(r'<title[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL)
 
-def main():
+def main(options = None):
     '''
     Gets data about films.
 
     >>> main()
 
     '''
-    sites = ['https://www.imdb.com/chart/top/?ref_=nv_mv_250']
-    films_dataframe = pd.DataFrame({'Title':[], 'People':[],
-                                        'Desc':[],'Genre':[],'Date':[]})
-    for site in sites:
-        #Requesting site with top 250 films and aprsing it. Getting needed content.
-        imdb_site = requests.get(site)
-        soup = BeautifulSoup(imdb_site.content, 'html.parser')
-        table = soup.find_all('td', class_ = 'titleColumn')
-        table = [list(film.children)[1] for film in table]
-        table = [film.get('href') for film in table]
-        table = ['https://www.imdb.com/'+film for film in table]
-
-        titles = []
-        humanity = []
-        descriptions = []
-        genre = []
-        dates = []
-        #Looping over links for the films and collecting
-    #needed data
-        for link in table:
-            page = requests.get(link)
-            soup = BeautifulSoup(page.content, 'html.parser')
-            book_title = soup.find_all('div', class_ ='originalTitle')
-            if book_title == []:
-                book_title = str(soup.title)
-                book_title = book_title[book_title.find('<title>')+7:book_title.find(' (')]
-            else:
-                book_title = book_title[0].text
-            book_title = book_title[:book_title.find(' (original title)')].strip()
-
-            #Getting description of the film.
-            summary = soup.find_all('div', class_ ='summary_text')
-            summary = [child.text for child in summary]
-            summary = summary[0].strip()
-
-            #Getting info about people involved in film creation.
-            people = soup.find_all('div', class_ ='credit_summary_item')
-            people = [human.text for person in people for human in person.find_all('a')]
-            subtext = soup.find_all('div', class_ ='subtext')
-            subtext = subtext[0].find_all('a')
-            subtext = [line.text for line in subtext]
-
-            #Getting data from the subtext array.
-            date = subtext.pop()
+    options = options or parse_arguments([])
+    timings = []
+    films_dataframe = asyncio.run(scrape(options.chart, options.cache, options.concurrency,
+                                         options.rate, options.retries, options.max_age,
+                                         options.parse_workers, timings))
+    films_dataframe.to_csv(options.output)
+    if timings:
+        print(f'Parsed {len(timings)} pages with {PARSER}: '
+              f'{1000 * sum(timings) / len(timings):.1f} ms per page, '
+              f'{1000 * max(timings):.1f} ms at most')
+
+def parse_chart(content, chart = CHART):
+    '''
+    Returns links to the films of a chart page.
+
+    >>> parse_chart(b'<td class="titleColumn"> <a href="/title/tt1/">Jaws</a></td>',\
+                    'http://localhost/chart/')
+    ['http://localhost/title/tt1/']
+    '''
+    soup = BeautifulSoup(content, 'html.parser')
+    table = soup.find_all('td', class_ = 'titleColumn')
+    table = [list(film.children)[1] for film in table]
+    return [urljoin(chart, film.get('href')) for film in table]
+
+def parse_film(content, parser = PARSER):
+    '''
+    Returns the title, people, description, genre and date of a film page.
+Only the title and the divs holding the fields are parsed; missing
+fields are left empty.
+
+    >>> parse_film('<title>Jaws (1975) - IMDb</title><div class="subtext"><a>Thriller</a></div>')
+    {'Title': 'Jaws', 'People': '', 'Desc': '', 'Genre': '', 'Date': 'Thriller'}
+    '''
+    if isinstance(content, bytes):
+        content = content.decode('utf-8', errors = 'replace')
+    soup = BeautifulSoup(content, parser, parse_only = FIELDS)
+    fields = {}
+    for div in soup.find_all('div'):
+        for name in div.get('class', []):
+            fields.setdefault(name, []).append(div)
+
+    if 'originalTitle' in fields:
+        book_title = fields['originalTitle'][0].text
+    else:
+        book_title = TITLE.search(content)
+        book_title = html.unescape(book_title.group(1)) if book_title else ''
+    book_title = book_title.split(' (')[0].strip()
+
+    #Getting description of the film.
+    summary = [child.text.strip() for child in fields.get('summary_text', [])]
+    summary = summary[0] if summary else ''
+
+    #Getting info about people involved in film creation.
+    people = [human.text for person in fields.get('credit_summary_item', [])
+              for human in person.find_all('a')]
+    subtext = fields.get('subtext', [])
+    subtext = [line.text for line in subtext[0].find_all('a')] if subtext else []
+
+    #Getting data from the subtext array.
+    date = subtext.pop().split(' ') if subtext else ['']
+    date = date[2] if len(date) > 2 else date[0]
+
+    return {'Title':book_title, 'People':'|'.join(people), 'Desc':summary,
+            'Genre':'|'.join(subtext), 'Date':date}
+
+def timed_parse_film(content, parser = PARSER):
+    '''
+    Returns parse_film of a page and the seconds it took.
+    '''
+    start = time.perf_counter()
+    row = parse_film(content, parser)
+    return row, time.perf_counter() - start
+
+def new_session(concurrency = CONCURRENCY):
+    '''
+    Returns a requests session keeping up to concurrency connections per host.
+    '''
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections = concurrency, pool_maxsize = concurrency)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def cache_paths(directory, url):
+    '''
+    Returns the paths of the cached body and headers of a URL.
+    '''
+    key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    return os.path.join(directory, key + '.html'), os.path.join(directory, key + '.json')
+
+def read_cache(directory, url):
+    '''
+    Returns the cached body and metadata of a URL, (None, {}) when missing.
+    '''
+    body_path, meta_path = cache_paths(directory, url)
+    try:
+        with open(meta_path, 'r', encoding = 'utf-8') as file:
+            meta = json.load(file)
+        with open(body_path, 'rb') as file:
+            return file.read(), meta
+    except (OSError, ValueError):
+        return None, {}
+
+def write_cache(directory, url, body, meta):
+    '''
+    Saves the body and metadata of a URL, replacing older ones atomically.
+    '''
+    os.makedirs(directory, exist_ok = True)
+    body_path, meta_path = cache_paths(directory, url)
+    if body is not None:
+        with open(body_path + '.tmp', 'wb') as file:
+            file.write(body)
+        os.replace(body_path + '.tmp', body_path)
+    with open(meta_path + '.tmp', 'w', encoding = 'utf-8') as file:
+        json.dump(meta, file, ensure_ascii = False)
+    os.replace(meta_path + '.tmp', meta_path)
+
+def fetch(session, url, directory = CACHE_DIRECTORY, max_age = MAX_AGE):
+    '''
+    Returns the body of a URL, whether it changed since it was cached
+and its cache metadata. Cached bodies younger than max_age seconds are
+returned without a request, older ones are revalidated with their ETag
+and Last-Modified headers.
+    '''
+    body, meta = read_cache(directory, url)
+    if body is not None and time.time() - meta.get('checked', 0) < max_age:
+        return body, False, meta
+
+    headers = {}
+    if body is not None and meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if body is not None and meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    response = session.get(url, headers = headers, timeout = 30)
+    if response.status_code == 304 and body is not None:
+        meta['checked'] = time.time()
+        write_cache(directory, url, None, meta)
+        return body, False, meta
+    response.raise_for_status()
+    meta = {'url':url, 'checked':time.time(), 'etag':response.headers.get('ETag'),
+            'last_modified':response.headers.get('Last-Modified')}
+    write_cache(directory, url, response.content, meta)
+    return response.content, True, meta
+
+def new_limiter(rate = RATE):
+    '''
+    Returns a rate limiter allowing rate requests per second to every host.
+    '''
+    return {'interval':1 / rate if rate else 0.0, 'next':{}, 'lock':asyncio.Lock()}
+
+async def wait_turn(limiter, url):
+    '''
+    Waits until a request to the host of a URL is allowed.
+    '''
+    host = urlsplit(url).netloc
+    async with limiter['lock']:
+        now = time.monotonic()
+        start = max(now, limiter['next'].get(host, now))
+        limiter['next'][host] = start + limiter['interval']
+    await asyncio.sleep(start - now)
+
+async def fetch_async(session, url, limiter, semaphore, directory = CACHE_DIRECTORY,
+                      retries = RETRIES, max_age = MAX_AGE):
+    '''
+    Returns fetch of a URL run in a thread, retrying connection errors,
+429 and 5xx answers with exponential backoff. Requests answered from
+the cache do not wait for the rate limiter. The cache is read in a thread
+too, so that the event loop never waits for the disk.
+    '''
+    loop = asyncio.get_running_loop()
+    async with semaphore:
+        body, meta = await loop.run_in_executor(None, read_cache, directory, url)
+        if body is not None and time.time() - meta.get('checked', 0) < max_age:
+            return body, False, meta
+        for attempt in range(retries + 1):
+            await wait_turn(limiter, url)
+            try:
+                return await loop.run_in_executor(None, fetch, session, url,
+                                                  directory, max_age)
+            except requests.RequestException as error:
+                status = getattr(error.response, 'status_code', None)
+                if attempt == retries or (status and status < 500 and status != 429):
+                    raise
+                await asyncio.sleep(BACKOFF * 2 ** attempt)
+
+async def scrape(chart = CHART, directory = CACHE_DIRECTORY, concurrency = CONCURRENCY,
+                 rate = RATE, retries = RETRIES, max_age = MAX_AGE, workers = None,
+                 timings = None):
+    '''
+    Returns a frame of the films of a chart in chart order. Every page is
+parsed as soon as it arrives by a pool of workers processes (threads for 0);
+only pages that changed since their row was cached are parsed and their
+parse seconds are appended to the timings list. Pages that cannot be
+fetched are reported and skipped, pages missing fields are reported.
+
+    >>> import tempfile
+    >>> film = '<div class="originalTitle">Jaws (original title)</div>\
+<div class="summary_text">Shark</div>\
+<div class="credit_summary_item"><a>Spielberg</a></div>\
+<div class="subtext"><a>Thriller</a><a>20 June 1975</a></div>'
+    >>> server = stub_server({'/chart/': '<td class="titleColumn"> <a href="/jaws/">J</a></td>',\
+                              '/jaws/': film})
+    >>> chart = f'http://127.0.0.1:{server.server_address[1]}/chart/'
+    >>> directory = tempfile.mkdtemp()
+    >>> timings = []
+    >>> asyncio.run(scrape(chart, directory, max_age = 0, workers = 0,\
+                           timings = timings)).to_dict('records')
+    [{'Title': 'Jaws', 'People': 'Spielberg', 'Desc': 'Shark', 'Genre': 'Thriller', \
+'Date': '1975'}]
+    >>> asyncio.run(scrape(chart, directory, max_age = 0, workers = 0,\
+                           timings = timings))['Title'].to_list()
+    ['Jaws']
+    >>> len(timings)
+    1
+    >>> server.requests
+    {'200': 2, '304': 2}
+    >>> server.shutdown()
+    '''
+    session = new_session(concurrency)
+    limiter = new_limiter(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+    pool = ProcessPoolExecutor(workers) if workers != 0 else None
+    timings = [] if timings is None else timings
+    loop = asyncio.get_running_loop()
+    try:
+        body, _, _ = await fetch_async(session, chart, limiter, semaphore, directory,
+                                       retries, max_age)
+        links = parse_chart(body, chart)
+
+        async def film(link):
+            body, changed, meta = await fetch_async(session, link, limiter, semaphore,
+                                                    directory, retries, max_age)
+            if changed or not meta.get('row'):
+                meta['row'], seconds = await loop.run_in_executor(pool, timed_parse_film,
+                                                                  body)
+                await loop.run_in_executor(None, write_cache, directory, link, None, meta)
+                timings.append(seconds)
+                missing = [field for field in COLUMNS if not meta['row'][field]]
+                if missing:
+                    print(f'Missing {", ".join(missing)} in {link}')
+            return meta['row']
+
+        tasks = [asyncio.ensure_future(film(link)) for link in links]
+        rows = {}
+        for link, task in zip(links, tasks):
             try:
-                date = date.split(' ')[2]
-            except IndexError:
-                date = date.split(' ')[0]
+                rows[link] = await task
+            except requests.RequestException as error:
+                print(f'Skipping {link}: {error!r}')
+    finally:
+        session.close()
+        if pool:
+            pool.shutdown()
+    return pd.DataFrame([rows[link] for link in links if link in rows], columns = COLUMNS)
 
-            titles.append(book_title)
-            dates.append(date)
-            genre.append('|'.join(subtext))
-            descriptions.append(summary)
-            humanity.append('|'.join(people))
+def stub_server(pages):
+    '''
+    Starts a local HTTP server in a thread answering GET requests with
+the fixture HTML of a dictionary path -> page, with ETag revalidation,
+for trying the scraper offline. It counts its answers by status code
+in its requests attribute.
+    '''
+    def handler(*arguments):
+        return _StubHandler(pages, server, *arguments)
 
-        #Creating a dataframe with data collected from a site and concating it
-    #with the a dataframe for all films.
-        films_dataframe_part = pd.DataFrame({'Title':titles, 'People':humanity,
-                                        'Desc':descriptions,'Genre':genre,'Date':dates})
-        films_dataframe = pd.concat([films_dataframe,films_dataframe_part])
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.requests = {}
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server
 
-    films_dataframe.to_csv('films_imdb.csv')
+class _StubHandler(BaseHTTPRequestHandler):
+    '''
+    Answers requests of stub_server.
+    '''
+    def __init__(self, pages, server, *arguments):
+        self.pages = pages
+        self.stub = server
+        super().__init__(*arguments)
+
+    def do_GET(self):
+        '''
+        Sends a fixture page, 304 when the ETag matches or 404.
+        '''
+        page = self.pages.get(self.path)
+        if page is None:
+            status, body = 404, b''
+        else:
+            body = page.encode('utf-8')
+            etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+            status = 304 if self.headers.get('If-None-Match') == etag else 200
+        self.stub.requests[str(status)] = self.stub.requests.get(str(status), 0) + 1
+        self.send_response(status)
+        if page is not None:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body) if status == 200 else 0))
+        self.end_headers()
+        if status == 200:
+            self.wfile.write(body)
+
+    def log_message(self, *arguments):
+        '''
+        Keeps the stub server quiet.
+        '''
+
+def parse_arguments(arguments = None):
+    '''
+    Parses command line arguments of the scraper.
+
+    >>> parse_arguments(['--concurrency', '4']).concurrency
+    4
+    '''
+    parser = argparse.ArgumentParser(description = 'Scrape the top 250 films on imdb.')
+    parser.add_argument('--chart', default = CHART, help = 'url of the chart of films')
+    parser.add_argument('--output', default = 'films_imdb.csv')
+    parser.add_argument('--cache', default = CACHE_DIRECTORY,
+                        help = 'directory of cached pages')
+    parser.add_argument('--concurrency', type = int, default = CONCURRENCY,
+                        help = 'most requests in flight')
+    parser.add_argument('--rate', type = float, default = RATE,
+                        help = 'most requests per second to a host')
+    parser.add_argument('--retries', type = int, default = RETRIES)
+    parser.add_argument('--parse-workers', type = int, default = None,
+                        help = 'processes parsing pages, 0 for threads')
+    parser.add_argument('--max-age', type = float, default = MAX_AGE,
+                        help = 'seconds a cached page is used without revalidation')
+    return parser.parse_args(arguments)
 
 if __name__ == '__main__':
-    main()
+    main(parse_arguments())
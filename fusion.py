@@ -0,0 +1,105 @@
+'''
+Weighted fusion of the similarity criteria.
+
+The film x book scores of all criteria are stacked side by side into one
+CSR matrix, so the scores of a history for every criterion come out of a
+single sparse product as a contiguous criteria x books array. Criteria are
+optionally normalised, weighted and summed, and the best books are picked
+with argpartition. With equal weights and no normalisation the result is
+the one of computations.history_best_matches.
+'''
+
+import numpy as np
+from scipy import sparse
+from recommandation_engine_2023 import batch
+
+NORMALISATIONS = ('none', 'max', 'sum')
+
+def load_fusion(store, criteria = None):
+    '''
+    Returns a fusion model of a store: its criteria, the stacked
+film x (criteria x books) scores, film ids and book titles.
+    '''
+    criteria = list(criteria or store['metadata']['criteria'])
+    return {'criteria':criteria,
+            'scores':sparse.hstack([batch.criterion_scores(store, criterion)
+                                    for criterion in criteria], format = 'csr'),
+            'ids':batch.film_ids(store['arrays']['films']),
+            'books':store['arrays']['books']}
+
+def parse_weights(weights, criteria):
+    '''
+    Returns an array of criterion weights from a dictionary criterion -> weight.
+Missing criteria weigh 1.
+
+    >>> parse_weights({'ttl':0.5}, ['td', 'ttl'])
+    array([1. , 0.5])
+    >>> parse_weights({'genre':2}, ['td'])
+    Traceback (most recent call last):
+    ...
+    ValueError: Unknown criteria: genre.
+    '''
+    weights = dict(weights or {})
+    unknown = set(weights) - set(criteria)
+    if unknown:
+        raise ValueError(f'Unknown criteria: {", ".join(sorted(unknown))}.')
+    return np.array([float(weights.get(criterion, 1.0)) for criterion in criteria])
+
+def normalise(tensor, normalisation = 'none'):
+    '''
+    Returns criteria x books scores with every criterion divided by its
+largest ('max') or total ('sum') score.
+
+    >>> normalise(np.array([[1.0, 3.0], [0.0, 0.0]]), 'max')
+    array([[0.33333333, 1.        ],
+           [0.        , 0.        ]])
+    '''
+    if normalisation not in NORMALISATIONS:
+        raise ValueError(f'Unknown normalisation: {normalisation}.')
+    if normalisation == 'none':
+        return tensor
+    scale = tensor.max(axis = 1) if normalisation == 'max' else tensor.sum(axis = 1)
+    scale[scale == 0] = 1.0
+    return tensor / scale[:, None]
+
+def fused_top(fusion, history, top = 5, weights = None, normalisation = 'none'):
+    '''
+    Returns the best book titles and fused scores for a history.
+Only books that are neighbours of a film of the history are recommended;
+equal scores are ordered by book id.
+
+    >>> import tempfile
+    >>> from recommandation_engine_2023 import artifacts
+    >>> directory = tempfile.mkdtemp()
+    >>> artifacts.save_artifacts(directory, {'films':['Jaws'], 'books':['Sea', 'Sand'],\
+                                             'td.film':np.array([0, 0]),\
+                                             'td.book':np.array([0, 1]),\
+                                             'td.score':np.array([0.5, 0.25]),\
+                                             'ttl.film':np.array([0]),\
+                                             'ttl.book':np.array([1]),\
+                                             'ttl.score':np.array([0.5])},\
+                                 metadata = {'criteria':{'td':[], 'ttl':[]}})
+    >>> fusion = load_fusion(artifacts.load_artifacts(directory))
+    >>> fused_top(fusion, ['Jaws'])
+    (['Sand', 'Sea'], [0.75, 0.5])
+    >>> fused_top(fusion, ['Jaws'], weights = {'ttl':0})
+    (['Sea', 'Sand'], [0.5, 0.25])
+    '''
+    weights = parse_weights(weights, fusion['criteria'])
+    films = sorted({fusion['ids'][film] for film in history if film in fusion['ids']})
+    indicator = sparse.csr_matrix((np.ones(len(films)), (np.zeros(len(films)), films)),
+                                  shape = (1, fusion['scores'].shape[0]))
+    product = indicator @ fusion['scores']
+    tensor = product.toarray().reshape(len(weights), -1)
+    present = np.zeros(tensor.shape[1], dtype = bool)
+    present[product.indices % tensor.shape[1]] = True
+    fused = weights @ normalise(tensor, normalisation)
+
+    candidates = np.flatnonzero(present)
+    if len(candidates) > top:
+        candidates = candidates[np.argpartition(-fused[candidates], top - 1)[:top]]
+        #Books tied with the last candidate may have been left out.
+        candidates = np.flatnonzero(present & (fused >= fused[candidates].min()))
+    order = np.lexsort((candidates, -fused[candidates]))[:top]
+    books = candidates[order]
+    return [str(title) for title in fusion['books'][books]], fused[books].tolist()
@@ -0,0 +1,124 @@
+'''
+Inverted index of books for films that are not in the neighbour indexes.
+
+Postings of every term list the books containing it with their normalized
+TF-IDF weights. A film is scored term by term, from the term that can add
+the most to a score to the one that can add the least (MaxScore). As soon
+as the terms left cannot lift a book that shares none of the terms seen so
+far into the top k, only books already seen that can still reach the top k
+are scored. Books sharing no term with the film are never touched.
+'''
+
+import numpy as np
+from scipy import sparse
+from recommandation_engine_2023 import artifacts
+from recommandation_engine_2023 import cleaning
+from recommandation_engine_2023 import normalization
+
+def build_index(matrix, vocabulary = None, idf = None, titles = None):
+    '''
+    Returns an inverted index of the rows (books) of a TF-IDF matrix
+with the vocabulary and inverse document frequences it was built with.
+
+    >>> import numpy as np
+    >>> index = build_index(np.array([[3.0, 4.0], [0.0, 1.0]]))
+    >>> index['postings'].indptr, index['maxima']
+    (array([0, 1, 3], dtype=int32), array([0.6, 1. ]))
+    '''
+    postings = normalization.normalize_rows(matrix)[0].tocsc()
+    postings.sort_indices()
+    maxima = np.zeros(postings.shape[1])
+    lengths = np.diff(postings.indptr)
+    if postings.nnz:
+        maxima[lengths > 0] = np.maximum.reduceat(postings.data,
+                                                  postings.indptr[:-1][lengths > 0])
+    return {'postings':postings, 'maxima':maxima, 'vocabulary':vocabulary,
+            'idf':idf, 'titles':titles}
+
+def load_indexes(store):
+    '''
+    Returns inverted indexes of the books of a store for the criteria that
+compare books with film titles, which need no more than a title to search.
+Stores with legacy scores have no vocabulary and no indexes.
+    '''
+    arrays = store['arrays']
+    indexes = {}
+    for criterion, (_, key2) in store['metadata']['criteria'].items():
+        if key2 == 'title' and criterion + '.vocabulary' in arrays:
+            vocabulary = {word:column for column, word
+                          in enumerate(arrays[criterion + '.vocabulary'])}
+            indexes[criterion] = build_index(artifacts.matrix(store,
+                                                              criterion + '.books_tfidf'),
+                                             vocabulary,
+                                             np.asarray(artifacts.values(store,
+                                                                         criterion + '.idf')),
+                                             arrays['books'])
+    return indexes
+
+def search(index, vector, k = 5):
+    '''
+    Returns the k best book ids and cosine similarities for a TF-IDF
+vector (a 1 x terms matrix) among books sharing a term with it. Equal
+scores are ordered by book id.
+
+    >>> import numpy as np
+    >>> index = build_index(np.array([[1.0, 0.0, 0.0], [1.0, 1.0, 0.0],\
+                                      [0.0, 0.0, 1.0], [0.0, 1.0, 0.0]]))
+    >>> search(index, np.array([[1.0, 0.2, 0.0]]), k = 2)
+    (array([0, 1]), array([0.98058068, 0.83205029]))
+    '''
+    vector, _ = normalization.normalize_rows(vector)
+    postings = index['postings']
+    terms = vector.indices[vector.indices < postings.shape[1]]
+    weights = vector.data[vector.indices < postings.shape[1]]
+    bounds = weights * index['maxima'][terms]
+    order = np.argsort(-bounds, kind = 'stable')
+    #Most a book can still gain from the terms after every term.
+    remaining = np.concatenate((np.cumsum(bounds[order][::-1])[::-1][1:], [0.0]))
+
+    books = np.zeros(0, dtype = np.int64)
+    scores = np.zeros(0)
+    threshold = -np.inf
+    pruning = False
+    for position, term in enumerate(terms[order]):
+        start, stop = postings.indptr[term], postings.indptr[term + 1]
+        ids = postings.indices[start:stop]
+        values = postings.data[start:stop] * weights[order][position]
+        if pruning:
+            found = np.searchsorted(ids, books)
+            found[found == len(ids)] = 0
+            hits = (ids[found] == books) if len(ids) else np.zeros(len(books), dtype = bool)
+            scores[hits] += values[found[hits]]
+        else:
+            merged = np.union1d(books, ids)
+            merged_scores = np.zeros(len(merged))
+            merged_scores[np.searchsorted(merged, books)] = scores
+            merged_scores[np.searchsorted(merged, ids)] += values
+            books, scores = merged, merged_scores
+        if len(books) >= k:
+            threshold = max(threshold, np.partition(scores, len(scores) - k)[len(scores) - k])
+        if remaining[position] < threshold:
+            #Books not seen yet cannot reach the top k any more.
+            pruning = True
+            alive = scores + remaining[position] >= threshold
+            books, scores = books[alive], scores[alive]
+
+    best = np.lexsort((books, -scores))[:k]
+    return books[best], scores[best]
+
+def title_best_matches(index, title, top = 5):
+    '''
+    Returns a list of books that best match a film title by its words.
+
+    >>> import numpy as np
+    >>> index = build_index(np.array([[1.0, 0.0], [0.0, 1.0]]), {'dune':0, 'jaws':1},\
+                            np.ones(2), np.array(['Sand', 'Sea']))
+    >>> title_best_matches(index, 'Jaws 2')
+    ['Sea']
+    '''
+    words = [word for word in cleaning.tokenize(title) if word in index['vocabulary']]
+    columns = [index['vocabulary'][word] for word in words]
+    vector = sparse.csr_matrix((index['idf'][columns], (np.zeros(len(columns)), columns)),
+                               shape = (1, len(index['vocabulary'])))
+    books, _ = search(index, vector, top)
+    return [str(title) for title in index['titles'][books]]
@@ -0,0 +1,92 @@
+'''
+Load test of the recommendation server.
+
+Concurrent clients keep one connection each and send the films of a
+history file to POST /recommend until all requests are answered.
+'''
+
+import os
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+from tabulate import tabulate
+from recommandation_engine_2023 import server
+
+def percentiles(latencies):
+    '''
+    Returns p50 and p99 of latencies in milliseconds.
+
+    >>> percentiles([0.001, 0.002, 0.003])
+    (2.0, 2.98)
+    '''
+    milliseconds = np.array(latencies) * 1000
+    return (round(float(np.percentile(milliseconds, 50)), 3),
+            round(float(np.percentile(milliseconds, 99)), 3))
+
+async def client(host, port, body, count, latencies):
+    '''
+    Sends count requests over one connection and records their latencies.
+    '''
+    reader, writer = await asyncio.open_connection(host, port)
+    request = (f'POST /recommend HTTP/1.1\r\nHost: {host}\r\n'
+               f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n'
+               ).encode('ascii') + body
+    try:
+        for _ in range(count):
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            headers = {}
+            status = await reader.readline()
+            while True:
+                header = await reader.readline()
+                if header in (b'\r\n', b''):
+                    break
+                name, _, value = header.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            await reader.readexactly(int(headers['content-length']))
+            if b' 200 ' not in status:
+                raise RuntimeError(f'Server answered {status.decode().strip()}.')
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+async def load_test(host, port, history, requests, concurrency, top = 5):
+    '''
+    Returns a report with p50 and p99 latency and queries per second.
+    '''
+    body = json.dumps({'history':history, 'top':top}).encode('utf-8')
+    counts = [requests // concurrency + (position < requests % concurrency)
+              for position in range(concurrency)]
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, body, count, latencies)
+                           for count in counts if count))
+    seconds = time.perf_counter() - start
+    p50, p99 = percentiles(latencies)
+    return {'requests':len(latencies), 'concurrency':concurrency,
+            'p50 ms':p50, 'p99 ms':p99, 'QPS':round(len(latencies) / seconds, 1)}
+
+def main():
+    '''
+    Runs the load test against a running server and prints the report.
+    '''
+    parser = argparse.ArgumentParser(description = 'Load test the recommendation server.')
+    parser.add_argument('--host', default = server.HOST)
+    parser.add_argument('--port', type = int, default = server.PORT)
+    parser.add_argument('--history', default = os.path.dirname(__file__) + '/history.txt')
+    parser.add_argument('--requests', type = int, default = 1000)
+    parser.add_argument('--concurrency', type = int, default = 16)
+    parser.add_argument('--top', type = int, default = 5)
+    arguments = parser.parse_args()
+
+    with open(arguments.history, 'r', encoding = 'utf-8') as file:
+        history = file.read().splitlines()
+    report = asyncio.run(load_test(arguments.host, arguments.port, history,
+                                   arguments.requests, arguments.concurrency, arguments.top))
+    print(tabulate([report], headers = 'keys', tablefmt = 'grid'))
+
+if __name__ == '__main__':
+    main()
@@ -2,54 +2,101 @@
 Recomandation.
 '''
 import sys
-from tabulate import tabulate
-import pandas as pd
-from recommandation_engine_2023 import computations
-
-def main():
+import time
+import argparse
+import threading
+from recommandation_engine_2023 import artifacts
+from recommandation_engine_2023 import profiling
+from recommandation_engine_2023 import query
+from recommandation_engine_2023 import titles
+
+def main(options = None):
     '''
-    Recommands books.
+    Recommands books. With options.profile_report the query steps
+are timed into a report together with the time to the first recommendation
+shown, without the time spent waiting for answers. With options.history
+the history file is answered at once by the query module, without pandas
+and NLTK. Books of a film by a criterion are found when they are shown or
+written, and from the first recommendation shown on the general results
+and the books of the criteria asked for are written on a background thread
+while the prompts are answered. An error of the writer is raised once they
+are over.
 
     >>> main()
 
     '''
-    file_path = input('Введіть шлях до файлу історії: ')
-
-    books_films_similarity_td = pd.read_csv('books_films_similarity_td.csv')
-    books_films_similarity_txtx = pd.read_csv('books_films_similarity_txtx.csv')
-    books_films_similarity_ttl = pd.read_csv('books_films_similarity_ttl.csv')
+    options = options or parse_arguments([])
+    if options.history:
+        query.main([options.history, '--artifacts', options.artifacts])
+        return
+
+    #Imported here, so that one-shot queries do not pay for them.
+    from concurrent.futures import ThreadPoolExecutor
+    from tabulate import tabulate
+    import pandas as pd
+    from recommandation_engine_2023 import caching
+    from recommandation_engine_2023 import computations
+    from recommandation_engine_2023 import fusion
+    from recommandation_engine_2023 import inverted
+
+    report = profiling.new_report(options.profiles) if options.profile_report else None
+    clock = {'started':time.perf_counter(), 'waiting':0.0}
+    file_path = ask(clock, 'Введіть шлях до файлу історії: ')
+
+    with profiling.stage(report, 'loading store'):
+        store = artifacts.load_artifacts(options.artifacts)
+        neighbours = {criterion:artifacts.load_neighbours(store, criterion)
+                      for criterion in computations.CRITERIA}
 
     try:
-        history = open(file_path, 'r', encoding='utf-8').readlines()
-        history = [film[:-1] for film in history]
+        with open(file_path, 'r', encoding='utf-8') as file:
+            history = file.read().splitlines()
     except FileNotFoundError:
         print('Wrong path.')
         sys.exit()
 
-    results_td = pd.DataFrame()
-    results_txtx = pd.DataFrame()
-    results_ttl = pd.DataFrame()
-    general = pd.DataFrame()
-
-    general['sum'] = books_films_similarity_td[history].sum(axis = 1) \
-                + books_films_similarity_ttl[history].sum(axis = 1) \
-                + books_films_similarity_txtx[history].sum(axis = 1)
-
-    general_results = general['sum'].nlargest(5)
-    general_results = pd.DataFrame(data = {'Top 5 books for you: ':
-                            [books_films_similarity_ttl.iloc[index]['title']
-                            for index in general_results.index]})
-
-    for film in history:
-        results_td[film] = computations.find_best_matches(books_films_similarity_td ,film)
-        results_txtx[film] = computations.find_best_matches(books_films_similarity_txtx ,film)
-        results_ttl[film] = computations.find_best_matches(books_films_similarity_ttl ,film)
+    #Misspelt or differently written titles are resolved into titles of the store.
+    with profiling.stage(report, 'resolving titles', len(history)):
+        history, replaced = titles.resolve_history(titles.load_index(store), history)
+    for title, film in replaced.items():
+        print(f'Фільм {title} знайдено як {film}.')
+
+    with profiling.stage(report, 'general recommendations', len(history)):
+        general_results, _ = fusion.fused_top(fusion.load_fusion(store), history)
+        general_results = pd.DataFrame(data = {'Top 5 books for you: ':general_results})
+    criteria = ('td', 'txtx', 'ttl')
+    #Books of every film are found once, whether they are shown or written first:
+    #the lock keeps the prompts and the writer from finding the same books together.
+    cache = caching.new_cache()
+    lock = threading.Lock()
+    def indexes():
+        return caching.lookup(cache, 'indexes', lambda: inverted.load_indexes(store))
+    def results(criterion):
+        matches = computations.film_matches(neighbours, criterion, history, cache = cache,
+                                            indexes = indexes)
+        while True:
+            with lock:
+                match = next(matches, None)
+            if match is None:
+                return
+            yield match
+    #Result files are written from the first recommendation shown on, only for
+    #the criteria asked for.
+    writing = {}
+    def start_writing():
+        if not writing:
+            executor = ThreadPoolExecutor(1)
+            writing['future'] = executor.submit(write_results, general_results,
+                                                {criteria[number - 1]:
+                                                 results(criteria[number - 1])
+                                                 for number in user_request},
+                                                report)
+            executor.shutdown(wait = False)
 
-    results = (results_td, results_txtx, results_ttl)
     analysises = ('Title - Description', 'All info - All info', 'Title - Title')
     user_request = []
     while True:
-        analyse = input(f'Введіть номер критерію для фільмів - книг (число від 1 до 3),\
+        analyse = ask(clock, f'Введіть номер критерію для фільмів - книг (число від 1 до 3),\
 за яким хочете здіснити порівння, доступні критерії {analysises} або EXIT, щоб \
 завершити введеня: ')
 
@@ -63,27 +110,29 @@ def main():
         except ValueError:
             print('Значеннями повинні бути числа від 1 до 3.')
 
-    request = input('Якщо бажаєте пропустити виведення рекомендацій для кожного з фільмів \
+    request = ask(clock, 'Якщо бажаєте пропустити виведення рекомендацій для кожного з фільмів \
 введіть SKIP:')
     if request != 'SKIP':
         for result in range(len(user_request)):
-            for film in results[result]:
+            for film, books in results(criteria[user_request[result]-1]):
                 print(f'Найкращі книги за порівнянням: \
 [{analysises[user_request[result]-1]}] для фільму {film}.' )
-                print(tabulate(results[user_request[result]-1][film].to_frame(),
+                print(tabulate(pd.Series(books, dtype = object, name = film).to_frame(),
                                headers='keys', tablefmt='grid'))
+                first_shown(clock, report)
+                start_writing()
                 print()
                 print()
-                inp = input('Введіть NEXT, щоб отримати рекомендації \
+                inp = ask(clock, 'Введіть NEXT, щоб отримати рекомендації \
 для наступноги фільму або будь-що інше, щоб завершити процес: ')
                 if inp != 'NEXT':
                     break
-            request = input('Якщо бажаєте пропустити виведення \
+            request = ask(clock, 'Якщо бажаєте пропустити виведення \
 наступних рекомендацій введіть SKIP:')
             if request == 'SKIP':
                 break
             if result < 2 and len(user_request) > result + 1:
-                inp = input(f'Введіть NEXT, щоб отримати рекомендації \
+                inp = ask(clock, f'Введіть NEXT, щоб отримати рекомендації \
 за наступим критерієм: [{analysises[result + 1]}] - або будь-що інше, щоб завершити процес:')
                 if inp != 'NEXT':
                     break
@@ -93,13 +142,68 @@ def main():
     print()
     print('Найкращі книги для історії загалом:' )
     print(tabulate(general_results, headers='keys', tablefmt='grid'))
+    first_shown(clock, report)
+    start_writing()
 
-    with open('results.txt', 'w', encoding='utf-8') as file:
-        file.write(str(general_results) + '\n')
+    writing['future'].result()
+    if report:
+        profiling.write_report(report, options.profile_report)
 
-    results_td.to_csv('results_td.csv')
-    results_txtx.to_csv('results_txtx.csv')
-    results_ttl.to_csv('results_ttl.csv')
+def ask(clock, prompt):
+    '''
+    Returns the answer to a prompt, adding the time spent waiting
+for it to the waiting time of a clock.
+    '''
+    start = time.perf_counter()
+    try:
+        return input(prompt)
+    finally:
+        clock['waiting'] += time.perf_counter() - start
+
+def first_shown(clock, report):
+    '''
+    Records into a report the seconds from the start of a clock to the
+first recommendation shown, without the time spent waiting for answers.
+    '''
+    if 'first' not in clock:
+        clock['first'] = time.perf_counter() - clock['started'] - clock['waiting']
+        profiling.record_value(report, 'time to first recommendation seconds',
+                               clock['first'])
+
+def write_results(general_results, results, report = None):
+    '''
+    Writes the general results to results.txt and the books of every
+film by criterion, given as (film, books) pairs of film_matches, to
+results_<criterion>.csv.
+    '''
+    #Imported here like in main, so that importing this module does not import pandas.
+    import pandas as pd
+    with profiling.stage(report, 'writing results'):
+        with open('results.txt', 'w', encoding='utf-8') as file:
+            file.write(str(general_results) + '\n')
+
+        for criterion, matches in results.items():
+            pd.DataFrame({film:pd.Series(books, dtype = object)
+                          for film, books in matches}).to_csv(f'results_{criterion}.csv')
+
+def parse_arguments(arguments = None):
+    '''
+    Parses command line arguments of the recommendations.
+
+    >>> parse_arguments(['--profile-report', 'report.json']).profile_report
+    'report.json'
+    '''
+    parser = argparse.ArgumentParser(description = 'Recommend books for a history of films.')
+    parser.add_argument('--artifacts', default = artifacts.DIRECTORY,
+                        help = 'directory of the artifacts store')
+    parser.add_argument('--history', default = None,
+                        help = 'file with a film title per line to answer without prompts')
+    parser.add_argument('--profile-report', default = None,
+                        help = 'json file for the time, cpu time and memory of every step')
+    parser.add_argument('--profiles', default = None,
+                        help = 'directory for cProfile statistics of every step '
+                               'of the profile report')
+    return parser.parse_args(arguments)
 
 if __name__ == '__main__':
-    main()
+    main(parse_arguments())
@@ -0,0 +1,27 @@
+'''
+Sparse TF-IDF vector helpers shared by the exact search of computations
+and the inverted index search of inverted.
+'''
+
+import numpy as np
+from scipy import sparse
+
+def normalize_rows(matrix):
+    '''
+    Returns a CSR matrix with L2-normalized rows and a boolean mask
+of the rows whose norm is zero.
+
+    >>> import numpy as np
+    >>> normalized, empty = normalize_rows(np.array([[3.0, 4.0], [0.0, 0.0]]))
+    >>> normalized.toarray()
+    array([[0.6, 0.8],
+           [0. , 0. ]])
+    >>> empty
+    array([False,  True])
+    '''
+
+    matrix = sparse.csr_matrix(matrix, dtype = np.float64)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis = 1)).ravel())
+    empty = norms == 0
+    scale = np.divide(1.0, norms, out = np.zeros_like(norms), where = ~empty)
+    return sparse.csr_matrix(sparse.diags(scale) @ matrix), empty
@@ -0,0 +1,303 @@
+'''
+Process pool versions of the preprocessing steps.
+
+Rows are split into consecutive shards and results are merged in shard
+order, so every function gives the same result as its serial version.
+Matrices compared by the similarity step are put into shared memory once
+and attached by the workers instead of being pickled for every task.
+'''
+
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from recommandation_engine_2023 import cleaning
+from recommandation_engine_2023 import computations
+from recommandation_engine_2023 import corpus
+from recommandation_engine_2023 import normalization
+
+def pool(workers):
+    '''
+    Returns a process pool for more than one worker and a context
+giving None otherwise.
+
+    >>> with pool(1) as executor:
+    ...     print(executor)
+    None
+    '''
+    if workers > 1:
+        return ProcessPoolExecutor(workers)
+    return nullcontext()
+
+def shards(length, count):
+    '''
+    Returns (start, stop) pairs splitting length rows into at most
+count consecutive shards.
+
+    >>> shards(5, 2)
+    [(0, 3), (3, 5)]
+    >>> shards(0, 4)
+    []
+    '''
+    if length == 0:
+        return []
+    size = -(-length // max(count, 1))
+    return [(start, min(start + size, length)) for start in range(0, length, size)]
+
+def _tokenize(cells, stop_words):
+    '''
+    Returns tokenized cells of a shard.
+    '''
+    return [cleaning.tokenize(cell, stop_words) for cell in cells]
+
+def clean_up(dataframe, columns, executor = None, workers = 1, stop_words = None):
+    '''
+    Returns a dataframe cleaned like cleaning.clean_up with every column
+split into shards cleaned by the executor.
+    '''
+    if executor is None:
+        return cleaning.clean_up(dataframe, columns, stop_words)
+    if stop_words is None:
+        stop_words = cleaning.english_stop_words()
+    for column in columns:
+        cells = dataframe[column].to_list()
+        parts = executor.map(_tokenize, [cells[start:stop] for start, stop
+                                         in shards(len(cells), workers)],
+                             [stop_words if column != 'title' else frozenset()] * workers)
+        dataframe[column] = pd.Series([words for part in parts for words in part],
+                                      index = dataframe.index, dtype = object)
+    return dataframe
+
+def _intern(cells, stop_words):
+    '''
+    Returns a corpus of the tokenized cells of a shard.
+    '''
+    return corpus.from_cells(cells, stop_words)
+
+def intern_columns(dataframe, columns, executor = None, workers = 1, stop_words = None,
+                   words = None):
+    '''
+    Returns a dictionary column -> corpus of the given columns tokenized
+like cleaning.clean_up, with ids of the shared words. Shards are
+tokenized by the executor and remapped into words.
+    '''
+    if stop_words is None:
+        stop_words = cleaning.english_stop_words()
+    words = {} if words is None else words
+    corpora = {}
+    for column in columns:
+        cells = dataframe[column].to_list()
+        column_stop_words = stop_words if column != 'title' else frozenset()
+        if executor is None:
+            corpora[column] = corpus.from_cells(cells, column_stop_words, words)
+        else:
+            parts = executor.map(_intern, [cells[start:stop] for start, stop
+                                           in shards(len(cells), workers)],
+                                 [column_stop_words] * workers)
+            corpora[column] = corpus.concatenate(parts, words)
+    return corpora
+
+def _tfidf_matrix(documents, vocabulary, idf):
+    '''
+    Returns a TF-IDF matrix of a shard.
+    '''
+    return computations.documents_to_tfidf_matrix(documents, vocabulary, idf)
+
+def shared_matrices(documents1, documents2, executor = None, workers = 1):
+    '''
+    Returns the same as computations.shared_matrices, counting document
+frequences and building TF-IDF matrices shard by shard.
+    '''
+    if executor is None:
+        return computations.shared_matrices(documents1, documents2)
+    documents = list(documents1) + list(documents2)
+    parts = shards(len(documents), workers)
+    vocabulary, document_frequences = computations.merge_vocabularies(
+                            executor.map(computations.build_vocabulary,
+                                         [documents[start:stop] for start, stop in parts]))
+    idf = computations.inverse_document_frequences(document_frequences, len(documents))
+    matrices = []
+    for corpus in (list(documents1), list(documents2)):
+        corpus_parts = shards(len(corpus), workers)
+        blocks = list(executor.map(_tfidf_matrix,
+                                   [corpus[start:stop] for start, stop in corpus_parts],
+                                   [vocabulary] * len(corpus_parts),
+                                   [idf] * len(corpus_parts)))
+        if blocks:
+            matrices.append(sparse.vstack(blocks, format = 'csr'))
+        else:
+            matrices.append(sparse.csr_matrix((0, len(vocabulary))))
+    return matrices[0], matrices[1], vocabulary, idf
+
+def frames_to_matrices(frame1, frame2, key1, key2, legacy = True,
+                       executor = None, workers = 1):
+    '''
+    Returns the same as computations.frames_to_matrices. Legacy
+positional matrices are built serially.
+    '''
+    if legacy or executor is None:
+        return computations.frames_to_matrices(frame1, frame2, key1, key2, legacy)
+    return shared_matrices(frame1[key1], frame2[key2], executor, workers)
+
+def share_arrays(arrays):
+    '''
+    Copies arrays into shared memory blocks. Returns descriptors
+to attach them and the blocks, which the caller must close and unlink.
+
+    >>> import numpy as np
+    >>> descriptors, blocks = share_arrays({'score':np.array([0.5, 0.25])})
+    >>> arrays, attached = attach_arrays(descriptors)
+    >>> arrays.pop('score')
+    array([0.5 , 0.25])
+    >>> detach(attached)
+    >>> release(blocks)
+    '''
+    descriptors = {}
+    blocks = []
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create = True, size = max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype = array.dtype, buffer = block.buf)[...] = array
+        descriptors[name] = (block.name, array.shape, array.dtype.str)
+        blocks.append(block)
+    return descriptors, blocks
+
+def attach_arrays(descriptors):
+    '''
+    Returns arrays of shared memory blocks described by share_arrays
+and the attached blocks, which the caller must detach once no array
+of them is used any more.
+    '''
+    arrays = {}
+    blocks = []
+    for name, (block_name, shape, dtype) in descriptors.items():
+        block = shared_memory.SharedMemory(name = block_name)
+        arrays[name] = np.ndarray(shape, dtype = np.dtype(dtype), buffer = block.buf)
+        blocks.append(block)
+    return arrays, blocks
+
+def detach(blocks):
+    '''
+    Closes shared memory blocks attached by attach_arrays, so that they
+are freed once they are unlinked.
+    '''
+    for block in blocks:
+        block.close()
+
+def release(blocks):
+    '''
+    Closes and unlinks shared memory blocks.
+    '''
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+def _top_k_block(arrays, start, stop, k):
+    '''
+    Returns the k best scores and books of every film for books
+from start to stop.
+    '''
+    books_matrix = sparse.csr_matrix((arrays['books.data'], arrays['books.indices'],
+                                      arrays['books.indptr']),
+                                     shape = tuple(arrays['books.shape']))
+    films_matrix = sparse.csc_matrix((arrays['films.data'], arrays['films.indices'],
+                                      arrays['films.indptr']),
+                                     shape = tuple(arrays['films.shape']))
+    block = (books_matrix[start:stop] @ films_matrix).toarray()
+    block[arrays['books.empty'][start:stop], :] = np.nan
+    block[:, arrays['films.empty']] = np.nan
+    scores = np.nan_to_num(block[:, arrays['positions']], nan = -np.inf)
+    books = np.arange(start, stop) + int(arrays['offset'])
+    books = np.repeat(books[:, None], scores.shape[1], axis = 1)
+    return computations.merge_top_k(None, None, scores, books, k)
+
+def _shared_top_k_block(descriptors, start, stop, k):
+    '''
+    Returns _top_k_block for arrays attached from shared memory, which
+are detached again before returning.
+    '''
+    arrays, blocks = attach_arrays(descriptors)
+    best = _top_k_block(arrays, start, stop, k)
+    arrays.clear()
+    detach(blocks)
+    return best
+
+def top_k_arrays(matrix1, matrix2, films, k = computations.TOP_K, chunk_size = None,
+                 executor = None, best = (None, None), offset = 0):
+    '''
+    Returns k x films arrays of the best scores and books together with
+the film titles of their columns. Rows of matrix1 are books numbered
+from offset; they are merged into the best arrays found so far.
+
+    >>> import numpy as np
+    >>> scores, books, films = top_k_arrays(np.array([[1.0, 1.0]]), np.eye(2),\
+                                            ['Jaws', 'Dune'], k = 1, offset = 4)
+    >>> books, films
+    (array([[4, 4]]), ['Jaws', 'Dune'])
+    '''
+    normalized1, empty1 = normalization.normalize_rows(matrix1)
+    normalized2, empty2 = normalization.normalize_rows(matrix2)
+    width = max(normalized1.shape[1], normalized2.shape[1])
+    normalized1.resize((normalized1.shape[0], width))
+    normalized2.resize((normalized2.shape[0], width))
+    transposed = normalized2.T.tocsc()
+    columns = {}
+    for position, title in enumerate(films):
+        columns[title] = position
+
+    arrays = {'books.data':normalized1.data, 'books.indices':normalized1.indices,
+              'books.indptr':normalized1.indptr,
+              'books.shape':np.array(normalized1.shape), 'books.empty':empty1,
+              'films.data':transposed.data, 'films.indices':transposed.indices,
+              'films.indptr':transposed.indptr,
+              'films.shape':np.array(transposed.shape), 'films.empty':empty2,
+              'positions':np.array(list(columns.values()), dtype = np.int64),
+              'offset':np.array(offset)}
+    rows = normalized1.shape[0]
+    chunk_size = chunk_size or max(rows, 1)
+    starts = list(range(0, rows, chunk_size))
+    stops = [min(start + chunk_size, rows) for start in starts]
+
+    if executor is None:
+        blocks = (_top_k_block(arrays, start, stop, k) for start, stop in zip(starts, stops))
+        return _merge_blocks(blocks, best, k) + (list(columns),)
+
+    descriptors, shared = share_arrays(arrays)
+    try:
+        blocks = executor.map(_shared_top_k_block, [descriptors] * len(starts),
+                              starts, stops, [k] * len(starts))
+        return _merge_blocks(blocks, best, k) + (list(columns),)
+    finally:
+        release(shared)
+
+def top_k_neighbours(matrix1, matrix2, titles, films, k = computations.TOP_K,
+                     chunk_size = None, executor = None):
+    '''
+    Returns the same neighbour index as computations.top_k_neighbours over
+similarity_chunks_between_matrices, with blocks of chunk_size books
+scored by the executor.
+
+    >>> import numpy as np
+    >>> import pandas as pd
+    >>> top_k_neighbours(np.array([[1.0, 0.0], [1.0, 1.0]]), np.array([[0.0, 1.0]]),\
+                         pd.Series(['Sand', 'Sea']), ['Jaws'], k = 1)
+       film  book title     score
+    0  Jaws     1   Sea  0.707107
+    '''
+    best_scores, best_books, films = top_k_arrays(matrix1, matrix2, films, k,
+                                                  chunk_size, executor)
+    if best_scores is None:
+        return pd.DataFrame(columns = ['film', 'book', 'title', 'score'])
+    return computations.neighbours_frame(best_scores, best_books, films, titles)
+
+def _merge_blocks(blocks, best, k):
+    '''
+    Returns best scores and books merged from top k results of consecutive blocks.
+    '''
+    best_scores, best_books = best
+    for scores, books in blocks:
+        best_scores, best_books = computations.merge_top_k(best_scores, best_books,
+                                                           scores, books, k)
+    return best_scores, best_books
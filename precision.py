@@ -0,0 +1,69 @@
+'''
+Storage precision of similarity scores and TF-IDF weights.
+
+Values are kept as float64, float32 or float16, or quantised to int8
+codes with one scale per column: a value is its code times the scale of
+its column, the largest absolute value of the column divided by 127.
+Missing (NaN) values get the code -128, below every other code. A positive
+scale keeps the order of the values of a column, so the codes of a film
+column rank books like the similarities they stand for.
+'''
+
+import numpy as np
+
+PRECISIONS = ('float64', 'float32', 'float16', 'int8')
+MISSING = -128
+
+def _columns(values, columns = None, width = None):
+    '''
+    Returns the column of every value and the number of columns: those
+of a two dimensional array, the given ones or a single column.
+    '''
+    if values.ndim == 2:
+        return np.broadcast_to(np.arange(values.shape[1]), values.shape), values.shape[1]
+    if columns is None:
+        return np.zeros(values.shape, dtype = np.int64), 1
+    columns = np.asarray(columns, dtype = np.int64)
+    return columns, int(width if width is not None else columns.max(initial = -1) + 1)
+
+def quantize(values, columns = None, width = None):
+    '''
+    Returns the int8 codes of values and the scales of their columns.
+The columns of a two dimensional array are its own; values of a one
+dimensional array are given their column (of width columns) or are
+all one column.
+
+    >>> codes, scales = quantize(np.array([[0.5, np.nan], [1.0, 0.2]]))
+    >>> codes
+    array([[  64, -128],
+           [ 127,  127]], dtype=int8)
+    >>> (scales * 127).round(4)
+    array([1. , 0.2])
+    >>> quantize(np.array([0.3, 0.6, 2.0]), columns = np.array([0, 0, 1]))[0]
+    array([ 64, 127, 127], dtype=int8)
+    '''
+    values = np.asarray(values, dtype = np.float64)
+    columns, width = _columns(values, columns, width)
+    missing = ~np.isfinite(values)
+    magnitudes = np.where(missing, 0.0, np.abs(values))
+    maxima = np.zeros(width)
+    np.maximum.at(maxima, columns.ravel(), magnitudes.ravel())
+    scales = np.where(maxima > 0, maxima / 127, 1.0)
+    codes = np.rint(np.where(missing, 0.0, values) / scales[columns])
+    codes[missing] = MISSING
+    return codes.astype(np.int8), scales
+
+def dequantize(codes, scales, columns = None, dtype = np.float32):
+    '''
+    Returns the values of int8 codes with the scales of their columns,
+given like for quantize. Missing codes are NaN.
+
+    >>> dequantize(*quantize(np.array([[0.5, np.nan], [1.0, 0.2]]))).round(3)
+    array([[0.504,   nan],
+           [1.   , 0.2  ]], dtype=float32)
+    '''
+    codes = np.asarray(codes)
+    columns, _ = _columns(codes, columns, len(scales))
+    values = codes.astype(dtype) * np.asarray(scales, dtype = dtype)[columns]
+    values[codes == MISSING] = np.nan
+    return values
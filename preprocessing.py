@@ -1,122 +1,435 @@
 '''Data preprocessing.'''
 
-import sys
 import os
+import argparse
+import itertools
+import numpy as np
 import pandas as pd
+from recommandation_engine_2023 import ann
+from recommandation_engine_2023 import artifacts
+from recommandation_engine_2023 import checkpoints
 from recommandation_engine_2023 import cleaning
 from recommandation_engine_2023 import computations
+from recommandation_engine_2023 import corpus
+from recommandation_engine_2023 import parallel
+from recommandation_engine_2023 import profiling
+from recommandation_engine_2023 import titles
 
-def main():
+CHUNK_SIZE = 2048
+READ_CHUNK_SIZE = 10000
+
+BOOKS_COLUMNS = {'book_title':'title', 'book_authors':'authors', 'book_desc':'desc',
+                 'genres':'genre', 'book_rating':'criteria'}
+TOPICS_COLUMNS = {'Title':'title', 'All names':'authors', 'Topic':'desc', 'Genre':'genre',
+                  'Date of creation/publication':'criteria'}
+FILMS_COLUMNS = {'Title':'title', 'People':'authors', 'Desc':'desc', 'Genre':'genre',
+                 'Date':'criteria'}
+TOKEN_COLUMNS = ['title', 'desc', 'text']
+CLEANED_COLUMNS = ['title', 'desc', 'criteria', 'text', 'title_pure']
+
+def main(options = None):
     '''
-    Preprocess the data.
+    Preprocess the data. With options.legacy_scores the similarities are
+computed on positional TF-IDF vectors as before, otherwise books and films
+are compared in one shared term space. Only the options.top_k best books
+are kept for every film. Results go to the options.artifacts store.
+Outside legacy scores, tokens are kept as corpora of the corpus module
+sharing one vocabulary instead of lists of words.
+Cleaned books and films, TF-IDF matrices and neighbours of every criterion
+are checkpointed into options.cache by the hashes of their inputs, so a
+rerun skips the stages whose inputs did not change (see checkpoints).
+With options.profile_report every stage is timed into a report, profiled
+with cProfile into options.profiles when given.
 
     >>> main()
 
     '''
-    #Getting data about the Roahl Doah's literature.
-    path = sys.argv[0]
+    options = options or parse_arguments([])
     path = os.path.dirname(__file__)
-    charlie_frame = pd.read_csv(path + '/data/topics.csv')
-    charlie_frame = charlie_frame[['Title','All names',
-                                        'Topic', 'Genre',
-                                        'Date of creation/publication']][:1000]
-
-    #Renaming the frame's columns and cleaning collected data.
-    charlie_frame = charlie_frame.rename(columns = {'Title':'title','All names':'authors',
-                                'Topic':'desc','Genre':'genre',
-                                'Date of creation/publication':'criteria'})
-    charlie_frame = charlie_frame.drop_duplicates(subset = ['title'])
-    charlie_frame = charlie_frame.dropna()
-    charlie_frame = cleaning.clean_empty(charlie_frame)
-
-    #Getting and renaming datasets with books and films.
-    books_frame = pd.read_csv(path + '/data/book_data.csv')
-    books_frame = books_frame[['book_title','book_authors', 'book_desc',
-                               'genres','book_rating',]][:500]
-
-    films_frame = pd.read_csv('films_imdb.csv')
-    films_frame = films_frame.rename(columns = {'Title':'title','People':'authors',
-                                'Desc':'desc','Genre':'genre',
-                                'Date':'criteria'})
-    books_frame = books_frame.rename(columns = {'book_title':'title','book_authors':'authors',
-                                'book_desc':'desc', 'genres':'genre',
-                                'book_rating':'criteria',})
-
-    #Dropping rows with Nan values and cleaning the datasets.
-    books_frame = books_frame.dropna(how='all')
-    films_frame = films_frame.dropna(how='all')
-    books_frame = books_frame.drop(260)
-    books_frame = cleaning.clean_empty(books_frame)
-    films_frame = cleaning.clean_empty(films_frame)
-    films_frame = films_frame.drop(columns = ['Unnamed: 0'])
-
-    #Concatting datasets with books together and resetting indexes.
-    all_books_frame = pd.concat([books_frame,charlie_frame])
-    all_books_frame = all_books_frame.reset_index()
-    films_frame = films_frame.reset_index()
-
-    #Creating a new column with concatted info from all other columns.
-    films_frame['text'] = films_frame['title'] + ' ' + films_frame['authors'] + ' ' \
-                                + films_frame['desc'] + ' ' + films_frame['genre']
-    all_books_frame['text'] = all_books_frame['title'] + ' ' +  all_books_frame['authors'] + ' ' \
-                                    + all_books_frame['desc'] + ' ' + all_books_frame['genre']
-
-    #Dropping unneeded columns.
-    films_frame = films_frame.drop(columns = ['genre','authors'])
-    all_books_frame = all_books_frame.drop(columns = ['genre','authors'])
-    all_books_frame.at[9, 'desc']  = 'None'
-
-    #Creating a dataframe with unprocessed titles.
-    title = pd.DataFrame({'pure_title_films':films_frame['title'].copy(),
-                            'pure_books_titles':all_books_frame['title'].copy()})
-
-    #Filing up empty columns.
-    films_frame = cleaning.clean_up(films_frame, columns = ['title','desc','text'])
-    all_books_frame = cleaning.clean_up(all_books_frame, columns = ['title','desc','text'])
-    all_books_frame.to_csv('all_books_frame.csv')
-    films_frame.to_csv('films_frame.csv')
-
-    #Converting data to TF-IDF vectors
-    films_frame_tfidf = computations.dataframe_to_tfidf(films_frame.copy())
-    books_frame_tfidf = computations.dataframe_to_tfidf(all_books_frame.copy())
+    report = profiling.new_report(options.profiles) if options.profile_report else None
+
+    #Keys of the cleaned books and films: hashes of their files and parameters.
+    stop_words = sorted(cleaning.english_stop_words())
+    books_key = checkpoints.stage_key('books', [checkpoints.file_hash(path + '/data/' + name)
+                                                for name in ('book_data.csv', 'topics.csv')],
+                                      options.books_rows, options.topics_rows,
+                                      options.legacy_scores, stop_words)
+    films_key = checkpoints.stage_key('films', checkpoints.file_hash(options.films),
+                                      options.legacy_scores, stop_words)
+
+    children = profiling.children_cpu()
+    with parallel.pool(options.workers) as executor:
+        #Cleaning the datasets and concatting datasets with books together.
+        with profiling.stage(report, 'reading and cleaning books') as record:
+            all_books_frame, books_corpora = checkpoint(options, 'books', books_key,
+                                                        lambda: read_books(path, options,
+                                                                           executor),
+                                                        record)
+            if record:
+                record['rows'] = len(all_books_frame)
+        with profiling.stage(report, 'reading and cleaning films') as record:
+            films_frame, films_corpora = checkpoint(options, 'films', films_key,
+                                                    lambda: read_films(options, executor),
+                                                    record)
+            if record:
+                record['rows'] = len(films_frame)
+        if films_corpora is not None:
+            #Films are interned apart from books, so that both are cached apart.
+            words = books_corpora['title']['words']
+            films_corpora = {column:corpus.concatenate([tokens], words)
+                             for column, tokens in films_corpora.items()}
+        process(all_books_frame, films_frame, options, executor, report,
+                None if books_corpora is None else (books_corpora, films_corpora),
+                (books_key, films_key))
+    #Workers count as finished child processes once the pool is shut down.
+    if children is not None:
+        profiling.record_value(report, 'workers cpu seconds',
+                               profiling.children_cpu() - children)
+
+    if report:
+        profiling.write_report(report, options.profile_report)
+
+def read_books(path, options, executor = None):
+    '''
+    Returns the books of book_data.csv and the Roahl Doah's literature of
+topics.csv cleaned by concat_chunks, with tokens kept as corpora outside
+legacy scores.
+    '''
+    #Getting books and the Roahl Doah's literature chunk by chunk.
+    books_chunks = read_chunks(path + '/data/book_data.csv', BOOKS_COLUMNS,
+                               options.read_chunk_size, options.books_rows)
+    books_chunks = (chunk.dropna(how = 'all') for chunk in books_chunks)
+    charlie_chunks = read_chunks(path + '/data/topics.csv', TOPICS_COLUMNS,
+                                 options.read_chunk_size, options.topics_rows)
+    charlie_chunks = (chunk.dropna() for chunk in charlie_chunks)
+    #The same book may be in both datasets, under differently written titles.
+    books_chunks = unique_titles(itertools.chain(books_chunks, charlie_chunks))
+    return concat_chunks(books_chunks, executor, options.workers,
+                         None if options.legacy_scores else {})
+
+def read_films(options, executor = None):
+    '''
+    Returns the films of options.films cleaned like read_books does.
+    '''
+    films_chunks = read_chunks(options.films, FILMS_COLUMNS, options.read_chunk_size)
+    films_chunks = (chunk.dropna(how = 'all') for chunk in films_chunks)
+    return concat_chunks(films_chunks, executor, options.workers,
+                         None if options.legacy_scores else {})
+
+def checkpoint(options, stage, key, compute, record = None):
+    '''
+    Returns the output of a stage cached by the checkpoints module in
+options.cache under a key, unless options.force_stage forces it.
+Without a key nothing is cached.
+    '''
+    return checkpoints.cached(options.cache if key else None, stage, key, compute,
+                              options.force_stage or (), record)
+
+def read_chunks(file_name, columns, chunk_size, rows = None):
+    '''
+    Yields frames of at most chunk_size rows of a csv file, reading only
+the given columns and renaming them.
+
+    >>> import io
+    >>> data = io.StringIO('Title,Notes,Genre\\nJaws,long,Horror\\nDune,,Fantasy\\n')
+    >>> for chunk in read_chunks(data, {'Title':'title', 'Genre':'genre'}, 1):
+    ...     print(chunk.to_dict('records'))
+    [{'title': 'Jaws', 'genre': 'Horror'}]
+    [{'title': 'Dune', 'genre': 'Fantasy'}]
+    '''
+    reader = pd.read_csv(file_name, usecols = list(columns), chunksize = chunk_size,
+                         nrows = rows)
+    for chunk in reader:
+        yield chunk[list(columns)].rename(columns = columns)
+
+def unique_titles(chunks, seen = ()):
+    '''
+    Yields chunks without rows whose title was already seen, comparing
+titles by their titles.normalize key. seen are keys of titles kept before.
+Rows without a title are kept.
+
+    >>> import pandas as pd
+    >>> chunks = [pd.DataFrame({'title':['Jaws', 'JAWS!', None]}),\
+                  pd.DataFrame({'title':['Jaws', 'Dune', None]})]
+    >>> [chunk['title'].to_list() for chunk in unique_titles(chunks)]
+    [['Jaws', None], ['Dune', None]]
+    >>> [chunk['title'].to_list() for chunk in unique_titles(chunks[1:], {'dune'})]
+    [['Jaws', None]]
+    '''
+    seen = set(seen)
+    for chunk in chunks:
+        keys = chunk['title'].map(titles.normalize, na_action = 'ignore')
+        chunk = chunk[keys.isna() | (~keys.duplicated() & ~keys.isin(seen))]
+        seen.update(keys.dropna())
+        yield chunk
+
+def clean_chunks(chunks, executor = None, workers = 1, stop_words = None):
+    '''
+    Yields chunks with empty values replaced, a text column, an unprocessed
+title_pure column and tokenized title, desc and text columns. Rows whose
+title has no alphabet letters or digits are dropped. Stop words are
+cleaning.english_stop_words() unless given.
+    '''
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        chunk = cleaning.clean_empty(chunk.copy())
+        chunk = add_text(chunk)
+        chunk['title_pure'] = chunk['title']
+        chunk = parallel.clean_up(chunk, TOKEN_COLUMNS, executor, workers, stop_words)
+        yield chunk[chunk['title'].map(len) > 0]
+
+def compact_chunks(chunks, executor = None, workers = 1, stop_words = None, words = None):
+    '''
+    Yields chunks cleaned like clean_chunks with their title, desc and
+text columns tokenized straight into corpora of the shared words, as
+(chunk without these columns, dictionary column -> corpus) pairs.
+
+    >>> import pandas as pd
+    >>> chunk = pd.DataFrame({'title':['Jaws', '%%'], 'authors':['Benchley', 'Nobody'],\
+                              'desc':['A shark', 'Nothing'], 'genre':['Horror', 'None'],\
+                              'criteria':['1975', '2000']})
+    >>> frame, corpora = next(compact_chunks([chunk], stop_words = frozenset(['a'])))
+    >>> list(frame.columns), corpus.to_lists(corpora['desc'])
+    (['criteria', 'title_pure'], [['shark']])
+    '''
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        chunk = cleaning.clean_empty(chunk.copy())
+        chunk = add_text(chunk)
+        chunk['title_pure'] = chunk['title']
+        corpora = parallel.intern_columns(chunk, TOKEN_COLUMNS, executor, workers,
+                                          stop_words, words)
+        keep = corpus.lengths(corpora['title']) > 0
+        yield (chunk[keep].drop(columns = TOKEN_COLUMNS),
+               {column:corpus.select(tokens, keep) for column, tokens in corpora.items()})
 
+def concat_chunks(chunks, executor = None, workers = 1, words = None):
+    '''
+    Returns one frame of the chunks cleaned by clean_chunks and None, or
+with words the frame and corpora made by compact_chunks.
+    '''
+    if words is None:
+        return pd.concat(clean_chunks(chunks, executor, workers), ignore_index = True), None
+    frames, corpora = zip(*compact_chunks(chunks, executor, workers, words = words))
+    return (pd.concat(frames, ignore_index = True),
+            {column:corpus.concatenate([part[column] for part in corpora], words)
+             for column in TOKEN_COLUMNS})
+
+def write_cleaned(frame, corpora, file_name):
+    '''
+    Writes a cleaned frame to a csv file, with the words of the corpora
+of its token columns as lists written chunk by chunk.
+    '''
+    if corpora is None:
+        frame.to_csv(file_name)
+        return
+    with open(file_name, 'w', encoding = 'utf-8', newline = '') as file:
+        for start in range(0, max(len(frame), 1), CHUNK_SIZE):
+            part = frame.iloc[start:start + CHUNK_SIZE].copy()
+            for column, tokens in corpora.items():
+                part[column] = pd.Series(corpus.to_lists(tokens, start, start + len(part)),
+                                         index = part.index, dtype = object)
+            part[CLEANED_COLUMNS].to_csv(file, header = start == 0)
+
+def add_text(frame):
+    '''
+    Returns a frame with a text column concatting title, authors, desc
+and genre, without the genre and authors columns.
+
+    >>> import pandas as pd
+    >>> add_text(pd.DataFrame({'title':['Jaws'], 'authors':['Benchley'],\
+                               'desc':['Shark'], 'genre':['Horror']}))['text'][0]
+    'Jaws Benchley Shark Horror'
+    '''
+    frame['text'] = frame['title'] + ' ' + frame['authors'] + ' ' \
+                        + frame['desc'] + ' ' + frame['genre']
+    return frame.drop(columns = ['genre','authors'])
+
+def process(all_books_frame, films_frame, options, executor = None, report = None,
+            corpora = None, keys = None):
+    '''
+    Converts cleaned books and films to vectors and saves the vectors
+and neighbours of every criterion into the artifacts store.
+With an executor the steps are split between its worker processes;
+with a report of the profiling module every step is recorded.
+corpora are the books and films corpora of concat_chunks, when the
+frames have no token columns. With the checkpoint keys of the books and
+films, the steps of every criterion are checkpointed.
+    '''
+    books_corpora, films_corpora = corpora or (None, None)
     #Saving data into files.
-    all_books_frame.to_csv('all_books_frame.csv')
-    films_frame.to_csv('films_frame.csv')
-    books_frame_tfidf.to_csv('books_frame_tfidf.csv')
-    films_frame_tfidf.to_csv('films_frame_tfidf.csv')
-
-    #Adding tittle column.
-    books_frame_tfidf['title_pure'] = title['pure_books_titles']
-    films_frame_tfidf['title_pure'] = title['pure_title_films']
-
-    #Computing similarity of films and books on desc and title.
-    books_films_similarity_td = computations.similarity_between_frames(books_frame_tfidf,
-                                                            films_frame_tfidf,
-                                                            'desc', 'title')
-    #Computing similarity of films and books on text and text.
-    books_films_similarity_txtx = computations.similarity_between_frames(books_frame_tfidf,
-                                                            films_frame_tfidf,
-                                                            'text', 'text')
-    #Computing similarity of films and books on title and title.
-    books_films_similarity_ttl = computations.similarity_between_frames(books_frame_tfidf,
-                                                            films_frame_tfidf,
-                                                            'title', 'title')
-
-    #Setting up needed indexes.
-    books_films_similarity_td['title'] = books_frame_tfidf['title_pure']
-    books_films_similarity_td = books_films_similarity_td.set_index('title')
-
-    books_films_similarity_txtx['title'] = books_frame_tfidf['title_pure']
-    books_films_similarity_txtx = books_films_similarity_txtx.set_index('title')
-
-    books_films_similarity_ttl['title'] = books_frame_tfidf['title_pure']
-    books_films_similarity_ttl = books_films_similarity_ttl.set_index('title')
-
-    #Saving similarities into a file.
-    books_films_similarity_td.to_csv('books_films_similarity_td.csv')
-    books_films_similarity_txtx.to_csv('books_films_similarity_txtx.csv')
-    books_films_similarity_ttl.to_csv('books_films_similarity_ttl.csv')
+    with profiling.stage(report, 'writing csv files',
+                         len(all_books_frame) + len(films_frame)):
+        write_cleaned(all_books_frame, books_corpora, 'all_books_frame.csv')
+        write_cleaned(films_frame, films_corpora, 'films_frame.csv')
+
+    #Choosing vectors to compare: positional TF-IDF or cleaned tokens.
+    if options.legacy_scores:
+        with profiling.stage(report, 'legacy tfidf', len(all_books_frame) + len(films_frame)):
+            books_vectors = computations.dataframe_to_tfidf(all_books_frame.copy())
+            films_vectors = computations.dataframe_to_tfidf(films_frame.copy())
+    else:
+        books_vectors, films_vectors = all_books_frame.copy(), films_frame.copy()
+
+    #Computing similarity of films and books for every criterion.
+    arrays = {'books':books_vectors['title_pure'].to_numpy(dtype = str),
+              'films':films_vectors['title_pure'].to_numpy(dtype = str),
+              'stop_words':np.array(sorted(cleaning.english_stop_words()), dtype = str)}
+    index_arrays, matrices = titles.index_arrays(arrays['films'])
+    arrays.update(index_arrays)
+    documents = {}
+    for criterion, (key1, key2) in computations.CRITERIA.items():
+        criterion_arrays, criterion_matrices = criterion_artifacts(books_vectors,
+                                                                   films_vectors,
+                                                                   criterion, key1, key2,
+                                                                   options, executor, report,
+                                                                   corpora, keys)
+        arrays.update(criterion_arrays)
+        matrices.update(criterion_matrices)
+        documents[criterion] = len(books_vectors) + len(films_vectors)
+
+    #Saving vectors and neighbours into the artifacts store.
+    with profiling.stage(report, 'saving artifacts', len(books_vectors) + len(films_vectors)):
+        artifacts.save_artifacts(options.artifacts, arrays, matrices,
+                                 metadata = {'legacy_scores':options.legacy_scores,
+                                             'top_k':options.top_k,
+                                             'ann_probes':options.ann_probes,
+                                             'criteria':computations.CRITERIA,
+                                             'number_of_documents':documents},
+                                 dtype = options.dtype)
+
+def criterion_artifacts(books_vectors, films_vectors, criterion, key1, key2, options,
+                        executor = None, report = None, corpora = None, keys = None):
+    '''
+    Returns arrays and matrices of one similarity criterion: the vectors
+of criterion_vectors and the top_k best books for every film. With the
+checkpoint keys of the books and films, both steps are checkpointed.
+    '''
+    rows = len(books_vectors) + len(films_vectors)
+    tfidf_key = keys and checkpoints.stage_key('tfidf', keys, criterion, key1, key2,
+                                               options.legacy_scores)
+    with profiling.stage(report, f'tfidf {criterion}', rows) as record:
+        arrays, matrices = checkpoint(options, f'tfidf {criterion}', tfidf_key,
+                                      lambda: criterion_vectors(books_vectors, films_vectors,
+                                                                criterion, key1, key2, options,
+                                                                executor, corpora),
+                                      record)
+    similarity_key = keys and checkpoints.stage_key('similarity', tfidf_key, options.top_k,
+                                                    options.ann_probes)
+    with profiling.stage(report, f'similarity {criterion}', rows) as record:
+        neighbours = checkpoint(options, f'similarity {criterion}', similarity_key,
+                                lambda: artifacts.neighbours_to_arrays(
+                                            film_neighbours(books_vectors, films_vectors,
+                                                            matrices[criterion + '.books_tfidf'],
+                                                            matrices[criterion + '.films_tfidf'],
+                                                            options, executor),
+                                            list(films_vectors['title_pure']), criterion),
+                                record)
+    return {**arrays, **neighbours}, matrices
+
+def criterion_vectors(books_vectors, films_vectors, criterion, key1, key2, options,
+                      executor = None, corpora = None):
+    '''
+    Returns arrays and matrices of the vectors of one similarity criterion:
+TF-IDF matrices of books and films and the vocabulary with its inverse
+document frequences. The shared term space also keeps term counts and
+document frequences for incremental updates. With the books and films
+corpora of concat_chunks, matrices are built from them.
+    '''
+    rows = len(books_vectors) + len(films_vectors)
+    if corpora is None:
+        books_matrix, films_matrix, vocabulary, idf = parallel.frames_to_matrices(
+                                                        books_vectors, films_vectors,
+                                                        key1, key2, options.legacy_scores,
+                                                        executor, options.workers)
+    else:
+        books_tokens, films_tokens = corpora[0][key1], corpora[1][key2]
+        vocabulary, document_frequences, columns = corpus.build_vocabulary(books_tokens,
+                                                                           films_tokens)
+        idf = computations.inverse_document_frequences(document_frequences, rows)
+        books_matrix = corpus.tfidf_matrix(books_tokens, columns, idf)
+        films_matrix = corpus.tfidf_matrix(films_tokens, columns, idf)
+    arrays = {}
+    matrices = {criterion + '.books_tfidf':books_matrix,
+                criterion + '.films_tfidf':films_matrix}
+    if vocabulary is not None:
+        ones = np.ones(len(vocabulary))
+        if corpora is None:
+            books_counts = computations.documents_to_tfidf_matrix(books_vectors[key1],
+                                                                  vocabulary, ones)
+            films_counts = computations.documents_to_tfidf_matrix(films_vectors[key2],
+                                                                  vocabulary, ones)
+        else:
+            books_counts = corpus.tfidf_matrix(books_tokens, columns, ones)
+            films_counts = corpus.tfidf_matrix(films_tokens, columns, ones)
+        arrays[criterion + '.vocabulary'] = np.array(list(vocabulary), dtype = str)
+        arrays[criterion + '.idf'] = idf
+        arrays[criterion + '.document_frequences'] = np.bincount(
+                                    np.concatenate((books_counts.indices, films_counts.indices)),
+                                    minlength = len(vocabulary))
+        matrices[criterion + '.books_counts'] = books_counts
+        matrices[criterion + '.films_counts'] = films_counts
+    return arrays, matrices
+
+def film_neighbours(books_vectors, films_vectors, books_matrix, films_matrix, options,
+                    executor = None):
+    '''
+    Returns the options.top_k best books of every film, found exactly
+or by an approximate index with options.ann_probes.
+    '''
+    if options.ann_probes:
+        return ann.top_k_neighbours(books_matrix, films_matrix, books_vectors['title_pure'],
+                                    films_vectors['title_pure'], options.top_k,
+                                    options.ann_probes)
+    return parallel.top_k_neighbours(books_matrix, films_matrix, books_vectors['title_pure'],
+                                     films_vectors['title_pure'], options.top_k,
+                                     options.chunk_size, executor)
+
+def parse_arguments(arguments = None):
+    '''
+    Parses command line arguments of the preprocessing.
+
+    >>> parse_arguments(['--legacy-scores']).legacy_scores
+    True
+    '''
+    parser = argparse.ArgumentParser(description = 'Preprocess books and films.')
+    parser.add_argument('--legacy-scores', action = 'store_true',
+                        help = 'compare positional TF-IDF vectors like older versions')
+    parser.add_argument('--top-k', type = int, default = computations.TOP_K,
+                        help = 'number of best books kept for every film')
+    parser.add_argument('--chunk-size', type = int, default = CHUNK_SIZE,
+                        help = 'number of books compared with films at once')
+    parser.add_argument('--dtype', choices = artifacts.DTYPES, default = 'float64',
+                        help = 'precision of saved scores and TF-IDF weights')
+    parser.add_argument('--artifacts', default = artifacts.DIRECTORY,
+                        help = 'directory of the artifacts store')
+    parser.add_argument('--workers', type = int, default = 1,
+                        help = 'number of worker processes')
+    parser.add_argument('--films', default = 'films_imdb.csv',
+                        help = 'csv file with scraped films')
+    parser.add_argument('--books-rows', type = int, default = None,
+                        help = 'number of rows read from book_data.csv, all by default')
+    parser.add_argument('--topics-rows', type = int, default = None,
+                        help = 'number of rows read from topics.csv, all by default')
+    parser.add_argument('--ann-probes', type = int, default = None,
+                        help = 'find best books with an approximate index probing this '
+                               'many clusters instead of comparing all books')
+    parser.add_argument('--profile-report', default = None,
+                        help = 'json file for the time, cpu time and memory of every stage')
+    parser.add_argument('--profiles', default = None,
+                        help = 'directory for cProfile statistics of every stage '
+                               'of the profile report')
+    parser.add_argument('--read-chunk-size', type = int, default = READ_CHUNK_SIZE,
+                        help = 'number of csv rows read and cleaned at once')
+    parser.add_argument('--cache', default = checkpoints.CACHE_DIRECTORY,
+                        help = 'directory of the checkpoints of every stage, '
+                               'empty to run all stages without checkpoints')
+    parser.add_argument('--force-stage', action = 'append', choices = checkpoints.STAGES,
+                        help = 'run a stage and the stages after it again '
+                               'even when it is checkpointed')
+    return parser.parse_args(arguments)
 
 if __name__ == '__main__':
-    main()
+    main(parse_arguments())
@@ -0,0 +1,160 @@
+'''
+Stage instrumentation of the preprocessing and the recommendations.
+
+A report is a dictionary collecting one record per stage: wall time, CPU
+time of the process, CPU time of its finished child processes, rows
+processed and the change of resident memory, and measured values that are
+not stages by name. The workers of a process pool count as finished once
+the pool is shut down, so their CPU time is left out of the stages using a
+pool that outlives them. With a profiles directory every stage is also run under cProfile and its
+statistics are saved there. Functions taking a report do nothing more when
+it is None.
+'''
+
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def new_report(profiles = None):
+    '''
+    Returns an empty report, saving cProfile statistics of every stage
+into the profiles directory when it is given.
+    '''
+    if profiles:
+        os.makedirs(profiles, exist_ok = True)
+    return {'stages':[], 'values':{}, 'profiles':profiles, 'started':time.time()}
+
+def record_value(report, name, value):
+    '''
+    Records a measured value of a report under a name.
+
+    >>> report = new_report()
+    >>> record_value(report, 'first result seconds', 0.25)
+    >>> report['values']
+    {'first result seconds': 0.25}
+    '''
+    if report is not None:
+        report['values'][name] = value
+
+def memory():
+    '''
+    Returns the resident memory of the process in megabytes: the current one
+where /proc is available, the peak one otherwise, None without both.
+    '''
+    try:
+        with open('/proc/self/statm', 'r', encoding = 'ascii') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+def children_cpu():
+    '''
+    Returns the user and system CPU seconds of the finished child
+processes of the process, None without the resource module.
+    '''
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+@contextmanager
+def stage(report, name, rows = None):
+    '''
+    Records a stage of a report. The record is given to the block,
+which may set its 'rows' when they are known at the end only.
+
+    >>> report = new_report()
+    >>> with stage(report, 'counting', rows = 3) as record:
+    ...     total = sum(range(3))
+    >>> [record['stage'] for record in report['stages']], report['stages'][0]['rows']
+    (['counting'], 3)
+    >>> with stage(None, 'nothing') as record:
+    ...     print(record)
+    None
+    '''
+    if report is None:
+        yield None
+        return
+    record = {'stage':name, 'rows':rows}
+    profiler = cProfile.Profile() if report['profiles'] else None
+    memory_before = memory()
+    cpu = time.process_time()
+    children = children_cpu()
+    wall = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        yield record
+    finally:
+        if profiler:
+            profiler.disable()
+        record['wall seconds'] = time.perf_counter() - wall
+        record['cpu seconds'] = time.process_time() - cpu
+        record['children cpu seconds'] = None if children is None \
+                                             else children_cpu() - children
+        memory_after = memory()
+        record['memory MB'] = memory_after
+        record['memory delta MB'] = None if memory_before is None \
+                                        else memory_after - memory_before
+        if profiler:
+            path = os.path.join(report['profiles'], name.replace(' ', '_') + '.prof')
+            profiler.dump_stats(path)
+            record['profile'] = path
+            record['top functions'] = top_functions(path, 5)
+        report['stages'].append(record)
+
+def format_report(report):
+    '''
+    Returns a table of the stages of a report with their share of
+the total wall time, followed by its measured values.
+
+    >>> report = new_report()
+    >>> with stage(report, 'counting'):
+    ...     total = sum(range(3))
+    >>> [cell.strip() for cell in format_report(report).splitlines()[1].split('|')[4:6]]
+    ['process cpu s', 'children cpu s']
+    '''
+    #Imported here, so that importing main for a one-shot query does not import it.
+    from tabulate import tabulate
+    total = sum(record['wall seconds'] for record in report['stages']) or 1.0
+    rows = [[record['stage'], record['rows'], record['wall seconds'], record['cpu seconds'],
+             record.get('children cpu seconds'), 100 * record['wall seconds'] / total,
+             record['memory delta MB']]
+            for record in report['stages']]
+    table = tabulate(rows, headers = ['stage', 'rows', 'wall s', 'process cpu s',
+                                      'children cpu s', 'wall %', 'memory delta MB'],
+                     tablefmt = 'grid', floatfmt = '.3f')
+    return '\n'.join([table] + [f'{name}: {value:.3f}' if isinstance(value, float)
+                                else f'{name}: {value}'
+                                for name, value in report.get('values', {}).items()])
+
+def write_report(report, file_name):
+    '''
+    Writes a report to a JSON file and prints its table.
+    '''
+    with open(file_name, 'w', encoding = 'utf-8') as file:
+        json.dump(report, file, indent = 2, ensure_ascii = False)
+    print(format_report(report))
+
+def top_functions(path, count = 10):
+    '''
+    Returns the count functions with the largest cumulative time
+of saved cProfile statistics.
+    '''
+    statistics = pstats.Stats(path)
+    functions = sorted(statistics.stats.items(), key = lambda item: -item[1][3])[:count]
+    return [{'function':f'{file}:{line}({name})', 'calls':calls,
+             'cumulative seconds':cumulative}
+            for (file, line, name), (_, calls, _, cumulative, _) in functions]
@@ -0,0 +1,98 @@
+'''
+One-shot recommendations with a fast cold start.
+
+A single history is answered straight from the arrays of the artifacts
+store: only numpy, scipy and the arrays the history needs are loaded, and
+neither pandas nor NLTK are imported. Titles of the history are first
+resolved into titles of the store (see the titles module). The books of the
+title matching criteria are searched through inverted indexes only for films
+missing from the store. The results are those of main and the server:
+
+    python -m recommandation_engine_2023.query history.txt
+'''
+
+import sys
+import json
+import argparse
+import numpy as np
+from recommandation_engine_2023 import artifacts
+from recommandation_engine_2023 import fusion
+from recommandation_engine_2023 import inverted
+from recommandation_engine_2023 import titles
+
+def film_books(store, criterion, film, top = 5):
+    '''
+    Returns the titles of the best books of a film by a criterion,
+in the order of the neighbour index like computations.find_best_matches.
+    '''
+    arrays = store['arrays']
+    ids = np.flatnonzero(arrays['films'] == film)
+    rows = np.flatnonzero(np.isin(arrays[criterion + '.film'], ids))[:top]
+    return [str(title) for title in arrays['books'][arrays[criterion + '.book'][rows]]]
+
+def recommend(directory, history, top = 5):
+    '''
+    Returns the history with its titles resolved into titles of a store,
+the resolved titles, the general books, the books of every film by every
+criterion and the films missing from the store.
+
+    >>> import sys
+    >>> import tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> artifacts.save_artifacts(directory, {'films':['Jaws'], 'books':['Sea', 'Sand'],\
+                                             'td.film':np.array([0, 0]),\
+                                             'td.book':np.array([1, 0]),\
+                                             'td.score':np.array([0.9, 0.5])},\
+                                 metadata = {'criteria':{'td':['desc', 'title']}})
+    >>> recommend(directory, ['JAWS', 'Up'], top = 1)
+    {'history': ['Jaws', 'Up'], 'resolved': {'JAWS': 'Jaws'}, 'general': ['Sand'], \
+'criteria': {'td': {'Jaws': ['Sand'], 'Up': []}}, 'unknown': ['Up']}
+    >>> import subprocess
+    >>> code = 'import sys; from recommandation_engine_2023 import query; '\
+               'print("pandas" in sys.modules or "nltk" in sys.modules)'
+    >>> subprocess.run([sys.executable, '-c', code], capture_output = True, text = True).stdout
+    'False\\n'
+    '''
+    criteria = artifacts.load_artifacts(directory, [])['metadata']['criteria']
+    names = ['films', 'books', 'films.keys', 'films.trigrams', 'films.postings'] \
+                + [criterion + part for criterion in criteria
+                   for part in ('.film', '.book', '.score')]
+    store = artifacts.load_artifacts(directory, names)
+    history, resolved = titles.resolve_history(titles.load_index(store), history)
+    model = fusion.load_fusion(store, criteria)
+    general, _ = fusion.fused_top(model, history, top)
+    unknown = [film for film in history if film not in model['ids']]
+
+    indexes = {}
+    if unknown:
+        names += [criterion + part for criterion, (_, key2) in criteria.items()
+                  if key2 == 'title' for part in ('.vocabulary', '.idf', '.books_tfidf')]
+        store = artifacts.load_artifacts(directory, names)
+        indexes = inverted.load_indexes(store)
+    books = {criterion:{film:film_books(store, criterion, film, top)
+                        if film in model['ids'] or criterion not in indexes
+                        else inverted.title_best_matches(indexes[criterion], film, top)
+                        for film in history}
+             for criterion in criteria}
+    return {'history':history, 'resolved':resolved, 'general':[str(title) for title in general],
+            'criteria':books, 'unknown':unknown}
+
+def main(arguments = None):
+    '''
+    Prints the recommendations for a history file as JSON.
+    '''
+    parser = argparse.ArgumentParser(description = 'Recommend books for a history of films.')
+    parser.add_argument('history', help = 'file with a film title per line')
+    parser.add_argument('--artifacts', default = artifacts.DIRECTORY,
+                        help = 'directory of the artifacts store')
+    parser.add_argument('--top', type = int, default = 5)
+    arguments = parser.parse_args(arguments)
+
+    with open(arguments.history, 'r', encoding = 'utf-8') as file:
+        history = file.read().splitlines()
+    json.dump(recommend(arguments.artifacts, history, arguments.top), sys.stdout,
+              ensure_ascii = False, indent = 2)
+    print()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+'''
+Recommendation server.
+
+The neighbour indexes of the artifacts store are loaded once at startup
+and kept in memory. The server speaks a small subset of HTTP/1.1 with
+keep-alive connections:
+
+    GET /health                      -> {"status": "ok", "films": ..., "cache": {...}}
+    POST /recommend {"history": [...], "top": 5,
+                     "weights": {"td": 1.0, ...}, "normalisation": "none"}
+                                     -> {"history": [...], "resolved": {...},
+                                         "general": [...], "criteria": {"td": {film: [...]}, ...},
+                                         "unknown": [...]}
+
+Titles of the history are resolved into titles of the store (see the
+titles module) and the resolved ones are listed in "resolved" with the
+title they resolved to. Films missing from the store are listed in "unknown"; criteria comparing
+books with film titles match them by the words of their title through an
+inverted index, other criteria give them empty lists.
+The general books fuse the criteria with the given weights (1 by default)
+and normalisation (see fusion.NORMALISATIONS). Books of every film are
+cached by criterion, film and top; when the store changes on disk a new
+model is loaded in a thread before the next request, replaces the old one
+at once and the cache is cleared.
+'''
+
+import json
+import math
+import asyncio
+import threading
+import argparse
+import traceback
+from recommandation_engine_2023 import artifacts
+from recommandation_engine_2023 import caching
+from recommandation_engine_2023 import computations
+from recommandation_engine_2023 import fusion
+from recommandation_engine_2023 import inverted
+from recommandation_engine_2023 import titles
+
+HOST = '127.0.0.1'
+PORT = 8023
+REASONS = {200:'OK', 400:'Bad Request', 404:'Not Found', 405:'Method Not Allowed',
+           500:'Internal Server Error'}
+
+def load_model(directory = artifacts.DIRECTORY, cache = None):
+    '''
+    Returns the neighbour indexes and inverted indexes of a store by
+criterion, its fusion model, its title resolution index, its version and
+a cache of books by film. Film titles are categorical, so looking a film up
+compares integer codes.
+    '''
+    version = artifacts.version(directory)
+    store = artifacts.load_artifacts(directory)
+    model = {'neighbours':{}, 'indexes':inverted.load_indexes(store),
+             'fusion':fusion.load_fusion(store), 'titles':titles.load_index(store),
+             'directory':directory,
+             'version':version, 'cache':caching.new_cache() if cache is None else cache}
+    for criterion in store['metadata']['criteria']:
+        neighbours = artifacts.load_neighbours(store, criterion)
+        neighbours['film'] = neighbours['film'].astype('category')
+        model['neighbours'][criterion] = neighbours
+    return model
+
+def new_state(model):
+    '''
+    Returns the state of a server answering with a model.
+    '''
+    return {'model':model, 'lock':threading.Lock()}
+
+def refresh(state):
+    '''
+    Returns the model of a server state, replaced by a new model first
+when its store has changed since it was loaded. Models are never changed,
+so a request answered with one model meanwhile does not see the new one.
+The cache is kept and cleared by the new version on its next lookup.
+
+    >>> import tempfile
+    >>> import numpy as np
+    >>> directory = tempfile.mkdtemp()
+    >>> artifacts.save_artifacts(directory, {'films':['Jaws'], 'books':['Sea'],\
+                                             'td.film':np.array([0]), 'td.book':np.array([0]),\
+                                             'td.score':np.array([0.9])},\
+                                 metadata = {'criteria':{'td':['desc', 'title']}})
+    >>> state = new_state(load_model(directory))
+    >>> model = refresh(state)
+    >>> artifacts.update_artifacts(directory, metadata = {'top_k':1})
+    >>> new_model = refresh(state)
+    >>> new_model is model, refresh(state) is new_model
+    (False, True)
+    '''
+    model = state['model']
+    if artifacts.version(model['directory']) != model['version']:
+        with state['lock']:
+            model = state['model']
+            if artifacts.version(model['directory']) != model['version']:
+                state['model'] = load_model(model['directory'], model['cache'])
+    return state['model']
+
+def answer(model, method, path, body):
+    '''
+    Returns a status and a JSON-serialisable response to a request
+for a model made by load_model.
+
+    >>> import tempfile
+    >>> import numpy as np
+    >>> directory = tempfile.mkdtemp()
+    >>> artifacts.save_artifacts(directory, {'films':['Jaws'], 'books':['Sea'],\
+                                             'td.film':np.array([0]), 'td.book':np.array([0]),\
+                                             'td.score':np.array([0.9])},\
+                                 metadata = {'criteria':{'td':['desc', 'title']}})
+    >>> model = load_model(directory)
+    >>> answer(model, 'POST', '/recommend', b'{"history": ["jaws", "Up"], "top": 1}')
+    (200, {'history': ['Jaws', 'Up'], 'resolved': {'jaws': 'Jaws'}, 'general': ['Sea'], \
+'criteria': {'td': {'Jaws': ['Sea'], 'Up': []}}, 'unknown': ['Up']})
+    >>> answer(model, 'GET', '/health', b'')
+    (200, {'status': 'ok', 'films': 1, 'cache': {'entries': 2, 'hits': 0, 'misses': 2, \
+'evictions': 0, 'expirations': 0, 'invalidations': 0}})
+    >>> answer(model, 'POST', '/recommend', b'{"top": 1}')
+    (400, {'error': 'history must be a list of film titles'})
+    >>> answer(model, 'POST', '/recommend', b'{"history": ["Jaws"], "top": true}')
+    (400, {'error': 'top must be a positive integer'})
+    >>> answer(model, 'POST', '/recommend', b'{"history": [], "weights": {"genre": 1}}')
+    (400, {'error': 'Unknown criteria: genre.'})
+    >>> answer(model, 'POST', '/recommend', b'{"history": [], "weights": {"td": "1"}}')
+    (400, {'error': 'weights must be an object of criterion -> number'})
+    >>> answer(model, 'POST', '/recommend', b'{"history": [], "normalisation": "min"}')
+    (400, {'error': 'normalisation must be one of none, max, sum'})
+    '''
+    if path == '/health':
+        if method != 'GET':
+            return 405, {'error':'use GET'}
+        films = set().union(*(frame['film'].cat.categories
+                              for frame in model['neighbours'].values()))
+        return 200, {'status':'ok', 'films':len(films),
+                     'cache':caching.statistics(model['cache'])}
+    if path != '/recommend':
+        return 404, {'error':f'unknown path {path}'}
+    if method != 'POST':
+        return 405, {'error':'use POST'}
+
+    try:
+        request = json.loads(body or b'{}')
+    except ValueError:
+        return 400, {'error':'body must be JSON'}
+    if not isinstance(request, dict):
+        return 400, {'error':'body must be a JSON object'}
+    history = request.get('history')
+    top = request.get('top', 5)
+    if not isinstance(history, list) or not all(isinstance(film, str) for film in history):
+        return 400, {'error':'history must be a list of film titles'}
+    if not isinstance(top, int) or isinstance(top, bool) or top < 1:
+        return 400, {'error':'top must be a positive integer'}
+    weights = request.get('weights')
+    normalisation = request.get('normalisation', 'none')
+    if weights is not None and (not isinstance(weights, dict) or not all(
+            isinstance(weight, (int, float)) and not isinstance(weight, bool)
+            and math.isfinite(weight) for weight in weights.values())):
+        return 400, {'error':'weights must be an object of criterion -> number'}
+    if not isinstance(normalisation, str) or normalisation not in fusion.NORMALISATIONS:
+        return 400, {'error':'normalisation must be one of '
+                              + ', '.join(fusion.NORMALISATIONS)}
+
+    history, resolved = titles.resolve_history(model['titles'], history)
+    #The version is read first, so results of a model reloaded meanwhile
+    #are cached under the old version at worst and cleared later.
+    version = model['version']
+    try:
+        general, _ = fusion.fused_top(model['fusion'], history, top, weights, normalisation)
+    except ValueError as error:
+        return 400, {'error':str(error)}
+    neighbours = model['neighbours']
+    return 200, {'history':history, 'resolved':resolved, 'general':general,
+                 'criteria':computations.films_best_matches(neighbours, history, top,
+                                                            model['cache'], version,
+                                                            model['indexes']),
+                 'unknown':[film for film in history
+                            if not any(film in frame['film'].cat.categories
+                                       for frame in neighbours.values())]}
+
+def encode(status, response, keep_alive = True):
+    '''
+    Returns an HTTP response with a JSON body.
+
+    >>> encode(404, {'error':'?'}, keep_alive = False)
+    b'HTTP/1.1 404 Not Found\\r\\nContent-Type: application/json\\r\\n\
+Content-Length: 14\\r\\nConnection: close\\r\\n\\r\\n{"error": "?"}'
+    '''
+    body = json.dumps(response, ensure_ascii = False).encode('utf-8')
+    head = (f'HTTP/1.1 {status} {REASONS[status]}\r\n'
+            f'Content-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+    return head.encode('ascii') + body
+
+async def handle(state, reader, writer):
+    '''
+    Answers requests of one connection until the client closes it.
+Models are reloaded and recommendations are computed in a thread, so slow
+requests and reloads do not hold other connections. A request failing
+there is answered with status 500 and its traceback is printed.
+    '''
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                method, path, version = line.decode('latin-1').split()
+            except ValueError:
+                writer.write(encode(400, {'error':'bad request line'}, keep_alive = False))
+                break
+            headers = {}
+            while True:
+                header = await reader.readline()
+                if header in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = header.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+            keep_alive = headers.get('connection', '').lower() != 'close' \
+                            and version == 'HTTP/1.1'
+            try:
+                model = await loop.run_in_executor(None, refresh, state)
+                status, response = await loop.run_in_executor(None, answer, model,
+                                                              method, path, body)
+            except Exception:
+                traceback.print_exc()
+                status, response = 500, {'error':'internal server error'}
+            writer.write(encode(status, response, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(model, host = HOST, port = PORT):
+    '''
+    Serves recommendations of a model until cancelled.
+    '''
+    state = new_state(model)
+    server = await asyncio.start_server(lambda reader, writer: handle(state, reader, writer),
+                                        host, port)
+    print(f'Serving {len(model["neighbours"])} criteria on http://{host}:{port}')
+    async with server:
+        await server.serve_forever()
+
+def main():
+    '''
+    Loads the artifacts store and serves recommendations on localhost.
+    '''
+    parser = argparse.ArgumentParser(description = 'Serve book recommendations.')
+    parser.add_argument('--host', default = HOST)
+    parser.add_argument('--port', type = int, default = PORT)
+    parser.add_argument('--artifacts', default = artifacts.DIRECTORY)
+    parser.add_argument('--cache-size', type = int, default = caching.SIZE,
+                        help = 'most (criterion, film, top) results kept')
+    parser.add_argument('--cache-ttl', type = float, default = None,
+                        help = 'seconds a cached result lives, forever by default')
+    arguments = parser.parse_args()
+
+    model = load_model(arguments.artifacts,
+                       caching.new_cache(arguments.cache_size, arguments.cache_ttl))
+    try:
+        asyncio.run(serve(model, arguments.host, arguments.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+'''
+Resolution of user titles into the titles of a catalogue.
+
+Titles are compared by a normalised key: accents removed, case folded and
+everything but letters and digits turned into single spaces. A title whose
+key is in the catalogue resolves through a hash map; other titles resolve
+to the catalogue title sharing the most trigrams of their keys, when the
+Jaccard similarity of both trigram sets reaches a threshold and both
+have the same numbers, so that sequels do not resolve to each other. Trigrams are
+kept as a CSR trigrams x titles postings matrix, so a fuzzy lookup touches
+only titles sharing a trigram with the query.
+'''
+
+import re
+import unicodedata
+import numpy as np
+from scipy import sparse
+
+THRESHOLD = 0.6
+NON_ALPHANUMERIC = re.compile(r'[\W_]+')
+ROMAN = {'i':1, 'ii':2, 'iii':3, 'iv':4, 'v':5, 'vi':6, 'vii':7, 'viii':8, 'ix':9, 'x':10}
+
+def normalize(title):
+    '''
+    Returns the key of a title.
+
+    >>> normalize('  The Godfather: Part II ')
+    'the godfather part ii'
+    >>> normalize('Amélie')
+    'amelie'
+    '''
+    title = unicodedata.normalize('NFKD', str(title))
+    title = ''.join(letter for letter in title if not unicodedata.combining(letter))
+    return NON_ALPHANUMERIC.sub(' ', title.casefold()).strip()
+
+def trigrams(key):
+    '''
+    Returns the set of trigrams of a key, with every word padded
+by two spaces before and one after.
+
+    >>> sorted(trigrams('up'))
+    ['  u', ' up', 'up ']
+    '''
+    grams = set()
+    for word in key.split():
+        word = f'  {word} '
+        grams.update(word[start:start + 3] for start in range(len(word) - 2))
+    return grams
+
+def numbers(key):
+    '''
+    Returns the set of numbers written in digits or roman numerals in a key.
+
+    >>> sorted(numbers('rocky ii 1979 and 3'))
+    [2, 3, 1979]
+    '''
+    return {int(word) if word.isdigit() else ROMAN[word] for word in key.split()
+            if word.isdigit() or word in ROMAN}
+
+def index_arrays(titles, name = 'films'):
+    '''
+    Returns the arrays and matrices of a resolution index of titles
+to save into a store under a name: the keys of the titles, the sorted
+trigrams and the trigrams x titles postings.
+    '''
+    keys = [normalize(title) for title in titles]
+    grams = [sorted(trigrams(key)) for key in keys]
+    vocabulary = sorted(set().union(*grams))
+    columns = {gram:column for column, gram in enumerate(vocabulary)}
+    rows = np.repeat(np.arange(len(grams)), [len(title_grams) for title_grams in grams])
+    columns = np.array([columns[gram] for title_grams in grams for gram in title_grams],
+                       dtype = np.int64)
+    postings = sparse.csr_matrix((np.ones(len(columns)), (columns, rows)),
+                                 shape = (len(vocabulary), len(keys)))
+    return ({name + '.keys':np.array(keys, dtype = str),
+             name + '.trigrams':np.array(vocabulary, dtype = str)},
+            {name + '.postings':postings})
+
+def build_index(titles, keys = None, vocabulary = None, postings = None):
+    '''
+    Returns a resolution index of titles, from the saved keys, trigrams
+and postings of index_arrays when given. Repeated keys resolve to their
+first title.
+
+    >>> index = build_index(['Jaws', 'The Godfather', 'The Godfather: Part II'])
+    >>> resolve(index, 'the godfather'), resolve(index, 'Godfather Part 2')
+    (1, 2)
+    >>> resolve(index, 'The Godfather Part III'), resolve(index, 'Up')
+    (None, None)
+    '''
+    if keys is None:
+        arrays, matrices = index_arrays(titles)
+        keys, vocabulary = arrays['films.keys'], arrays['films.trigrams']
+        postings = matrices['films.postings']
+    ids = {}
+    exact = {}
+    for position, (title, key) in enumerate(zip(titles, keys)):
+        ids.setdefault(str(key), position)
+        exact.setdefault(str(title), position)
+    sizes = np.bincount(postings.indices, minlength = postings.shape[1])
+    return {'titles':titles, 'keys':keys, 'exact':exact, 'ids':ids, 'postings':postings,
+            'sizes':sizes, 'trigrams':{str(gram):row for row, gram in enumerate(vocabulary)}}
+
+def load_index(store, name = 'films'):
+    '''
+    Returns the resolution index of the name titles of a store, built
+from the titles for stores saved without one.
+    '''
+    arrays = store['arrays']
+    if name + '.keys' not in arrays:
+        return build_index(arrays[name])
+    return build_index(arrays[name], arrays[name + '.keys'], arrays[name + '.trigrams'],
+                       store['matrices'][name + '.postings'])
+
+def resolve(index, title, threshold = THRESHOLD):
+    '''
+    Returns the id of the catalogue title of a title, None when no
+title is similar enough. Equal similarities resolve to the first title.
+    '''
+    position = index['exact'].get(title)
+    if position is not None:
+        return position
+    key = normalize(title)
+    position = index['ids'].get(key)
+    if position is not None or threshold > 1:
+        return position
+    rows = [index['trigrams'][gram] for gram in trigrams(key) if gram in index['trigrams']]
+    if not rows:
+        return None
+    postings = index['postings']
+    found = np.concatenate([postings.indices[postings.indptr[row]:postings.indptr[row + 1]]
+                            for row in rows])
+    candidates, shared = np.unique(found, return_counts = True)
+    similarity = shared / (len(trigrams(key)) + index['sizes'][candidates] - shared)
+    for best in np.argsort(-similarity, kind = 'stable'):
+        if similarity[best] < threshold:
+            break
+        if numbers(str(index['keys'][candidates[best]])) == numbers(key):
+            return int(candidates[best])
+    return None
+
+def resolve_history(index, history, threshold = THRESHOLD):
+    '''
+    Returns a history with every title replaced by its catalogue title,
+unresolved titles unchanged, and a dictionary of the replaced titles.
+
+    >>> index = build_index(['Jaws', 'The Godfather'])
+    >>> resolve_history(index, ['JAWS', 'Jaws', 'Up'])
+    (['Jaws', 'Jaws', 'Up'], {'JAWS': 'Jaws'})
+    '''
+    resolved = []
+    replaced = {}
+    for title in history:
+        position = resolve(index, title, threshold)
+        film = title if position is None else str(index['titles'][position])
+        if film != title:
+            replaced[title] = film
+        resolved.append(film)
+    return resolved, replaced
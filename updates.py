@@ -0,0 +1,241 @@
+'''
+Incremental updates of the artifacts store.
+
+New books and films are added to a store made by the preprocessing
+without recomputing it: document frequences are updated, new rows are
+vectorised with the stored inverse document frequences and only the
+similarities of new books and new films are computed. When the stored
+inverse document frequences drift too far from the updated counts,
+vectors and neighbours of the criterion are rebuilt from the stored counts.
+'''
+
+import argparse
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from recommandation_engine_2023 import artifacts
+from recommandation_engine_2023 import cleaning
+from recommandation_engine_2023 import computations
+from recommandation_engine_2023 import parallel
+from recommandation_engine_2023 import preprocessing
+from recommandation_engine_2023 import titles
+
+DRIFT_THRESHOLD = 0.1
+
+def idf_drift(used_idf, idf, document_frequences):
+    '''
+    Returns the mean change of inverse document frequence over the words
+the stored vectors were built with, weighted by how many stored
+documents contain every word.
+
+    >>> import numpy as np
+    >>> round(idf_drift(np.array([0.5, 1.0]), np.array([0.6, 0.7, 2.0]),\
+                        np.array([3, 1])), 4)
+    0.15
+    '''
+    if len(used_idf) == 0 or np.sum(document_frequences) == 0:
+        return 0.0
+    change = np.abs(idf[:len(used_idf)] - used_idf)
+    return float(np.average(change, weights = document_frequences))
+
+def prepare(frame, stop_words = None):
+    '''
+    Returns a frame of new books or films (title, authors, desc and
+genre columns) cleaned and tokenized like the preprocessing does.
+    '''
+    frame = frame.reindex(columns = ['title', 'authors', 'desc', 'genre', 'criteria'])
+    frames = list(preprocessing.clean_chunks([frame], stop_words = stop_words))
+    if not frames:
+        return pd.DataFrame(columns = ['title', 'desc', 'criteria', 'text', 'title_pure'])
+    return frames[0].reset_index(drop = True)
+
+def stored_top_k(store, criterion, films, k):
+    '''
+    Returns k x films arrays of the best scores and books of a criterion
+with -inf for missing places. films are row titles; a repeated title
+keeps its last row like the preprocessing.
+    '''
+    arrays = store['arrays']
+    last_rows = {title:position for position, title in enumerate(films)}
+    columns = {last_rows[title]:column
+               for column, title in enumerate(dict.fromkeys(films))}
+    scores = np.full((k, len(columns)), -np.inf)
+    books = np.zeros((k, len(columns)), dtype = np.int64)
+    ranks = np.zeros(len(columns), dtype = np.int64)
+    for film, book, score in zip(arrays[criterion + '.film'], arrays[criterion + '.book'],
+                                 artifacts.values(store, criterion + '.score')):
+        column = columns[int(film)]
+        if ranks[column] < k:
+            scores[ranks[column], column] = score
+            books[ranks[column], column] = book
+            ranks[column] += 1
+    return scores, books
+
+def _pad(scores, books, k):
+    '''
+    Returns best scores and books padded with -inf to k rows.
+    '''
+    missing = k - scores.shape[0]
+    return (np.vstack((scores, np.full((missing, scores.shape[1]), -np.inf))),
+            np.vstack((books, np.zeros((missing, books.shape[1]), dtype = books.dtype))))
+
+def _widen(matrix, width):
+    '''
+    Returns a CSR copy of a matrix with width columns.
+    '''
+    matrix = sparse.csr_matrix(matrix, copy = True)
+    matrix.resize((matrix.shape[0], width))
+    return matrix
+
+def update_criterion(store, criterion, books, films, threshold = DRIFT_THRESHOLD,
+                     chunk_size = None, executor = None):
+    '''
+    Returns updated arrays, matrices and number of documents of a criterion
+after adding new books and films, and whether it was rebuilt.
+    '''
+    key1, key2 = store['metadata']['criteria'][criterion]
+    arrays = store['arrays']
+    k = store['metadata']['top_k']
+    old_books = len(arrays['books'])
+    old_films = list(arrays['films'])
+    new_films = list(films['title_pure'])
+
+    #Updating the vocabulary and document frequences.
+    vocabulary = {word:column for column, word in enumerate(arrays[criterion + '.vocabulary'])}
+    new_documents = list(books[key1]) + list(films[key2])
+    vocabulary, document_frequences = computations.merge_vocabularies(
+                            [(vocabulary, arrays[criterion + '.document_frequences']),
+                             computations.build_vocabulary(new_documents)])
+    number_of_documents = store['metadata']['number_of_documents'][criterion] \
+                            + len(new_documents)
+    idf = computations.inverse_document_frequences(document_frequences, number_of_documents)
+    used_idf = np.asarray(artifacts.values(store, criterion + '.idf'), dtype = np.float64)
+    drift = idf_drift(used_idf, idf, arrays[criterion + '.document_frequences'])
+
+    #Counting terms of new books and films.
+    ones = np.ones(len(vocabulary))
+    width = len(vocabulary)
+    new_books_counts = computations.documents_to_tfidf_matrix(books[key1], vocabulary, ones)
+    new_films_counts = computations.documents_to_tfidf_matrix(films[key2], vocabulary, ones)
+    books_counts = sparse.vstack((_widen(artifacts.matrix(store, criterion + '.books_counts'),
+                                         width), new_books_counts), format = 'csr')
+    films_counts = sparse.vstack((_widen(artifacts.matrix(store, criterion + '.films_counts'),
+                                         width), new_films_counts), format = 'csr')
+    all_films = old_films + new_films
+
+    rebuilt = drift > threshold
+    if rebuilt:
+        books_tfidf = sparse.csr_matrix(books_counts.multiply(idf[None, :]))
+        films_tfidf = sparse.csr_matrix(films_counts.multiply(idf[None, :]))
+        scores, book_ids, columns = parallel.top_k_arrays(books_tfidf, films_tfidf,
+                                                          all_films, k, chunk_size,
+                                                          executor)
+    else:
+        idf = np.concatenate((used_idf, idf[len(used_idf):]))
+        new_books_tfidf = sparse.csr_matrix(new_books_counts.multiply(idf[None, :]))
+        new_films_tfidf = sparse.csr_matrix(new_films_counts.multiply(idf[None, :]))
+        books_tfidf = sparse.vstack((_widen(artifacts.matrix(store, criterion + '.books_tfidf'),
+                                            width), new_books_tfidf), format = 'csr')
+        old_films_tfidf = _widen(artifacts.matrix(store, criterion + '.films_tfidf'), width)
+        films_tfidf = sparse.vstack((old_films_tfidf, new_films_tfidf), format = 'csr')
+
+        #New books compete with the stored best books of old films.
+        scores, book_ids, columns = parallel.top_k_arrays(new_books_tfidf, old_films_tfidf,
+                                                          old_films, k, chunk_size,
+                                                          executor,
+                                                          stored_top_k(store, criterion,
+                                                                       old_films, k),
+                                                          old_books)
+        #New films are compared with all books.
+        if new_films:
+            new_scores, new_book_ids, new_columns = parallel.top_k_arrays(books_tfidf,
+                                                                          new_films_tfidf,
+                                                                          new_films, k,
+                                                                          chunk_size,
+                                                                          executor)
+            new_scores, new_book_ids = _pad(new_scores, new_book_ids, k)
+            scores = np.hstack((scores, new_scores))
+            book_ids = np.hstack((book_ids, new_book_ids))
+            columns = columns + new_columns
+
+    book_titles = pd.Series(np.concatenate((arrays['books'],
+                                            books['title_pure'].to_numpy(dtype = str))))
+    neighbours = computations.neighbours_frame(scores, book_ids, columns, book_titles)
+    updated_arrays = artifacts.neighbours_to_arrays(neighbours, all_films, criterion)
+    updated_arrays[criterion + '.vocabulary'] = np.array(list(vocabulary), dtype = str)
+    updated_arrays[criterion + '.idf'] = idf
+    updated_arrays[criterion + '.document_frequences'] = document_frequences
+    updated_matrices = {criterion + '.books_tfidf':books_tfidf,
+                        criterion + '.films_tfidf':films_tfidf,
+                        criterion + '.books_counts':books_counts,
+                        criterion + '.films_counts':films_counts}
+    return updated_arrays, updated_matrices, number_of_documents, rebuilt
+
+def add_to_catalogue(directory, books = None, films = None, threshold = DRIFT_THRESHOLD,
+                     chunk_size = None, executor = None):
+    '''
+    Adds new books and films (frames with title, authors, desc and genre
+columns) to a store and returns for every criterion whether it was
+rebuilt because of inverse document frequence drift. Books and films
+whose title is already in the store or earlier among the new ones, by
+titles.normalize, are skipped.
+    '''
+    store = artifacts.load_artifacts(directory)
+    if store['metadata'].get('legacy_scores'):
+        raise ValueError('Stores with legacy scores need a full preprocessing.')
+    columns = ['title', 'authors', 'desc', 'genre']
+    #Books and films already in the store or earlier in the new ones are skipped
+    #like the preprocessing does, by the keys of their titles.
+    empty = pd.DataFrame(columns = columns)
+    books = next(preprocessing.unique_titles([empty if books is None else books],
+                                             map(titles.normalize, store['arrays']['books'])))
+    films = next(preprocessing.unique_titles([empty if films is None else films],
+                                             map(titles.normalize, store['arrays']['films'])))
+    #New documents are cleaned with the stop words the store was built with.
+    stop_words = cleaning.store_stop_words(store)
+    books = prepare(books, stop_words)
+    films = prepare(films, stop_words)
+
+    arrays = {'books':np.concatenate((store['arrays']['books'],
+                                      books['title_pure'].to_numpy(dtype = str))),
+              'films':np.concatenate((store['arrays']['films'],
+                                      films['title_pure'].to_numpy(dtype = str)))}
+    index_arrays, matrices = titles.index_arrays(arrays['films'])
+    arrays.update(index_arrays)
+    documents = dict(store['metadata']['number_of_documents'])
+    rebuilt = {}
+    for criterion in store['metadata']['criteria']:
+        criterion_arrays, criterion_matrices, documents[criterion], rebuilt[criterion] = \
+                update_criterion(store, criterion, books, films, threshold,
+                                 chunk_size, executor)
+        arrays.update(criterion_arrays)
+        matrices.update(criterion_matrices)
+
+    artifacts.update_artifacts(directory, arrays, matrices,
+                               metadata = {'number_of_documents':documents})
+    return rebuilt
+
+def main():
+    '''
+    Adds books and films from csv files with title, authors, desc
+and genre columns to the artifacts store.
+    '''
+    parser = argparse.ArgumentParser(description = 'Add books and films to the store.')
+    parser.add_argument('--books', help = 'csv file with new books')
+    parser.add_argument('--films', help = 'csv file with new films')
+    parser.add_argument('--artifacts', default = artifacts.DIRECTORY)
+    parser.add_argument('--threshold', type = float, default = DRIFT_THRESHOLD,
+                        help = 'largest mean inverse document frequence drift without rebuild')
+    parser.add_argument('--workers', type = int, default = 1)
+    arguments = parser.parse_args()
+
+    books = pd.read_csv(arguments.books) if arguments.books else None
+    films = pd.read_csv(arguments.films) if arguments.films else None
+    with parallel.pool(arguments.workers) as executor:
+        rebuilt = add_to_catalogue(arguments.artifacts, books, films, arguments.threshold,
+                                   preprocessing.CHUNK_SIZE, executor)
+    for criterion, was_rebuilt in rebuilt.items():
+        print(f'{criterion}: {"rebuilt" if was_rebuilt else "updated"}')
+
+if __name__ == '__main__':
+    main()